@@ -8,6 +8,7 @@ from sqlalchemy import pool
 
 from alembic import context
 from app.models import Base
+from app.core.config import MIGRATION_LOCK_TIMEOUT_MS
 from asyncpg import Connection
 from sqlalchemy import pool
 from sqlalchemy.ext.asyncio import async_engine_from_config
@@ -50,7 +51,13 @@ def run_migrations_offline():
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    # One transaction per migration, so a migration can commit its DDL before
+    # building indexes or backfilling outside a transaction (app/utils/migrations.py)
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        transaction_per_migration=True,
+    )
 
     with context.begin_transaction():
         context.run_migrations()
@@ -67,6 +74,14 @@ async def run_migrations_online():
         configuration,
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
+        # DDL waiting for a lock blocks every query queued behind it: give up
+        # quickly instead. No statement_timeout, index builds take long.
+        connect_args={
+            "server_settings": {
+                "lock_timeout": str(MIGRATION_LOCK_TIMEOUT_MS),
+                "statement_timeout": "0",
+            }
+        },
     )
 
     async with connectable.connect() as connection:
@@ -0,0 +1,27 @@
+"""Add users.token_version
+
+Revision ID: 1a5c886e3d59
+Revises: 37fb4c64dede
+Create Date: 2024-03-25 11:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1a5c886e3d59'
+down_revision: Union[str, None] = '37fb4c64dede'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Constant default: no table rewrite on Postgres 11+
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,45 @@
+"""Add change_seq to blogs and posts for GET /api/sync
+
+Revision ID: 363c669acd19
+Revises: 696aa7d666db
+Create Date: 2024-04-29 09:30:00.000000
+
+change_seq is the id of the transaction that last wrote the row through the
+models (pg_current_xact_id, Postgres 13+). Existing rows get 0, a catalog
+only change; new rows get the writing transaction from the column default,
+updates from the models' onupdate. Indexed per owner for the sync queries.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.migrations import create_index_concurrently, drop_index_concurrently, with_lock_retry
+
+
+# revision identifiers, used by Alembic.
+revision: str = '363c669acd19'
+down_revision: Union[str, None] = '696aa7d666db'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHANGE_SEQ = "CAST(CAST(pg_current_xact_id() AS text) AS bigint)"
+
+
+def upgrade() -> None:
+    for table in ('blogs', 'posts'):
+        with_lock_retry(lambda: op.add_column(
+            table, sa.Column('change_seq', sa.BigInteger(), server_default='0', nullable=False)
+        ))
+        # Only rows inserted from now on, no rewrite
+        with_lock_retry(lambda: op.alter_column(table, 'change_seq', server_default=sa.text(CHANGE_SEQ)))
+    create_index_concurrently('ix_blogs_created_by_change_seq', 'blogs', ['created_by', 'change_seq', 'id'])
+    create_index_concurrently('ix_posts_blog_id_change_seq', 'posts', ['blog_id', 'change_seq', 'id'])
+
+
+def downgrade() -> None:
+    # DROP INDEX CONCURRENTLY does not take partitioned indexes
+    with_lock_retry(lambda: op.drop_index('ix_posts_blog_id_change_seq', table_name='posts'))
+    drop_index_concurrently('ix_blogs_created_by_change_seq')
+    for table in ('posts', 'blogs'):
+        with_lock_retry(lambda: op.drop_column(table, 'change_seq'))
@@ -0,0 +1,91 @@
+"""Partition posts by hash of blog_id
+
+Revision ID: 37fb4c64dede
+Revises: 39e0481cca6b
+Create Date: 2024-03-18 14:40:00.000000
+
+Every post query but the lookups by id filters on blog_id, so they read one
+of POSTS_PARTITIONS partitions; lookups by id probe that fixed number. With
+blog_id in the partition key, ix_posts_blog_id_title_live stays unique.
+
+OFFLINE ONLY: the copy of every post runs in the migration transaction,
+which holds an ACCESS EXCLUSIVE lock on posts until it commits. Stop the
+app before upgrading or downgrading across this revision.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '37fb4c64dede'
+down_revision: Union[str, None] = '39e0481cca6b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+POSTS_PARTITIONS = 16
+COLUMNS = "id, title, body, blog_id, created_at, is_deleted, deleted_at"
+
+
+def _create_indexes() -> None:
+    op.create_index(
+        'ix_posts_blog_id_title_live', 'posts', ['blog_id', 'title'],
+        unique=True,
+        postgresql_where=sa.text('is_deleted IS false'),
+    )
+    op.create_index(
+        'ix_posts_deleted_at', 'posts', ['deleted_at'],
+        unique=False,
+        postgresql_where=sa.text('is_deleted IS true'),
+    )
+
+
+def _rename_old(name: str) -> None:
+    op.execute(f"ALTER TABLE posts RENAME TO {name}")
+    op.execute(f"ALTER INDEX posts_pkey RENAME TO {name}_pkey")
+    op.execute(f"ALTER INDEX ix_posts_blog_id_title_live RENAME TO ix_{name}_blog_id_title_live")
+    op.execute(f"ALTER INDEX ix_posts_deleted_at RENAME TO ix_{name}_deleted_at")
+
+
+def _posts_columns() -> list:
+    return [
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('body', sa.String(), nullable=False),
+        sa.Column('blog_id', sa.UUID(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('is_deleted', sa.Boolean(), nullable=True),
+        sa.Column('deleted_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['blog_id'], ['blogs.id'], ),
+    ]
+
+
+def upgrade() -> None:
+    _rename_old('posts_unpartitioned')
+    op.create_table('posts',
+    *_posts_columns(),
+    sa.PrimaryKeyConstraint('id', 'blog_id'),
+    postgresql_partition_by='HASH (blog_id)',
+    )
+    for remainder in range(POSTS_PARTITIONS):
+        op.execute(
+            f"CREATE TABLE posts_h{remainder:02d} PARTITION OF posts "
+            f"FOR VALUES WITH (MODULUS {POSTS_PARTITIONS}, REMAINDER {remainder})"
+        )
+
+    op.execute(f"INSERT INTO posts ({COLUMNS}) SELECT {COLUMNS} FROM posts_unpartitioned")
+    _create_indexes()
+    op.drop_table('posts_unpartitioned')
+
+
+def downgrade() -> None:
+    _rename_old('posts_partitioned')
+    op.create_table('posts',
+    *_posts_columns(),
+    sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute(f"INSERT INTO posts ({COLUMNS}) SELECT {COLUMNS} FROM posts_partitioned")
+    _create_indexes()
+    # Drops its partitions
+    op.drop_table('posts_partitioned')
@@ -0,0 +1,64 @@
+"""Add deleted_at and archive tables for soft-deleted blogs and posts
+
+Revision ID: 39e0481cca6b
+Revises: 7d4a478e8c6d
+Create Date: 2024-03-11 10:15:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '39e0481cca6b'
+down_revision: Union[str, None] = '7d4a478e8c6d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for table in ('blogs', 'posts'):
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        # Rows deleted before this migration start aging from now
+        op.execute(f"UPDATE {table} SET deleted_at = now() WHERE is_deleted IS true")
+        op.create_index(
+            f'ix_{table}_deleted_at', table, ['deleted_at'],
+            unique=False,
+            postgresql_where=sa.text('is_deleted IS true'),
+        )
+
+    op.create_table('blogs_archive',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('created_by', sa.UUID(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('is_deleted', sa.Boolean(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_blogs_archive_created_by'), 'blogs_archive', ['created_by'], unique=False)
+    op.create_table('posts_archive',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('body', sa.String(), nullable=False),
+    sa.Column('blog_id', sa.UUID(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('is_deleted', sa.Boolean(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_posts_archive_blog_id'), 'posts_archive', ['blog_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_posts_archive_blog_id'), table_name='posts_archive')
+    op.drop_table('posts_archive')
+    op.drop_index(op.f('ix_blogs_archive_created_by'), table_name='blogs_archive')
+    op.drop_table('blogs_archive')
+    for table in ('posts', 'blogs'):
+        op.drop_index(f'ix_{table}_deleted_at', table_name=table)
+        op.drop_column(table, 'deleted_at')
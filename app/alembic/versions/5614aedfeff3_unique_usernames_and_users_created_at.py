@@ -0,0 +1,38 @@
+"""Unique usernames, index users.created_at
+
+Revision ID: 5614aedfeff3
+Revises: 39cf13d2be87
+Create Date: 2024-04-15 14:40:00.000000
+
+register may skip its lookups when the username/email filters rule a name
+out, so uniqueness of usernames is enforced by the index (emails already
+were). Fails if the table already has duplicate usernames. created_at is
+indexed for the filters' incremental refresh.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.migrations import create_index_concurrently, drop_index_concurrently, with_lock_retry
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5614aedfeff3'
+down_revision: Union[str, None] = '39cf13d2be87'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    create_index_concurrently('ix_users_username_unique', 'users', ['username'], unique=True)
+    drop_index_concurrently('ix_users_username')
+    with_lock_retry(lambda: op.execute("ALTER INDEX ix_users_username_unique RENAME TO ix_users_username"))
+    create_index_concurrently('ix_users_created_at', 'users', ['created_at'])
+
+
+def downgrade() -> None:
+    drop_index_concurrently('ix_users_created_at')
+    create_index_concurrently('ix_users_username_plain', 'users', ['username'])
+    drop_index_concurrently('ix_users_username')
+    with_lock_retry(lambda: op.execute("ALTER INDEX ix_users_username_plain RENAME TO ix_users_username"))
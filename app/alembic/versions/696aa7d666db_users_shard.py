@@ -0,0 +1,33 @@
+"""Add users.shard
+
+Revision ID: 696aa7d666db
+Revises: 5614aedfeff3
+Create Date: 2024-04-22 10:15:00.000000
+
+Database holding the user's blogs and posts. Every existing user stays on
+the primary (shard 0). Run this on the primary and on every shard database.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.migrations import with_lock_retry
+
+
+# revision identifiers, used by Alembic.
+revision: str = '696aa7d666db'
+down_revision: Union[str, None] = '5614aedfeff3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant default is a catalog-only change, no table rewrite
+    with_lock_retry(lambda: op.add_column(
+        'users', sa.Column('shard', sa.SmallInteger(), server_default='0', nullable=False)
+    ))
+
+
+def downgrade() -> None:
+    with_lock_retry(lambda: op.drop_column('users', 'shard'))
@@ -0,0 +1,150 @@
+"""Trigger-maintained blog/post counters on users and blogs
+
+Revision ID: 6b070e7c5ef8
+Revises: 1a5c886e3d59
+Create Date: 2024-04-02 16:20:00.000000
+
+A post is counted while it is not deleted; a user's post_count sums the
+post_count of their blogs that are not deleted. Increments use GREATEST for
+last_post_at, decrements recompute it from the partial indexes.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6b070e7c5ef8'
+down_revision: Union[str, None] = '1a5c886e3d59'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+POSTS_COUNTERS = """
+CREATE FUNCTION posts_counters() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    old_live integer := 0;
+    new_live integer := 0;
+    target uuid;
+    owner uuid;
+    blog_live boolean;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_deleted IS false THEN old_live := 1; END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_deleted IS false THEN new_live := 1; END IF;
+    IF new_live = old_live THEN
+        RETURN NULL;
+    END IF;
+
+    IF new_live > old_live THEN
+        target := NEW.blog_id;
+        UPDATE blogs
+        SET post_count = post_count + 1,
+            last_post_at = GREATEST(last_post_at, NEW.created_at)
+        WHERE id = target
+        RETURNING created_by, is_deleted IS false INTO owner, blog_live;
+    ELSE
+        target := OLD.blog_id;
+        UPDATE blogs
+        SET post_count = post_count - 1,
+            last_post_at = (
+                SELECT max(created_at) FROM posts WHERE blog_id = target AND is_deleted IS false
+            )
+        WHERE id = target
+        RETURNING created_by, is_deleted IS false INTO owner, blog_live;
+    END IF;
+
+    IF blog_live THEN
+        UPDATE users
+        SET post_count = post_count + new_live - old_live,
+            last_post_at = (
+                SELECT max(last_post_at) FROM blogs WHERE created_by = owner AND is_deleted IS false
+            )
+        WHERE id = owner;
+    END IF;
+    RETURN NULL;
+END $$
+"""
+
+BLOGS_COUNTERS = """
+CREATE FUNCTION blogs_counters() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    old_live integer := 0;
+    new_live integer := 0;
+    owner uuid;
+    posts integer;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_deleted IS false THEN old_live := 1; END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_deleted IS false THEN new_live := 1; END IF;
+    IF new_live = old_live THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        owner := OLD.created_by;
+        posts := OLD.post_count;
+    ELSE
+        owner := NEW.created_by;
+        posts := NEW.post_count;
+    END IF;
+
+    UPDATE users
+    SET blog_count = blog_count + new_live - old_live,
+        post_count = post_count + (new_live - old_live) * posts,
+        last_post_at = (
+            SELECT max(last_post_at) FROM blogs WHERE created_by = owner AND is_deleted IS false
+        )
+    WHERE id = owner;
+    RETURN NULL;
+END $$
+"""
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('blog_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('post_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('last_post_at', sa.DateTime(), nullable=True))
+    op.add_column('blogs', sa.Column('post_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('blogs', sa.Column('last_post_at', sa.DateTime(), nullable=True))
+
+    op.execute("""
+        UPDATE blogs b SET post_count = s.post_count, last_post_at = s.last_post_at
+        FROM (
+            SELECT blog_id, count(*) AS post_count, max(created_at) AS last_post_at
+            FROM posts WHERE is_deleted IS false GROUP BY blog_id
+        ) s
+        WHERE b.id = s.blog_id
+    """)
+    op.execute("""
+        UPDATE users u
+        SET blog_count = s.blog_count, post_count = s.post_count, last_post_at = s.last_post_at
+        FROM (
+            SELECT created_by, count(*) AS blog_count, sum(post_count) AS post_count,
+                   max(last_post_at) AS last_post_at
+            FROM blogs WHERE is_deleted IS false GROUP BY created_by
+        ) s
+        WHERE u.id = s.created_by
+    """)
+
+    op.execute(POSTS_COUNTERS)
+    op.execute(BLOGS_COUNTERS)
+    op.execute("""
+        CREATE TRIGGER posts_counters AFTER INSERT OR DELETE OR UPDATE OF is_deleted ON posts
+        FOR EACH ROW EXECUTE FUNCTION posts_counters()
+    """)
+    op.execute("""
+        CREATE TRIGGER blogs_counters AFTER INSERT OR DELETE OR UPDATE OF is_deleted ON blogs
+        FOR EACH ROW EXECUTE FUNCTION blogs_counters()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER blogs_counters ON blogs")
+    op.execute("DROP TRIGGER posts_counters ON posts")
+    op.execute("DROP FUNCTION blogs_counters()")
+    op.execute("DROP FUNCTION posts_counters()")
+    op.drop_column('blogs', 'last_post_at')
+    op.drop_column('blogs', 'post_count')
+    op.drop_column('users', 'last_post_at')
+    op.drop_column('users', 'post_count')
+    op.drop_column('users', 'blog_count')
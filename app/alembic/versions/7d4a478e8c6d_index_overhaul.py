@@ -0,0 +1,53 @@
+"""Index overhaul: partial indexes for live rows, drop redundant PK indexes
+
+Revision ID: 7d4a478e8c6d
+Revises: dd78288c7c6b
+Create Date: 2024-03-04 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d4a478e8c6d'
+down_revision: Union[str, None] = 'dd78288c7c6b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Primary keys are already backed by their *_pkey index
+    op.drop_index('ix_blacklisttokens_id', table_name='blacklisttokens')
+    op.drop_index('ix_users_id', table_name='users')
+    op.drop_index('ix_blogs_id', table_name='blogs')
+    op.drop_index('ix_posts_id', table_name='posts')
+
+    # Blog.find_all_by_username / find_all_by_email / check_availability
+    op.create_index(
+        'ix_blogs_created_by_title_live', 'blogs', ['created_by', 'title'],
+        unique=False,
+        postgresql_where=sa.text('is_deleted IS false'),
+    )
+
+    # Post titles are unique per blog among live posts instead of globally.
+    # Post.find_all_by_username / check_availability / find_all_titles_by_blog
+    op.drop_index('ix_posts_title', table_name='posts')
+    op.create_index(
+        'ix_posts_blog_id_title_live', 'posts', ['blog_id', 'title'],
+        unique=True,
+        postgresql_where=sa.text('is_deleted IS false'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_posts_blog_id_title_live', table_name='posts')
+    op.create_index('ix_posts_title', 'posts', ['title'], unique=True)
+    op.drop_index('ix_blogs_created_by_title_live', table_name='blogs')
+
+    op.create_index('ix_posts_id', 'posts', ['id'], unique=False)
+    op.create_index('ix_blogs_id', 'blogs', ['id'], unique=False)
+    op.create_index('ix_users_id', 'users', ['id'], unique=False)
+    op.create_index('ix_blacklisttokens_id', 'blacklisttokens', ['id'], unique=False)
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.core.config import (
+    BLOOM_ERROR_RATE,
+    BLOOM_MIN_CAPACITY,
+    BLOOM_REFRESH_SECONDS,
+    BLOOM_REBUILD_SECONDS,
+)
+from app.core.database import sessionmanager
+
+logger = logging.getLogger(__name__)
+
+# Users committed late with an earlier created_at (their transaction's start
+# time) are still picked up by the next refresh
+REFRESH_OVERLAP = timedelta(minutes=1)
+
+
+class BloomFilter:
+    """Set membership with no false negatives and about `error_rate` false positives up to `capacity` items"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        # Double hashing: k positions from two 64-bit hashes
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class Availability:
+    """
+    Per-worker Bloom filters of taken usernames and emails.
+
+    `maybe_taken_*` returning False means definitely not taken as of the last
+    refresh; True means the database has to be asked. Until the first build
+    has finished everything is "maybe taken". Users created by this worker
+    are added at once, users created elsewhere within BLOOM_REFRESH_SECONDS.
+    The database constraints on users stay the authority.
+    """
+
+    def __init__(self, error_rate: float = BLOOM_ERROR_RATE, min_capacity: int = BLOOM_MIN_CAPACITY):
+        self._error_rate = error_rate
+        self._min_capacity = min_capacity
+        self._usernames: BloomFilter | None = None
+        self._emails: BloomFilter | None = None
+        self._since: datetime | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self._usernames is not None
+
+    def maybe_taken_username(self, username: str) -> bool:
+        return self._usernames is None or username in self._usernames
+
+    def maybe_taken_email(self, email: str) -> bool:
+        return self._emails is None or email in self._emails
+
+    def add(self, username: str, email: str):
+        if self._usernames is not None:
+            self._usernames.add(username)
+            self._emails.add(email)
+
+    async def build(self):
+        """Build both filters from users, streaming the rows"""
+        started = time.perf_counter()
+        async with sessionmanager.session(statement_timeout_ms=0) as db:
+            count = (await db.execute(text("SELECT count(*) FROM users"))).scalar()
+            capacity = max(self._min_capacity, count * 2)
+            usernames = BloomFilter(capacity, self._error_rate)
+            emails = BloomFilter(capacity, self._error_rate)
+            # Refreshes continue from here, same clock as users.created_at
+            since = (await db.execute(text("SELECT localtimestamp"))).scalar()
+            result = await db.stream(
+                text("SELECT username, email FROM users"),
+                execution_options={"yield_per": 10000},
+            )
+            async for username, email in result:
+                usernames.add(username)
+                emails.add(email)
+        # Swapped in whole: lookups never see a half-built filter
+        self._usernames, self._emails, self._since = usernames, emails, since
+        logger.info(
+            "Built username/email filters: %s users, capacity %s, %.1fs",
+            usernames.count, capacity, time.perf_counter() - started,
+        )
+
+    async def refresh(self):
+        """Add the users created since the last build or refresh"""
+        if self._since is None:
+            await self.build()
+            return
+        async with sessionmanager.session() as db:
+            result = await db.execute(
+                text("SELECT username, email, created_at FROM users WHERE created_at > :since"),
+                {"since": self._since - REFRESH_OVERLAP},
+            )
+            for username, email, created_at in result:
+                self.add(username, email)
+                self._since = max(self._since, created_at)
+
+    async def run(self):
+        """Build, then refresh every BLOOM_REFRESH_SECONDS until cancelled"""
+        built_at, delay = None, BLOOM_REFRESH_SECONDS
+        while True:
+            try:
+                outgrown = self._usernames is not None and self._usernames.count > self._usernames.capacity
+                if built_at is None or outgrown or time.monotonic() - built_at > BLOOM_REBUILD_SECONDS:
+                    await self.build()
+                    built_at = time.monotonic()
+                else:
+                    await self.refresh()
+                delay = BLOOM_REFRESH_SECONDS
+            except Exception as ex:
+                delay = min(delay * 2, 60)
+                logger.warning("Username/email filter update failed, retrying in %.1fs: %s", delay, ex)
+            await asyncio.sleep(delay)
+
+
+availability = Availability()
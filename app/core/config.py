@@ -11,6 +11,118 @@ ACCESS_TOKEN_EXPIRES_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES')
 REFRESH_TOKEN_EXPIRES_MINUTES = int(os.environ.get('REFRESH_TOKEN_EXPIRES_MINUTES'))
 DATABASE_URL = os.environ.get('DATABASE_URL')
 debug_logs = os.environ.get('debug_logs')
+WARMUP_CONNECTIONS = int(os.environ.get('WARMUP_CONNECTIONS', 5))
+
+# bcrypt cost. 0 calibrates it on the host: the highest cost, 12 or more,
+# whose hash takes at most PASSWORD_HASH_TARGET_MS. Pin it when several hosts
+# share the users table, or hosts end up hashing with different costs.
+PASSWORD_HASH_ROUNDS = int(os.environ.get('PASSWORD_HASH_ROUNDS', 0))
+PASSWORD_HASH_TARGET_MS = float(os.environ.get('PASSWORD_HASH_TARGET_MS', 250))
+
+# Bloom filters of taken usernames/emails (GET /api/auth/available, register).
+# New users are picked up every BLOOM_REFRESH_SECONDS, the filters are rebuilt
+# every BLOOM_REBUILD_SECONDS (and when they outgrow their capacity).
+BLOOM_ERROR_RATE = float(os.environ.get('BLOOM_ERROR_RATE', 0.01))
+BLOOM_MIN_CAPACITY = int(os.environ.get('BLOOM_MIN_CAPACITY', 100000))
+BLOOM_REFRESH_SECONDS = float(os.environ.get('BLOOM_REFRESH_SECONDS', 5))
+BLOOM_REBUILD_SECONDS = float(os.environ.get('BLOOM_REBUILD_SECONDS', 3600))
+
+# Archive job (python -m app.jobs.archive)
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 30))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+
+# Counter reconciliation job (python -m app.jobs.reconcile)
+RECONCILE_BATCH_SIZE = int(os.environ.get('RECONCILE_BATCH_SIZE', 500))
+
+# Alembic migrations: how long DDL may wait for a lock before giving up
+# (and being retried by app.utils.migrations.with_lock_retry), and the
+# default batch size/pause of batched backfills
+MIGRATION_LOCK_TIMEOUT_MS = int(os.environ.get('MIGRATION_LOCK_TIMEOUT_MS', 2000))
+MIGRATION_LOCK_RETRIES = int(os.environ.get('MIGRATION_LOCK_RETRIES', 10))
+MIGRATION_BACKFILL_BATCH_SIZE = int(os.environ.get('MIGRATION_BACKFILL_BATCH_SIZE', 1000))
+MIGRATION_BACKFILL_PAUSE_SECONDS = float(os.environ.get('MIGRATION_BACKFILL_PAUSE_SECONDS', 0.1))
+
+# Offline bulk loader (python -m app.jobs.bulkload)
+BULKLOAD_CHUNK_SIZE = int(os.environ.get('BULKLOAD_CHUNK_SIZE', 10000))
+
+# Characters of body returned as the excerpt by post list endpoints
+POST_EXCERPT_LENGTH = int(os.environ.get('POST_EXCERPT_LENGTH', 200))
+
+# Server-Sent Events post feed
+FEED_QUEUE_SIZE = int(os.environ.get('FEED_QUEUE_SIZE', 100))
+FEED_PING_SECONDS = int(os.environ.get('FEED_PING_SECONDS', 15))
+
+# Idempotency-Key support on create endpoints (sweeper: python -m app.jobs.idempotency)
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', 24))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 10000))
+IDEMPOTENCY_SWEEP_BATCH_SIZE = int(os.environ.get('IDEMPOTENCY_SWEEP_BATCH_SIZE', 1000))
+
+# GET /api/sync: changes per stream (blogs, posts) and page at most
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', 500))
+
+# Logout blacklist inserts are group-committed: each batch collects for up
+# to BLACKLIST_BATCH_WINDOW_MS, or until BLACKLIST_BATCH_MAX_SIZE tokens
+BLACKLIST_BATCH_WINDOW_MS = float(os.environ.get('BLACKLIST_BATCH_WINDOW_MS', 5))
+BLACKLIST_BATCH_MAX_SIZE = int(os.environ.get('BLACKLIST_BATCH_MAX_SIZE', 500))
+
+# Host-wide cache of user rows and token revocations, shared by all workers
+# through files in SHARED_CACHE_DIR (default /dev/shm). Each cache takes
+# SHARED_CACHE_SLOTS * SHARED_CACHE_SLOT_BYTES. User writes are published
+# to other hosts with NOTIFY and only revocations are cached, so neither
+# waits for SHARED_CACHE_TTL_SECONDS, a backstop on user rows.
+SHARED_CACHE_DIR = os.environ.get('SHARED_CACHE_DIR', '')
+SHARED_CACHE_SLOTS = int(os.environ.get('SHARED_CACHE_SLOTS', 16384))
+SHARED_CACHE_SLOT_BYTES = int(os.environ.get('SHARED_CACHE_SLOT_BYTES', 640))
+SHARED_CACHE_TTL_SECONDS = float(os.environ.get('SHARED_CACHE_TTL_SECONDS', 5))
+
+# Blog/post shards: extra databases besides DATABASE_URL (which is shard 0
+# and holds users and every other table). Comma separated, empty for none.
+SHARD_DATABASE_URLS = [url.strip() for url in os.environ.get('SHARD_DATABASE_URLS', '').split(',') if url.strip()]
+# How long app.jobs.reshard waits for requests already routed to the old
+# shard to finish before copying a user's data
+RESHARD_GRACE_SECONDS = float(os.environ.get('RESHARD_GRACE_SECONDS', 10))
+
+# Connection pool, per worker process. app/server.py sizes these from
+# DB_MAX_CONNECTIONS so that all workers together stay under the server limit.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 100))
+DB_RESERVED_CONNECTIONS = int(os.environ.get('DB_RESERVED_CONNECTIONS', 10))
+
+# Overload protection: seconds to wait for a pooled connection, default
+# per-statement budget, requests in flight per worker before shedding with 503
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 2))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 5000))
+# Per-route budgets instead (see db_budget): reads of a single blog/post/user,
+# and lists/exports of all of a user's rows
+DB_POINT_READ_TIMEOUT_MS = int(os.environ.get('DB_POINT_READ_TIMEOUT_MS', 1000))
+DB_LIST_TIMEOUT_MS = int(os.environ.get('DB_LIST_TIMEOUT_MS', 15000))
+MAX_IN_FLIGHT_REQUESTS = int(os.environ.get('MAX_IN_FLIGHT_REQUESTS', 200))
+RETRY_AFTER_SECONDS = int(os.environ.get('RETRY_AFTER_SECONDS', 1))
+
+# Slow statements (over SLOW_QUERY_MS) are logged and kept per worker, the
+# last SLOW_QUERY_LOG_SIZE of them (GET /api/admin/slow-queries). With
+# SLOW_QUERY_EXPLAIN=1 their plan is fetched, at most once per statement per
+# SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS.
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', 200))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '1') == '1'
+SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS = float(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS', 300))
+
+# Response compression: bodies under COMPRESSION_MIN_SIZE bytes go out as is.
+# Levels are capped in app/core/compression.py to keep CPU per request low.
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 5))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+COMPRESSION_ZSTD_LEVEL = int(os.environ.get('COMPRESSION_ZSTD_LEVEL', 3))
+
+# Production server (python -m app.server)
+HOST = os.environ.get('HOST', '0.0.0.0')
+PORT = int(os.environ.get('PORT', 8000))
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+KEEP_ALIVE_SECONDS = int(os.environ.get('KEEP_ALIVE_SECONDS', 5))
+BACKLOG = int(os.environ.get('BACKLOG', 2048))
+GRACEFUL_SHUTDOWN_SECONDS = int(os.environ.get('GRACEFUL_SHUTDOWN_SECONDS', 30))
 
 class Settings(BaseSettings):
     database_url: str
@@ -1,31 +1,152 @@
+import asyncio
 import contextlib
-from typing import Any, AsyncIterator, Annotated
+import functools
+import uuid
+from typing import Any, AsyncIterator, Annotated, Awaitable, Callable
 
-from app.core.config import settings
+from app.core.config import (
+    settings,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_TIMEOUT_MS,
+    SHARD_DATABASE_URLS,
+    RETRY_AFTER_SECONDS,
+)
+from app.core.exceptions import ServiceUnavailableException
+from app.core.slowquery import slow_queries, current_route
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import (
     AsyncConnection,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
-from sqlalchemy.orm import declarative_base
-from fastapi import Depends
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import Mapper, ORMExecuteState, declarative_base
+from fastapi import Depends, Request
+from fastapi.dependencies.models import Dependant
+from fastapi.routing import APIRoute
 
 Base = declarative_base()
 
+# Tables whose rows live on the shard of the user owning them. Everything
+# else, users included, lives on the primary database, which is also shard 0.
+SHARDED_TABLES = frozenset({"blogs", "posts", "blogs_archive", "posts_archive"})
+PRIMARY_SHARD = 0
+# users.shard while app.jobs.reshard moves the user's blogs and posts
+MOVING = -1
+
+
+def is_sharded(mapper: Mapper | None) -> bool:
+    return mapper is not None and mapper.local_table.name in SHARDED_TABLES
+
+
+class RoutedSession(ShardedSession):
+    """
+    Session over the primary and the shard databases.
+
+    Unsharded tables always go to the primary. Sharded tables go to the shard
+    in info["shard"], set by route_to_shard once the user is known; without
+    it reads fan out to every shard and writes are refused. Statements
+    without an entity (text()) go to the routed shard, else the primary.
+    bind_arguments={"shard_id": n} overrides all of this, and the "shards"
+    execution option ("all" or "others") widens a read of a routed session.
+    """
+
+    def __init__(self, shards: dict[int, Any], **kwargs):
+        super().__init__(
+            shard_chooser=self._choose_shard,
+            identity_chooser=self._identity_shards,
+            execute_chooser=self._execute_shards,
+            shards=shards,
+            **kwargs,
+        )
+        self.shard_ids = list(shards)
+
+    def _candidate_shards(self, mapper: Mapper | None, scope: str | None = None) -> list[int]:
+        if not is_sharded(mapper):
+            return [PRIMARY_SHARD]
+        routed = self.info.get("shard")
+        if routed is None or scope == "all":
+            return self.shard_ids
+        if scope == "others":
+            return [shard for shard in self.shard_ids if shard != routed]
+        return [routed]
+
+    def _choose_shard(self, mapper: Mapper, instance: Any, clause=None, **kw) -> int:
+        shards = self._candidate_shards(mapper)
+        if len(shards) > 1:
+            raise RuntimeError(f"Writing {mapper.local_table.name} needs a session routed to a shard")
+        return shards[0]
+
+    def _identity_shards(self, mapper: Mapper, primary_key, **kw) -> list[int]:
+        shards = self._candidate_shards(mapper)
+        return shards + [shard for shard in self._candidate_shards(mapper, "all") if shard not in shards]
+
+    def _execute_shards(self, orm_context: ORMExecuteState) -> list[int]:
+        shards = self._candidate_shards(orm_context.bind_mapper, orm_context.execution_options.get("shards"))
+        if not orm_context.is_select and len(shards) > 1:
+            raise RuntimeError("Writes to sharded tables need a session routed to a shard")
+        return shards
+
+    def get_bind(self, mapper=None, *, shard_id=None, instance=None, clause=None, **kw):
+        if shard_id is None and mapper is None and instance is None:
+            shard_id = self.info.get("shard", PRIMARY_SHARD)
+        return super().get_bind(mapper, shard_id=shard_id, instance=instance, clause=clause, **kw)
+
+
 class DatabaseSessionManager:
-    def __init__(self, host: str, engine_kwargs: dict[str, Any] = {}):
+    def __init__(self, host: str, engine_kwargs: dict[str, Any] = {}, shard_hosts: list[str] = []):
         self._engine = create_async_engine(host, **engine_kwargs)
-        self._sessionmaker = async_sessionmaker(autocommit=False, bind=self._engine)
+        self._shard_engines = {PRIMARY_SHARD: self._engine}
+        for shard, shard_host in enumerate(shard_hosts, start=1):
+            self._shard_engines[shard] = create_async_engine(shard_host, **engine_kwargs)
+        for shard, engine in self._shard_engines.items():
+            slow_queries.install(engine, shard)
+        self._sessionmaker = async_sessionmaker(
+            autocommit=False,
+            sync_session_class=RoutedSession,
+            shards={shard: engine.sync_engine for shard, engine in self._shard_engines.items()},
+        )
+
+    @property
+    def shard_ids(self) -> list[int]:
+        return list(self._shard_engines)
+
+    def shard_for_new_user(self, user_id: uuid.UUID) -> int:
+        return user_id.int % len(self._shard_engines)
 
     async def close(self):
         if self._engine is None:
             raise Exception("DatabaseSessionManager is not initialized")
-        await self._engine.dispose()
+        for engine in self._shard_engines.values():
+            await engine.dispose()
 
         self._engine = None
+        self._shard_engines = {}
         self._sessionmaker = None
 
+    async def warm_pool(self, connections: int):
+        """Open `connections` pooled connections at once and return them to the pool"""
+        if self._engine is None:
+            raise Exception("DatabaseSessionManager is not initialized")
+
+        results = await asyncio.gather(
+            *(self._engine.connect() for _ in range(connections)), return_exceptions=True
+        )
+        opened = [result for result in results if not isinstance(result, BaseException)]
+        try:
+            # One connect failed: give back the ones that opened before raising
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            for connection in opened:
+                await connection.execute(text("SELECT 1"))
+        finally:
+            for connection in opened:
+                await connection.close()
+
     @contextlib.asynccontextmanager
     async def connect(self) -> AsyncIterator[AsyncConnection]:
         if self._engine is None:
@@ -39,11 +160,25 @@ class DatabaseSessionManager:
                 raise
 
     @contextlib.asynccontextmanager
-    async def session(self) -> AsyncIterator[AsyncSession]:
+    async def session(
+        self, statement_timeout_ms: int | None = None, shard: int | None = None
+    ) -> AsyncIterator[AsyncSession]:
+        """
+        statement_timeout_ms overrides the connection default for every
+        transaction of this session (kept in info["statement_timeout_ms"]);
+        0 disables the timeout. `shard` routes the session like route_to_shard.
+        """
         if self._sessionmaker is None:
             raise Exception("DatabaseSessionManager is not initialized")
 
         session = self._sessionmaker()
+        if shard is not None:
+            session.info["shard"] = shard
+        if statement_timeout_ms is not None:
+            session.info["statement_timeout_ms"] = statement_timeout_ms
+            @event.listens_for(session.sync_session, "after_begin")
+            def set_statement_timeout(sync_session, transaction, connection):
+                connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(statement_timeout_ms)}")
         try:
             yield session
         except Exception:
@@ -53,14 +188,122 @@ class DatabaseSessionManager:
             await session.close()
 
 
-sessionmanager = DatabaseSessionManager(settings.database_url, {"echo": settings.echo_sql})
+    async def fan_out(
+        self, query: Callable[[AsyncSession], Awaitable[Any]], statement_timeout_ms: int | None = None
+    ) -> dict[int, Any]:
+        """Run query(db) on every shard at once, each in its own routed session; results by shard"""
+        async def run(shard: int):
+            async with self.session(statement_timeout_ms=statement_timeout_ms, shard=shard) as db:
+                return await query(db)
+
+        results = await asyncio.gather(*(run(shard) for shard in self.shard_ids))
+        return dict(zip(self.shard_ids, results))
 
 
-async def get_db_session():
-    async with sessionmanager.session() as session:
+def route_to_shard(db: AsyncSession, shard: int):
+    """Send this session's blog and post statements to `shard`"""
+    if shard == MOVING:
+        raise ServiceUnavailableException(
+            detail="Account data is being moved, try again shortly", retry_after=RETRY_AFTER_SECONDS
+        )
+    db.info["shard"] = shard
+
+
+def can_fan_out(db: AsyncSession, mapper: Mapper) -> bool:
+    """Whether rows of `mapper` missed on the routed shard could be on another one"""
+    return is_sharded(mapper) and db.info.get("shard") is not None and len(db.sync_session.shard_ids) > 1
+
+
+async def find_first(db: AsyncSession, query):
+    """First entity of an ORM query on the routed shard, else on the other shards"""
+    found = (await db.execute(query)).scalars().first()
+    if found is None and can_fan_out(db, query.column_descriptions[0]["entity"].__mapper__):
+        found = (await db.execute(query.execution_options(shards="others"))).scalars().first()
+    return found
+
+
+sessionmanager = DatabaseSessionManager(
+    settings.database_url,
+    {
+        "echo": settings.echo_sql,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        # Fail fast when the pool is exhausted, the app answers 503 + Retry-After
+        "pool_timeout": DB_POOL_TIMEOUT,
+        # Default budget for every connection, no extra round trip per request
+        "connect_args": {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}},
+    },
+    shard_hosts=SHARD_DATABASE_URLS,
+)
+
+
+def db_budget(statement_timeout_ms: int) -> Callable:
+    """Give an endpoint its own statement_timeout instead of DB_STATEMENT_TIMEOUT_MS"""
+    def mark(endpoint: Callable) -> Callable:
+        endpoint.statement_timeout_ms = statement_timeout_ms
+        return endpoint
+    return mark
+
+
+async def get_db_session(request: Request):
+    endpoint = request.scope.get("endpoint")
+    statement_timeout_ms = getattr(endpoint, "statement_timeout_ms", None)
+    route = request.scope.get("route")
+    current_route.set(f"{request.method} {route.path if route else request.url.path}")
+    async with sessionmanager.session(statement_timeout_ms=statement_timeout_ms) as session:
         yield session
 
 
 
 DBSessionDep = Annotated[AsyncSession, Depends(get_db_session)]
 
+
+def no_db(endpoint: Callable) -> Callable:
+    """Mark an endpoint that never needs a database connection"""
+    endpoint.no_db = True
+    return endpoint
+
+
+def _uses_db_session(dependant: Dependant) -> bool:
+    return any(
+        dependency.call is get_db_session or _uses_db_session(dependency)
+        for dependency in dependant.dependencies
+    )
+
+
+def _release_sessions(endpoint: Callable) -> Callable:
+    @functools.wraps(endpoint)
+    async def unit_of_work(*args, **kwargs):
+        sessions = [value for value in kwargs.values() if isinstance(value, AsyncSession)]
+        try:
+            result = await endpoint(*args, **kwargs)
+            for session in sessions:
+                if session.new or session.dirty or session.deleted:
+                    await session.commit()
+            return result
+        finally:
+            # Rolls back whatever is still open and returns the connection to the
+            # pool. Loaded attributes stay readable for serialization.
+            for session in sessions:
+                await session.close()
+
+    unit_of_work.releases_sessions = True
+    return unit_of_work
+
+
+class UnitOfWorkRoute(APIRoute):
+    """
+    Returns the request's pooled connection as soon as the endpoint returns,
+    instead of when the get_db_session dependency is torn down after the
+    response has been serialized and sent.
+    Endpoints marked with @no_db are checked not to depend on a session.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        # include_router re-creates routes from already wrapped endpoints
+        wrap = not getattr(endpoint, "no_db", False) and not getattr(endpoint, "releases_sessions", False)
+        if wrap and asyncio.iscoroutinefunction(endpoint):
+            endpoint = _release_sessions(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+        if getattr(endpoint, "no_db", False) and _uses_db_session(self.dependant):
+            raise RuntimeError(f"{path} is marked @no_db but depends on a database session")
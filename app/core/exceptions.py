@@ -42,3 +42,36 @@ class ForbiddenException(HTTPException):
             status_code=status.HTTP_403_FORBIDDEN,
             detail=detail if detail else "Forbidden",
         )
+
+
+class ServiceUnavailableException(HTTPException):
+    def __init__(self, detail: Any = None, retry_after: int | None = None) -> None:
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail if detail else "Service unavailable",
+            headers={"Retry-After": str(retry_after)} if retry_after is not None else None,
+        )
+
+
+class ConflictException(HTTPException):
+    def __init__(self, detail: Any = None) -> None:
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=detail if detail else "Conflict",
+        )
+
+
+class UnprocessableEntityException(HTTPException):
+    def __init__(self, detail: Any = None) -> None:
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=detail if detail else "Unprocessable entity",
+        )
+
+
+class PreconditionRequiredException(HTTPException):
+    def __init__(self, detail: Any = None) -> None:
+        super().__init__(
+            status_code=status.HTTP_428_PRECONDITION_REQUIRED,
+            detail=detail if detail else "Precondition required",
+        )
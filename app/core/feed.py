@@ -0,0 +1,175 @@
+import asyncio
+import contextlib
+import json
+import logging
+from typing import AsyncIterator
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings, FEED_QUEUE_SIZE
+from app.core.database import PRIMARY_SHARD
+from app.core import sharedcache
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "new_post"
+# NOTIFY payloads are limited to 8000 bytes, and one that is too long fails
+# the transaction. A character takes at most 6 bytes once JSON-escaped (\u001f),
+# so this many of them leave room for the ids.
+TITLE_CHARS = 1000
+# Usernames of changed user rows, to drop them from every host's shared cache
+USERS_CHANNEL = "users_changed"
+
+
+async def notify_new_post(db: AsyncSession, post, created_by) -> None:
+    """
+    Queue a NOTIFY for a new post; Postgres delivers it when the transaction
+    commits. The title is cut to TITLE_CHARS characters, fetch the post for
+    the whole of it.
+    """
+    payload = {
+        "id": str(post.id), "blog_id": str(post.blog_id), "created_by": str(created_by),
+        "title": post.title[:TITLE_CHARS],
+    }
+    # Always on the primary, where every worker LISTENs, whichever shard holds the post
+    await db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": CHANNEL, "payload": json.dumps(payload, ensure_ascii=False)},
+        bind_arguments={"shard_id": PRIMARY_SHARD},
+    )
+
+
+async def notify_users_changed(db: AsyncSession, *usernames: str | None) -> None:
+    """
+    Queue a NOTIFY per username written in this transaction; every worker
+    drops them from its host's shared cache once it commits. A username too
+    long for a payload (8000 bytes) is sent empty, which drops every cached row.
+    """
+    for username in usernames:
+        if username is None:
+            continue
+        payload = username if len(username.encode()) < 8000 else ""
+        await db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": USERS_CHANNEL, "payload": payload},
+            bind_arguments={"shard_id": PRIMARY_SHARD},
+        )
+
+
+class PostFeed:
+    """
+    Fans out new-post notifications to in-process subscribers.
+
+    One LISTEN connection per worker, opened on the first subscription and
+    reopened if it drops. Every subscriber gets a bounded queue; a subscriber
+    that falls FEED_QUEUE_SIZE events behind is disconnected rather than
+    buffered without limit, and its client reconnects.
+
+    The same connection carries USERS_CHANNEL. After start() it is kept open
+    whether or not anyone subscribes, and the shared user cache is enabled
+    only while it is: it is cleared on every (re)connect, as notifications
+    sent while it was down are lost.
+    """
+
+    def __init__(self, dsn: str, queue_size: int = FEED_QUEUE_SIZE):
+        self._dsn = dsn
+        self._queue_size = queue_size
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._connection: asyncpg.Connection | None = None
+        self._lock = asyncio.Lock()
+        self._started = False
+        self._starting: asyncio.Task | None = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    async def _ensure_listening(self):
+        async with self._lock:
+            if self._connection is not None and not self._connection.is_closed():
+                return
+            self._connection = await asyncpg.connect(self._dsn)
+            self._connection.add_termination_listener(self._on_terminate)
+            await self._connection.add_listener(CHANNEL, self._on_notify)
+            await self._connection.add_listener(USERS_CHANNEL, self._on_users_changed)
+            # Rows cached before now may have missed their notification
+            sharedcache.users.clear()
+            sharedcache.users.enabled = True
+
+    def _on_terminate(self, connection):
+        logger.warning("Post feed LISTEN connection lost")
+        sharedcache.users.enabled = False
+        self._connection = None
+        if self._started or self._subscribers:
+            asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self, delay: float = 1.0):
+        while self._started or self._subscribers:
+            try:
+                await self._ensure_listening()
+                return
+            except (OSError, asyncpg.PostgresError) as ex:
+                logger.warning("Post feed reconnect failed, retrying in %.1fs: %s", delay, ex)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        event = json.loads(payload)
+        for key in (f"blog:{event['blog_id']}", f"author:{event['created_by']}"):
+            for queue in list(self._subscribers.get(key, ())):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # Slow consumer: drop its backlog and tell it to go away
+                    self._discard(key, queue)
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(None)
+
+    def _on_users_changed(self, connection, pid, channel, payload):
+        if payload:
+            sharedcache.users.invalidate(payload)
+        else:
+            sharedcache.users.clear()
+
+    def _discard(self, key: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(key)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[key]
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, key: str) -> AsyncIterator[asyncio.Queue]:
+        """Queue of events for `key` ("blog:<id>" or "author:<user id>"); None means disconnected"""
+        await self._ensure_listening()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._queue_size)
+        self._subscribers.setdefault(key, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            self._discard(key, queue)
+
+    def start(self):
+        """Listen from now until close(), connecting in the background"""
+        self._started = True
+        self._starting = asyncio.create_task(self._reconnect())
+
+    async def close(self):
+        self._started = False
+        if self._starting is not None:
+            self._starting.cancel()
+        sharedcache.users.enabled = False
+        self._subscribers.clear()
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+
+
+# asyncpg wants a plain postgresql:// DSN
+post_feed = PostFeed(
+    make_url(settings.database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+)
@@ -0,0 +1,77 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import BLACKLIST_BATCH_WINDOW_MS, BLACKLIST_BATCH_MAX_SIZE
+from app.core.database import sessionmanager
+from app.models.jwt import BlackListToken
+
+
+class GroupCommit:
+    """
+    Write-behind queue that commits many small inserts in one transaction.
+
+    submit() adds a row to the current batch and returns once the batch has
+    been committed, or raises if it failed: a caller only returns success for
+    a durable row. A batch is written `window_ms` after its first row, or as
+    soon as it holds `max_size` rows. Batches are written in their own
+    session, so callers should release their own connection before waiting.
+    """
+
+    def __init__(
+        self, write: Callable[[AsyncSession, list[Any]], Awaitable[None]], window_ms: float, max_size: int
+    ):
+        self._write = write
+        self._window = window_ms / 1000
+        self._max_size = max_size
+        self._rows: list[Any] = []
+        self._committed: asyncio.Future | None = None
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task] = set()
+        self.batches = 0
+        self.rows = 0
+
+    async def submit(self, row: Any):
+        loop = asyncio.get_running_loop()
+        if self._committed is None:
+            self._committed = loop.create_future()
+            self._timer = loop.call_later(self._window, self._flush)
+        committed = self._committed
+        self._rows.append(row)
+        if len(self._rows) >= self._max_size:
+            self._flush()
+        # shield: a caller going away does not take the row out of its batch
+        await asyncio.shield(committed)
+
+    def _flush(self):
+        if self._committed is None:
+            return
+        self._timer.cancel()
+        rows, committed = self._rows, self._committed
+        self._rows, self._committed, self._timer = [], None, None
+        task = asyncio.create_task(self._commit(rows, committed))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _commit(self, rows: list[Any], committed: asyncio.Future):
+        try:
+            async with sessionmanager.session() as db:
+                await self._write(db, rows)
+        except Exception as ex:
+            committed.set_exception(ex)
+            # Marked retrieved, the callers that are still waiting get it
+            committed.exception()
+        else:
+            self.batches += 1
+            self.rows += len(rows)
+            committed.set_result(None)
+
+    async def close(self):
+        """Write the pending batch now and wait for the batches being written"""
+        self._flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes)
+
+
+blacklist = GroupCommit(BlackListToken.create_many, BLACKLIST_BATCH_WINDOW_MS, BLACKLIST_BATCH_MAX_SIZE)
@@ -0,0 +1,149 @@
+import contextlib
+import hashlib
+import hmac
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, NamedTuple, TypeVar
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import IDEMPOTENCY_TTL_HOURS, IDEMPOTENCY_CACHE_SIZE, SECRET_KEY
+from app.core.database import sessionmanager
+from app.core.exceptions import ConflictException, UnprocessableEntityException
+from app.models.idempotency import IdempotencyKey
+
+T = TypeVar("T")
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status_code: int
+    body: Any
+    expires_at: datetime
+
+
+class ResponseCache:
+    """Per-worker LRU of completed responses in front of the idempotencykeys table"""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._entries: OrderedDict[tuple[str, str], StoredResponse] = OrderedDict()
+
+    def get(self, scope: str, key: str) -> StoredResponse | None:
+        entry = self._entries.get((scope, key))
+        if entry is None:
+            return None
+        if entry.expires_at < datetime.utcnow():
+            del self._entries[(scope, key)]
+            return None
+        self._entries.move_to_end((scope, key))
+        return entry
+
+    def put(self, scope: str, key: str, entry: StoredResponse):
+        self._entries[(scope, key)] = entry
+        self._entries.move_to_end((scope, key))
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+
+response_cache = ResponseCache(IDEMPOTENCY_CACHE_SIZE)
+
+
+class Idempotency:
+    def __init__(self) -> None:
+        # Set when the request is a retry: return it as is
+        self.replay: JSONResponse | None = None
+        self.result: tuple[int, Any] | None = None
+
+    def save(self, response: BaseModel, status_code: int = 200):
+        self.result = (status_code, jsonable_encoder(response))
+
+
+async def _on_own_session(db: AsyncSession, write: Callable[[AsyncSession], Awaitable[T]]) -> T:
+    """
+    Run write() on a session of its own: committing the request's session
+    would expire the objects the endpoint already loaded. The request's
+    connection is released first, so a request never holds two.
+    """
+    await db.close()
+    async with sessionmanager.session() as key_db:
+        return await write(key_db)
+
+
+def _replay(entry: StoredResponse, fingerprint: str) -> JSONResponse:
+    if entry.fingerprint != fingerprint:
+        raise UnprocessableEntityException(detail="Idempotency-Key was already used for a different request")
+    return JSONResponse(entry.body, status_code=entry.status_code, headers={"Idempotent-Replayed": "true"})
+
+
+@contextlib.asynccontextmanager
+async def idempotency(
+    db: AsyncSession, key: str | None, scope: str, payload: BaseModel
+) -> AsyncIterator[Idempotency]:
+    """
+    Run a create endpoint at most once per (scope, Idempotency-Key).
+
+    The first request claims the key, the endpoint calls save() with its
+    response and that response is stored for IDEMPOTENCY_TTL_HOURS. Retries
+    get `replay` without running the endpoint again. If the endpoint fails
+    the claim is released so a retry runs it again. Without a key this does
+    nothing.
+
+    The key is claimed and completed on separate sessions: `db` is never
+    committed here, its loaded objects stay readable. It is closed, so enter
+    this before the endpoint writes anything.
+    """
+    slot = Idempotency()
+    if key is None:
+        yield slot
+        return
+
+    # Keyed: payloads hold passwords (register), and a plain hash of one
+    # stored in idempotency_keys could be brute-forced offline
+    fingerprint = hmac.new(
+        SECRET_KEY.encode(), json.dumps(jsonable_encoder(payload), sort_keys=True).encode(), hashlib.sha256
+    ).hexdigest()
+
+    entry = response_cache.get(scope, key)
+    if entry is None:
+        now = datetime.utcnow()
+        existing = await _on_own_session(db, lambda key_db: IdempotencyKey.claim(
+            key_db, scope=scope, key=key, fingerprint=fingerprint,
+            now=now, expires_at=now + timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+        ))
+        if existing is not None:
+            if existing.status_code is None:
+                if existing.fingerprint != fingerprint:
+                    raise UnprocessableEntityException(
+                        detail="Idempotency-Key was already used for a different request"
+                    )
+                raise ConflictException(detail="A request with this Idempotency-Key is in progress")
+            entry = StoredResponse(existing.fingerprint, existing.status_code, existing.response, existing.expires_at)
+            response_cache.put(scope, key, entry)
+
+    if entry is not None:
+        slot.replay = _replay(entry, fingerprint)
+        yield slot
+        return
+
+    try:
+        yield slot
+    except Exception:
+        await _on_own_session(db, lambda key_db: IdempotencyKey.release(key_db, scope=scope, key=key))
+        raise
+
+    if slot.result is None:
+        await _on_own_session(db, lambda key_db: IdempotencyKey.release(key_db, scope=scope, key=key))
+        return
+    status_code, body = slot.result
+    await _on_own_session(db, lambda key_db: IdempotencyKey.complete(
+        key_db, scope=scope, key=key, status_code=status_code, response=body
+    ))
+    response_cache.put(
+        scope, key,
+        StoredResponse(fingerprint, status_code, body, datetime.utcnow() + timedelta(hours=IDEMPOTENCY_TTL_HOURS)),
+    )
@@ -10,6 +10,7 @@ from app.models.jwt import BlackListToken
 from app.schemas.jwt import JwtTokenSchema, TokenPair
 from app.schemas.mail import MailTaskSchema
 from app.core.exceptions import AuthFailedException
+from app.core.database import route_to_shard
 from app.core.config import (
     ACCESS_TOKEN_EXPIRES_MINUTES,
     SECRET_KEY,
@@ -25,6 +26,9 @@ SUB = "sub"
 EXP = "exp"
 IAT = "iat"
 JTI = "jti"
+VER = "ver"
+TYP = "typ"
+MAIL = "mail"
 
 
 def _create_access_token(payload: dict, minutes: int | None = None) -> JwtTokenSchema:
@@ -58,7 +62,12 @@ def _create_refresh_token(payload: dict) -> JwtTokenSchema:
 
 
 def create_token_pair(user: User) -> TokenPair:
-    payload = {SUB: str(user.username), JTI: str(uuid.uuid4()), IAT: datetime.utcnow()}
+    payload = {
+        SUB: str(user.username),
+        JTI: str(uuid.uuid4()),
+        IAT: datetime.utcnow(),
+        VER: user.token_version,
+    }
 
     return TokenPair(
         access=_create_access_token(payload={**payload}),
@@ -69,12 +78,23 @@ def create_token_pair(user: User) -> TokenPair:
 async def decode_access_token(token: str, db: AsyncSession):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        black_list_token = await BlackListToken.find_by_id(db=db, id=payload[JTI])
-        if black_list_token:
+        if await BlackListToken.is_revoked(db=db, id=payload[JTI], expire=datetime.utcfromtimestamp(payload[EXP])):
             raise JWTError("Token is blacklisted")
+        subject, user = payload.get(SUB), None
+        if subject is not None and payload.get(TYP) == MAIL:
+            user = await User.find_by_email(db=db, email=subject)
+        elif subject is not None:
+            user = await User.find_by_username(db=db, username=subject)
+        # Tokens issued before token versions existed carry no claim
+        if VER in payload and (user is None or user.token_version != payload[VER]):
+            raise JWTError("Token is revoked")
     except JWTError:
         raise AuthFailedException()
 
+    # The rest of the request reads and writes this user's blogs and posts
+    if user is not None:
+        route_to_shard(db, user.shard)
+
     return payload
 
 
@@ -90,7 +110,13 @@ def refresh_token_state(token: str):
 
 def mail_token(user: User):
     """Return 2 hour lifetime access_token"""
-    payload = {SUB: str(user.email), JTI: str(uuid.uuid4()), IAT: datetime.utcnow()}
+    payload = {
+        SUB: str(user.email),
+        JTI: str(uuid.uuid4()),
+        IAT: datetime.utcnow(),
+        VER: user.token_version,
+        TYP: MAIL,
+    }
     return _create_access_token(payload=payload, minutes=2 * 60).token
 
 
@@ -0,0 +1,111 @@
+import asyncio
+import uuid
+from typing import Any
+
+from sqlalchemy import UUID, any_, event, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute
+
+from app.core.database import can_fan_out
+
+
+class Loader:
+    """
+    Request-scoped batching and memoization of single-row lookups.
+
+    Lookups issued in the same event-loop tick are coalesced into one
+    `WHERE column = ANY(:keys)` query per column, and every result (including
+    "not found") is memoized for the rest of the session. The memo is dropped
+    on commit and rollback, when the session expires its instances.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self._db = db
+        # Keyed by (model, attribute name, value); attributes themselves overload ==
+        self._memo: dict[tuple[type, str, Any], asyncio.Future] = {}
+        self._pending: dict[tuple[type, str], list[Any]] = {}
+        self._dispatch_tasks: set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()
+        event.listen(db.sync_session, "after_commit", self._clear)
+        event.listen(db.sync_session, "after_soft_rollback", self._clear)
+
+    def _clear(self, *args):
+        self._memo = {key: future for key, future in self._memo.items() if not future.done()}
+
+    async def load(self, column: InstrumentedAttribute, key: Any):
+        if isinstance(column.type, UUID) and not isinstance(key, uuid.UUID):
+            try:
+                key = uuid.UUID(str(key))
+            except ValueError:
+                # Ids straight from a path: no row has one that does not parse
+                return None
+
+        model, name = column.class_, column.key
+        future = self._memo.get((model, name, key))
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._memo[(model, name, key)] = future
+            if not self._pending:
+                loop.call_soon(self._schedule)
+            self._pending.setdefault((model, name), []).append(key)
+        # shield: one cancelled caller must not cancel the lookup for the others
+        return await asyncio.shield(future)
+
+    def _schedule(self):
+        task = asyncio.create_task(self._dispatch())
+        self._dispatch_tasks.add(task)
+        task.add_done_callback(self._dispatch_tasks.discard)
+
+    async def _dispatch(self):
+        # One query at a time: an AsyncSession does not allow concurrent use
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            for (model, name), keys in pending.items():
+                await self._fetch(model, name, keys)
+
+    async def _fetch(self, model: type, name: str, keys: list[Any]):
+        column = getattr(model, name)
+        try:
+            query = select(model).where(column == any_(literal(keys, ARRAY(column.type))))
+            result = await self._db.execute(query)
+            found = {}
+            for obj in result.scalars():
+                found.setdefault(getattr(obj, name), obj)
+            # Other users' blogs and posts can live on other shards
+            missing = [key for key in keys if key not in found]
+            if missing and can_fan_out(self._db, model.__mapper__):
+                query = select(model).where(column == any_(literal(missing, ARRAY(column.type))))
+                result = await self._db.execute(query.execution_options(shards="others"))
+                for obj in result.scalars():
+                    found.setdefault(getattr(obj, name), obj)
+        except Exception as ex:
+            for key in keys:
+                # Not memoized, a later call retries
+                future = self._memo.pop((model, name, key), None)
+                if future is not None and not future.done():
+                    future.set_exception(ex)
+            return
+
+        for key in keys:
+            future = self._memo.get((model, name, key))
+            if future is not None and not future.done():
+                future.set_result(found.get(key))
+        # Later lookups of the same rows by primary key are free
+        for obj in found.values():
+            primed = self._memo.setdefault((model, "id", obj.id), asyncio.get_running_loop().create_future())
+            if not primed.done():
+                primed.set_result(obj)
+
+
+def get_loader(db: AsyncSession) -> Loader:
+    """The Loader attached to this session, created on first use"""
+    loader = db.info.get("loader")
+    if loader is None:
+        loader = db.info["loader"] = Loader(db)
+    return loader
+
+
+async def load(db: AsyncSession, column: InstrumentedAttribute, key: Any):
+    return await get_loader(db).load(column, key)
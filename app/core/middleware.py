@@ -0,0 +1,38 @@
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class InFlightLimitMiddleware:
+    """
+    Answers 503 with Retry-After as soon as `limit` requests are already in
+    flight in this worker, instead of queueing them behind the pool.
+    Paths starting with an `exempt` prefix (probes, long-lived streams) are
+    neither limited nor counted.
+    """
+
+    def __init__(self, app: ASGIApp, limit: int, retry_after: int, exempt: tuple[str, ...] = ()):
+        self.app = app
+        self.limit = limit
+        self.retry_after = retry_after
+        self.exempt = exempt
+        self.in_flight = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt):
+            await self.app(scope, receive, send)
+            return
+
+        if self.in_flight >= self.limit:
+            response = JSONResponse(
+                {"detail": "Server overloaded"},
+                status_code=503,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
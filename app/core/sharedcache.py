@@ -0,0 +1,192 @@
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import time
+from typing import Any
+
+from app.core.config import settings, SHARED_CACHE_DIR, SHARED_CACHE_SLOTS, SHARED_CACHE_SLOT_BYTES
+
+# magic, layout, slot count, slot size, generation
+HEADER = struct.Struct("<8sIIIxxxxQ")
+MAGIC = b"shcache1"
+LAYOUT = 1
+# Invalidation counter per slot
+STRIPE = struct.Struct("<Q")
+# seqlock, key digest, generation, expires at (epoch seconds), value length
+SLOT = struct.Struct("<Q16sQdI")
+
+
+class SharedTable:
+    """
+    Fixed-size hash table in a file mapped by every worker on the host.
+
+    Direct-mapped: a key has one slot, a colliding key evicts it. Memory is
+    `slots * slot_size` whatever the number of workers.
+
+    Reads take no lock. Each slot is a seqlock: writers make its sequence
+    odd, write, make it even again; a reader retries when the sequence was
+    odd or changed while it copied the slot.
+
+    Writers lock the slot's byte range (fcntl), so they exclude each other
+    across processes. Every slot also has an invalidation counter,
+    incremented by invalidate(). A reader that missed calls version() before
+    querying the database and passes it to put(); the put is dropped if the
+    key was invalidated in between, so a read racing a write cannot put the
+    old row back. clear() bumps the table generation and drops every entry
+    at once.
+    """
+
+    def __init__(self, name: str, slots: int = SHARED_CACHE_SLOTS, slot_size: int = SHARED_CACHE_SLOT_BYTES):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.value_size = slot_size - SLOT.size
+        self._stripes_at = HEADER.size
+        self._slots_at = self._stripes_at + slots * STRIPE.size
+        size = self._slots_at + slots * slot_size
+
+        directory = SHARED_CACHE_DIR or ("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+        # Apps on other databases must not share it, and a file is never
+        # resized under workers still mapping it: the layout is in the name
+        database = hashlib.blake2b(settings.database_url.encode(), digest_size=4).hexdigest()
+        self.path = os.path.join(directory, f"{name}-{database}-v{LAYOUT}-{slots}x{slot_size}.cache")
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked(0, HEADER.size):
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            if HEADER.unpack_from(self._map, 0)[0] != MAGIC:
+                # Zero-filled by ftruncate
+                HEADER.pack_into(self._map, 0, MAGIC, LAYOUT, slots, slot_size, 1)
+
+    @contextlib.contextmanager
+    def _locked(self, start: int, length: int):
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    def _locate(self, key: str) -> tuple[bytes, int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        return digest, int.from_bytes(digest[:8], "little") % self.slots
+
+    def _generation(self) -> int:
+        return HEADER.unpack_from(self._map, 0)[4]
+
+    def get(self, key: str) -> bytes | None:
+        digest, index = self._locate(key)
+        offset = self._slots_at + index * self.slot_size
+        for _ in range(8):
+            before = SLOT.unpack_from(self._map, offset)
+            if before[0] % 2:
+                continue
+            value = self._map[offset + SLOT.size:offset + SLOT.size + before[4]]
+            if SLOT.unpack_from(self._map, offset)[0] != before[0]:
+                continue
+            _, stored_digest, generation, expires_at, _ = before
+            if stored_digest != digest or generation != self._generation() or expires_at < time.time():
+                return None
+            return value
+        # Slot being rewritten over and over: treat as a miss
+        return None
+
+    def version(self, key: str) -> int:
+        _, index = self._locate(key)
+        return STRIPE.unpack_from(self._map, self._stripes_at + index * STRIPE.size)[0]
+
+    def put(self, key: str, value: bytes, ttl: float, version: int | None = None) -> bool:
+        """
+        Store value for ttl seconds. With `version` (a read-through), only if
+        the key was not invalidated since version() returned it; without (a
+        write), unconditionally, and read-throughs in progress are dropped.
+        """
+        digest, index = self._locate(key)
+        offset = self._slots_at + index * self.slot_size
+        with self._locked(offset, self.slot_size):
+            stripe_at = self._stripes_at + index * STRIPE.size
+            stripe = STRIPE.unpack_from(self._map, stripe_at)[0]
+            if version is not None and stripe != version:
+                return False
+            if version is None:
+                STRIPE.pack_into(self._map, stripe_at, stripe + 1)
+            if len(value) > self.value_size:
+                # Too big to cache; a write still has to drop the old value
+                if SLOT.unpack_from(self._map, offset)[1] == digest:
+                    self._write(offset, bytes(16), b"", 0)
+                return False
+            self._write(offset, digest, value, time.time() + ttl)
+        return True
+
+    def invalidate(self, key: str):
+        digest, index = self._locate(key)
+        offset = self._slots_at + index * self.slot_size
+        with self._locked(offset, self.slot_size):
+            stripe_at = self._stripes_at + index * STRIPE.size
+            STRIPE.pack_into(self._map, stripe_at, STRIPE.unpack_from(self._map, stripe_at)[0] + 1)
+            if SLOT.unpack_from(self._map, offset)[1] == digest:
+                self._write(offset, bytes(16), b"", 0)
+
+    def clear(self):
+        with self._locked(0, HEADER.size):
+            magic, layout, slots, slot_size, generation = HEADER.unpack_from(self._map, 0)
+            HEADER.pack_into(self._map, 0, magic, layout, slots, slot_size, generation + 1)
+
+    def _write(self, offset: int, digest: bytes, value: bytes, expires_at: float):
+        sequence = SLOT.unpack_from(self._map, offset)[0]
+        struct.pack_into("<Q", self._map, offset, sequence + 1)
+        self._map[offset + SLOT.size:offset + SLOT.size + len(value)] = value
+        SLOT.pack_into(self._map, offset, sequence + 1, digest, self._generation(), expires_at, len(value))
+        struct.pack_into("<Q", self._map, offset, sequence + 2)
+
+
+class SharedCache:
+    """
+    Python values over a SharedTable, pickled (only this app's workers map
+    the file). The file is opened on first use.
+
+    While `enabled` is false, get() misses and put() stores nothing, for a
+    cache that is only safe while this worker hears about writes.
+    """
+
+    def __init__(self, name: str, slot_size: int = SHARED_CACHE_SLOT_BYTES, enabled: bool = True):
+        self._name = name
+        self._slot_size = slot_size
+        self._shared_table: SharedTable | None = None
+        self.enabled = enabled
+
+    @property
+    def _table(self) -> SharedTable:
+        if self._shared_table is None:
+            self._shared_table = SharedTable(self._name, slot_size=self._slot_size)
+        return self._shared_table
+
+    def get(self, key: str) -> Any | None:
+        if not self.enabled:
+            return None
+        value = self._table.get(key)
+        return None if value is None else pickle.loads(value)
+
+    def version(self, key: str) -> int:
+        return self._table.version(key)
+
+    def put(self, key: str, value: Any, ttl: float, version: int | None = None) -> bool:
+        if not self.enabled:
+            return False
+        return self._table.put(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ttl, version)
+
+    def invalidate(self, key: str):
+        self._table.invalidate(key)
+
+    def clear(self):
+        self._table.clear()
+
+
+# User rows by username, served only while this worker LISTENs for user
+# writes made on other hosts (app.core.feed); revoked token JTIs
+users = SharedCache("users", enabled=False)
+revoked_tokens = SharedCache("revoked-tokens", slot_size=64)
@@ -0,0 +1,102 @@
+import asyncio
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import sessionmanager
+
+T = TypeVar("T")
+
+
+@dataclass
+class FlightStats:
+    # Reads that ran a query
+    executed: int = 0
+    # Reads that joined one already in flight instead of querying
+    shared: int = 0
+    failed: int = 0
+    # Flights cancelled because every caller went away
+    abandoned: int = 0
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Per-worker coalescing of concurrent identical reads.
+
+    The first call for a key starts the read in its own task; calls for the
+    same key while it runs await that task and get the same result or the
+    same exception. Nothing is cached: once the read finishes the next call
+    queries again. A caller being cancelled does not cancel the read for the
+    others, it is only cancelled when no caller is left.
+    """
+
+    def __init__(self):
+        self._flights: dict[Hashable, _Flight] = {}
+        self.stats = FlightStats()
+
+    async def do(self, key: Hashable, read: Callable[[], Awaitable[T]]) -> T:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.create_task(read()))
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+            self.stats.executed += 1
+        else:
+            self.stats.shared += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+                self.stats.abandoned += 1
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled() and flight.task.exception() is not None:
+            # Retrieved here so that a read nobody waits for any more does not log a warning
+            self.stats.failed += 1
+
+    def snapshot(self) -> dict[str, int]:
+        return {**asdict(self.stats), "in_flight": len(self._flights)}
+
+
+single_flight = SingleFlight()
+
+
+async def shared_read(db: AsyncSession, key: Hashable, read: Callable[[AsyncSession], Awaitable[BaseModel | None]]):
+    """
+    Run read() once for all concurrent callers with the same key on the same
+    shard.
+
+    read gets its own session, routed and budgeted like `db`, so that no
+    request's session is shared; it must return something that does not
+    depend on the session (a schema, not a model instance), which callers
+    must not modify.
+
+    `db` is closed before waiting: a request holding its connection while
+    waiting for a second one would exhaust the pool under load. Its loaded
+    objects stay readable and the session can be used again.
+    """
+    shard = db.info.get("shard")
+
+    async def run():
+        async with sessionmanager.session(
+            statement_timeout_ms=db.info.get("statement_timeout_ms"), shard=shard
+        ) as flight_db:
+            return await read(flight_db)
+
+    await db.close()
+    return await single_flight.do((shard, key), run)
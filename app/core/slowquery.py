@@ -0,0 +1,188 @@
+import asyncio
+import contextvars
+import hashlib
+import logging
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import (
+    SLOW_QUERY_MS,
+    SLOW_QUERY_EXPLAIN,
+    SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS,
+    SLOW_QUERY_LOG_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+# "METHOD /path" of the request running the statement, set by get_db_session
+current_route: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_route", default=None)
+
+# Statements EXPLAIN (without ANALYZE) can plan without running them
+EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+# query_canceled, raised when statement_timeout runs out
+QUERY_CANCELED = "57014"
+
+
+@dataclass
+class SlowQuery:
+    fingerprint: str
+    statement: str
+    # Types of the parameters, never their values
+    parameters: Any
+    route: str | None
+    shard: int
+    duration_ms: float
+    at: datetime
+    # EXPLAIN (FORMAT JSON) output, filled in once it has run
+    plan: Any = None
+    # "statement_timeout" when the database cancelled it, None when it completed
+    error: str | None = None
+
+
+def fingerprint(statement: str) -> str:
+    """Same for every execution of a statement, whatever the size of its expanded IN lists"""
+    normalized = re.sub(r"\s+", " ", statement.strip().lower())
+    normalized = re.sub(r"\$\d+|%s", "?", normalized)
+    normalized = re.sub(r"\(\s*\?(\s*,\s*\?)*\s*\)", "(?...)", normalized)
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def sqlstate(exception: BaseException | None) -> str | None:
+    """SQLSTATE of a driver error, on the adapted error or on the asyncpg one it was raised from"""
+    return getattr(exception, "sqlstate", None) or getattr(getattr(exception, "__cause__", None), "sqlstate", None)
+
+
+def parameters_shape(parameters: Any, executemany: bool) -> Any:
+    if executemany:
+        rows = list(parameters)
+        return {"rows": len(rows), "row": parameters_shape(rows[0], False) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class SlowQueryLog:
+    """
+    Per-worker record of statements slower than SLOW_QUERY_MS, and of those
+    cancelled by statement_timeout, whatever their duration.
+
+    Keeps the last SLOW_QUERY_LOG_SIZE of them with their route and
+    parameter types. With SLOW_QUERY_EXPLAIN, the plan of a slow statement
+    is fetched in the background on a separate connection, at most once per
+    SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS for each statement fingerprint.
+    """
+
+    def __init__(self, threshold_ms: float, size: int, explain: bool, explain_interval: float):
+        self.threshold = threshold_ms / 1000
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self.entries: deque[SlowQuery] = deque(maxlen=size)
+        self._explained_at: dict[str, float] = {}
+        self._explains: set[asyncio.Task] = set()
+
+    def install(self, engine: AsyncEngine, shard: int):
+        """Time every statement run on `engine`"""
+        sync_engine = engine.sync_engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def started(connection, cursor, statement, parameters, context, executemany):
+            connection.info["slow_query_started"] = time.perf_counter()
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def finished(connection, cursor, statement, parameters, context, executemany):
+            started_at = connection.info.pop("slow_query_started", None)
+            if started_at is None:
+                return
+            duration = time.perf_counter() - started_at
+            if duration >= self.threshold and connection.get_execution_options().get("slow_query_log", True):
+                self.record(engine, shard, statement, parameters, executemany, duration)
+
+        @event.listens_for(sync_engine, "handle_error")
+        def failed(context):
+            # after_cursor_execute does not run for a statement that raised
+            connection = context.connection
+            started_at = connection.info.pop("slow_query_started", None) if connection is not None else None
+            if started_at is None or sqlstate(context.original_exception) != QUERY_CANCELED:
+                return
+            if not connection.get_execution_options().get("slow_query_log", True):
+                return
+            executemany = context.execution_context is not None and context.execution_context.executemany
+            self.record(
+                engine, shard, context.statement, context.parameters, executemany,
+                time.perf_counter() - started_at, error="statement_timeout",
+            )
+
+    def record(
+        self, engine: AsyncEngine, shard: int, statement: str, parameters: Any, executemany: bool, duration: float,
+        error: str | None = None,
+    ):
+        entry = SlowQuery(
+            fingerprint=fingerprint(statement),
+            statement=statement,
+            parameters=parameters_shape(parameters, executemany),
+            route=current_route.get(),
+            shard=shard,
+            duration_ms=round(duration * 1000, 1),
+            at=datetime.utcnow(),
+            error=error,
+        )
+        self.entries.append(entry)
+        logger.warning(
+            "Slow query %s (%sms, %s%s): %s",
+            entry.fingerprint, entry.duration_ms, entry.route, f", {error}" if error else "", statement,
+        )
+        if self.explain and not executemany and statement.lstrip().lower().startswith(EXPLAINABLE):
+            self._schedule_explain(engine, entry, parameters)
+
+    def _schedule_explain(self, engine: AsyncEngine, entry: SlowQuery, parameters: Any):
+        now = time.monotonic()
+        if now - self._explained_at.get(entry.fingerprint, -self.explain_interval) < self.explain_interval:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Engine used outside of the event loop, e.g. by a sync script
+            return
+        self._explained_at[entry.fingerprint] = now
+        # Called from the statement's own execution: plan it once that is over
+        task = loop.create_task(self._explain(engine, entry, parameters))
+        self._explains.add(task)
+        task.add_done_callback(self._explains.discard)
+
+    async def _explain(self, engine: AsyncEngine, entry: SlowQuery, parameters: Any):
+        try:
+            async with engine.connect() as connection:
+                connection = await connection.execution_options(slow_query_log=False)
+                result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {entry.statement}", parameters)
+                plan = result.scalar()
+        except Exception as ex:
+            logger.warning("EXPLAIN of slow query %s failed: %s", entry.fingerprint, ex)
+            return
+        entry.plan = plan
+        # Plans of the same statement stay valid for a while: share the latest
+        for other in self.entries:
+            if other.fingerprint == entry.fingerprint and other.plan is None:
+                other.plan = plan
+
+    def snapshot(self) -> list[SlowQuery]:
+        """Recorded slow statements, latest first"""
+        return list(reversed(self.entries))
+
+    async def close(self):
+        for task in list(self._explains):
+            task.cancel()
+
+
+slow_queries = SlowQueryLog(
+    SLOW_QUERY_MS, SLOW_QUERY_LOG_SIZE, SLOW_QUERY_EXPLAIN, SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS
+)
@@ -0,0 +1,85 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.exceptions import BadRequestException, PreconditionRequiredException
+
+# Id of the transaction writing the row, the column default and onupdate of
+# change_seq on blogs and posts
+CHANGE_SEQ = text("CAST(CAST(pg_current_xact_id() AS text) AS bigint)")
+
+
+async def sync_horizon(db: AsyncSession) -> int:
+    """
+    Oldest transaction still running on the routed shard's server.
+
+    Transactions below it have all committed or rolled back, so no row can
+    still appear with a change_seq below it: a sync that stops there never
+    skips a change committed later.
+
+    The horizon is server-wide: a long transaction in any database of the
+    server, including the jobs running without a statement timeout
+    (archive, reconcile, reshard, bulkload), holds back every sync until
+    it ends.
+    """
+    result = await db.execute(text("SELECT CAST(CAST(pg_snapshot_xmin(pg_current_snapshot()) AS text) AS bigint)"))
+    return result.scalar()
+
+
+def etag(version: int) -> str:
+    """Strong ETag of a blog or post, from its change_seq"""
+    return f'"{version}"'
+
+
+def if_match_version(if_match: str | None) -> int:
+    """
+    The change_seq a PATCH expects the row to still have. A PATCH without it
+    could silently overwrite someone else's edit, so it is required; "*" and
+    weak ETags are not accepted.
+    """
+    if if_match is None:
+        raise PreconditionRequiredException(detail="If-Match header with the ETag of the version being edited required")
+    value = if_match.strip()
+    # Quoted as sent in ETag, some clients drop the quotes
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+    if not value.isdigit():
+        raise BadRequestException(detail="If-Match must be a single ETag returned as the version")
+    return int(value)
+
+
+@dataclass
+class SyncCursor:
+    """Position of a client in the blog and post change streams of one shard"""
+    shard: int
+    blogs: tuple[int, UUID] | None = None
+    posts: tuple[int, UUID] | None = None
+
+    def encode(self) -> str:
+        state = {
+            "shard": self.shard,
+            "blogs": self.blogs and [self.blogs[0], str(self.blogs[1])],
+            "posts": self.posts and [self.posts[0], str(self.posts[1])],
+        }
+        return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode()).decode()
+
+    @classmethod
+    def decode(cls, cursor: str, shard: int) -> "SyncCursor":
+        """The client's position; from the start again if its data moved to another shard since"""
+        try:
+            state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            position = {
+                stream: (int(state[stream][0]), UUID(state[stream][1])) if state[stream] else None
+                for stream in ("blogs", "posts")
+            }
+            moved = int(state["shard"]) != shard
+        except (binascii.Error, ValueError, KeyError, TypeError, IndexError):
+            raise BadRequestException(detail="Invalid sync cursor")
+        if moved:
+            return cls(shard=shard)
+        return cls(shard=shard, **position)
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+import uuid
+
+from fastapi import FastAPI
+from jose import jwt
+
+from app.core.config import WARMUP_CONNECTIONS, DB_POOL_SIZE, SECRET_KEY, ALGORITHM, PASSWORD_HASH_ROUNDS
+from app.core.database import sessionmanager
+from app.models import User, BlackListToken, Blog, Post
+from app.utils.hash import hash_password, verify_password, calibrate, set_rounds
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupState:
+    def __init__(self) -> None:
+        self.ready = False
+        self.duration_ms: float | None = None
+        self.steps_ms: dict[str, float] = {}
+
+
+state = WarmupState()
+
+
+async def _hot_statements():
+    """Run the hot model reads once so their SQL is compiled and cached"""
+    missing = uuid.uuid4()
+    async with sessionmanager.session() as db:
+        await User.find_by_username(db, username="")
+        await User.find_by_email(db, email="")
+        await BlackListToken.find_by_id(db, id=missing)
+        await Blog.find_by_id(db, id=missing)
+        await Blog.check_availability(db, created_by=missing, title="")
+        await Post.find_by_id(db, id=missing)
+        await Post.find_all_titles_by_blog(db, blog_id=missing)
+        await Post.check_availability(db, blog_id=missing, title="")
+
+
+async def calibrate_hashing():
+    """
+    Calibrate the bcrypt cost when PASSWORD_HASH_ROUNDS is unset (app.server
+    calibrates once for all workers; this covers plain uvicorn). Awaited
+    before the worker serves, so every hash it makes uses the same cost.
+    """
+    if PASSWORD_HASH_ROUNDS:
+        return
+    rounds = await asyncio.to_thread(calibrate)
+    set_rounds(rounds)
+    logger.info("Calibrated bcrypt cost: %s rounds", rounds)
+
+
+def _crypto():
+    """Load the bcrypt backend and the jose/cryptography code paths"""
+    verify_password("warmup", hash_password("warmup"))
+    jwt.decode(jwt.encode({"sub": "warmup"}, SECRET_KEY, algorithm=ALGORITHM), SECRET_KEY, algorithms=[ALGORITHM])
+
+
+async def _step(name: str, coro):
+    started = time.perf_counter()
+    await coro
+    state.steps_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+async def warmup(app: FastAPI, retry_delay: float = 1.0):
+    """
+    Prepare the worker for traffic; /readyz reports OK once this has finished.
+    Database steps are retried until the database is reachable.
+    """
+    started = time.perf_counter()
+    await _step("crypto", asyncio.to_thread(_crypto))
+    await _step("openapi", asyncio.to_thread(app.openapi))
+
+    delay = retry_delay
+    while True:
+        try:
+            await _step("pool", sessionmanager.warm_pool(min(WARMUP_CONNECTIONS, DB_POOL_SIZE)))
+            await _step("statements", _hot_statements())
+            break
+        except Exception as ex:
+            logger.warning("Warm-up database step failed, retrying in %.1fs: %s", delay, ex)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    state.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    state.ready = True
+    logger.info("Warm-up finished in %sms %s", state.duration_ms, state.steps_ms)
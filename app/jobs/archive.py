@@ -0,0 +1,54 @@
+"""
+Move blogs and posts soft-deleted more than ARCHIVE_AFTER_DAYS ago into
+blogs_archive/posts_archive, ARCHIVE_BATCH_SIZE rows per transaction, on
+every shard in turn.
+
+Every batch commits on its own, so the job can be stopped and re-run at any
+time and picks up where it left off.
+
+Usage: python -m app.jobs.archive [days]
+"""
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta
+
+from app.core.config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from app.core.database import sessionmanager
+from app.models import BlogArchive, PostArchive
+
+logger = logging.getLogger(__name__)
+
+
+async def archive_deleted(days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE, pause: float = 0.1):
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    totals = {}
+    for shard in sessionmanager.shard_ids:
+        # Blogs first: their posts are archived along with them
+        for model in (BlogArchive, PostArchive):
+            total = 0
+            while True:
+                async with sessionmanager.session(statement_timeout_ms=0, shard=shard) as db:
+                    moved = await model.archive_batch(db, cutoff=cutoff, batch_size=batch_size)
+                total += moved
+                if moved:
+                    logger.info("shard %s %s: archived %s rows (%s so far)", shard, model.__tablename__, moved, total)
+                if moved < batch_size:
+                    break
+                # Give autovacuum and live traffic some room between batches
+                await asyncio.sleep(pause)
+            totals[model.__tablename__] = totals.get(model.__tablename__, 0) + total
+    return totals
+
+
+async def main(days: int):
+    try:
+        totals = await archive_deleted(days=days)
+        logger.info("Archive finished: %s", totals)
+    finally:
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_AFTER_DAYS))
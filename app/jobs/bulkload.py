@@ -0,0 +1,345 @@
+"""
+Offline bulk loader for users, blogs and posts.
+
+Streams JSONL (one object per line) or CSV (with a header row) files and
+writes them with COPY, BULKLOAD_CHUNK_SIZE rows per chunk. Memory stays
+constant whatever the file size. Plain-text passwords are hashed in a
+process pool while the previous chunk is being copied; rows that already
+carry a bcrypt hash in `password_hash` are copied as is.
+
+Fields match the model columns. `id` and `created_at` are generated when
+missing. Blogs reference users and posts reference blogs by id, so files are
+loaded in the order users, blogs, posts.
+
+Options:
+  --defer-indexes  drop the non-unique indexes of each table before loading
+                   it and rebuild them afterwards
+  --no-counters    disable the counter triggers during the load and recount
+                   everything with app.jobs.reconcile afterwards
+
+Everything is written to the primary database (shard 0); with shards
+configured, spread the users with `python -m app.jobs.reshard --rebalance`
+afterwards.
+
+Meant for an offline migration window: both options affect every writer of
+the tables while the load runs.
+
+Usage: python -m app.jobs.bulkload [--users FILE] [--blogs FILE] [--posts FILE]
+                                   [--chunk-size N] [--workers N]
+                                   [--defer-indexes] [--no-counters]
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterator
+from uuid import UUID, uuid4
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from app.core.config import settings, BULKLOAD_CHUNK_SIZE, PASSWORD_HASH_ROUNDS
+from app.core.database import sessionmanager
+from app.jobs.reconcile import reconcile_counters
+from app.utils.hash import hash_password, calibrate, set_rounds
+
+logger = logging.getLogger(__name__)
+
+TRUE = {"1", "true", "t", "yes", "y"}
+
+# Column order of the COPY for each table
+COLUMNS = {
+    "users": (
+        "id", "username", "email", "first_name", "last_name", "password",
+        "created_at", "is_disabled", "is_superuser",
+    ),
+    "blogs": ("id", "title", "created_by", "created_at", "is_deleted", "deleted_at"),
+    "posts": ("id", "title", "body", "blog_id", "created_at", "is_deleted", "deleted_at"),
+}
+COUNTER_TRIGGERS = (("blogs", "blogs_counters"), ("posts", "posts_counters"))
+
+
+def _uuid(value: Any) -> UUID:
+    return value if isinstance(value, UUID) else UUID(str(value))
+
+
+def _optional_uuid(value: Any) -> UUID:
+    return _uuid(value) if value not in (None, "") else uuid4()
+
+
+def _datetime(value: Any) -> datetime | None:
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        return value
+    # Columns are timestamp without time zone and hold UTC
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _bool(value: Any, default: bool) -> bool:
+    if value in (None, ""):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE
+
+
+def _text(value: Any) -> str | None:
+    return None if value in (None, "") else str(value)
+
+
+def user_record(row: dict, loaded_at: datetime) -> tuple:
+    # password is filled in by prepare_users
+    return (
+        _optional_uuid(row.get("id")),
+        row["username"],
+        row["email"],
+        _text(row.get("first_name")),
+        _text(row.get("last_name")),
+        row.get("password_hash") or None,
+        _datetime(row.get("created_at")) or loaded_at,
+        _bool(row.get("is_disabled"), False),
+        _bool(row.get("is_superuser"), False),
+    )
+
+
+def blog_record(row: dict, loaded_at: datetime) -> tuple:
+    deleted_at = _datetime(row.get("deleted_at"))
+    return (
+        _optional_uuid(row.get("id")),
+        row["title"],
+        _uuid(row["created_by"]),
+        _datetime(row.get("created_at")) or loaded_at,
+        _bool(row.get("is_deleted"), deleted_at is not None),
+        deleted_at,
+    )
+
+
+def post_record(row: dict, loaded_at: datetime) -> tuple:
+    deleted_at = _datetime(row.get("deleted_at"))
+    return (
+        _optional_uuid(row.get("id")),
+        row["title"],
+        row["body"],
+        _uuid(row["blog_id"]),
+        _datetime(row.get("created_at")) or loaded_at,
+        _bool(row.get("is_deleted"), deleted_at is not None),
+        deleted_at,
+    )
+
+
+RECORDS: dict[str, Callable[[dict, datetime], tuple]] = {
+    "users": user_record,
+    "blogs": blog_record,
+    "posts": post_record,
+}
+
+
+def read_rows(path: str) -> Iterator[dict]:
+    """Rows of a .csv file, or of a JSONL file for any other extension"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            yield from csv.DictReader(f)
+            return
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as ex:
+                raise ValueError(f"{path}:{line_number}: {ex}") from ex
+
+
+def read_chunks(path: str, chunk_size: int) -> Iterator[list[dict]]:
+    chunk = []
+    for row in read_rows(path):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    """Runs in a worker process"""
+    return [hash_password(password) for password in passwords]
+
+
+async def prepare(
+    table: str, rows: list[dict], pool: ProcessPoolExecutor, workers: int
+) -> list[tuple]:
+    loaded_at = datetime.utcnow()
+    records = [RECORDS[table](row, loaded_at) for row in rows]
+    if table != "users":
+        return records
+
+    password = COLUMNS["users"].index("password")
+    pending = [i for i, record in enumerate(records) if record[password] is None]
+    if not pending:
+        return records
+    plain = [rows[i]["password"] for i in pending]
+
+    loop = asyncio.get_running_loop()
+    size = -(-len(plain) // workers)
+    slices = [plain[start:start + size] for start in range(0, len(plain), size)]
+    hashed = await asyncio.gather(*(loop.run_in_executor(pool, hash_passwords, part) for part in slices))
+    for i, value in zip(pending, (h for part in hashed for h in part)):
+        record = list(records[i])
+        record[password] = value
+        records[i] = tuple(record)
+    return records
+
+
+async def drop_indexes(connection: asyncpg.Connection, table: str) -> list[tuple[str, str]]:
+    """Drop the non-unique indexes of `table`; returns their names and definitions"""
+    indexes = await connection.fetch("""
+        SELECT c.relname, pg_get_indexdef(c.oid) AS definition
+        FROM pg_index x JOIN pg_class c ON c.oid = x.indexrelid
+        WHERE x.indrelid = $1::regclass AND NOT x.indisunique AND NOT x.indisprimary
+    """, table)
+    for index in indexes:
+        # Logged so the index can be recreated by hand if the load is killed
+        logger.info("Dropping %s: %s", index["relname"], index["definition"])
+        await connection.execute(f'DROP INDEX "{index["relname"]}"')
+    return [(index["relname"], index["definition"]) for index in indexes]
+
+
+async def create_indexes(connection: asyncpg.Connection, indexes: list[tuple[str, str]]):
+    for name, definition in indexes:
+        # Partitioned indexes are reported "ON ONLY posts", which would not
+        # build the partition indexes
+        definition = definition.replace(" ON ONLY ", " ON ", 1)
+        started = time.perf_counter()
+        await connection.execute(definition)
+        logger.info("Rebuilt %s in %.1fs", name, time.perf_counter() - started)
+
+
+async def load_table(
+    connection: asyncpg.Connection,
+    table: str,
+    path: str,
+    chunk_size: int,
+    pool: ProcessPoolExecutor,
+    workers: int,
+) -> int:
+    started = time.perf_counter()
+    total = 0
+    chunks = read_chunks(path, chunk_size)
+    # Prepare (parse, hash) chunk n+1 while chunk n is being copied
+    next_records = asyncio.ensure_future(_prepare_next(table, chunks, pool, workers))
+    try:
+        while True:
+            records = await next_records
+            if records is None:
+                return total
+            next_records = asyncio.ensure_future(_prepare_next(table, chunks, pool, workers))
+            await connection.copy_records_to_table(table, records=records, columns=COLUMNS[table])
+            total += len(records)
+            elapsed = time.perf_counter() - started
+            logger.info("%s: %s rows, %.0f rows/s", table, total, total / elapsed)
+    finally:
+        next_records.cancel()
+
+
+async def _prepare_next(
+    table: str, chunks: Iterator[list[dict]], pool: ProcessPoolExecutor, workers: int
+) -> list[tuple] | None:
+    rows = next(chunks, None)
+    if rows is None:
+        return None
+    return await prepare(table, rows, pool, workers)
+
+
+async def bulk_load(
+    files: dict[str, str],
+    chunk_size: int = BULKLOAD_CHUNK_SIZE,
+    workers: int | None = None,
+    defer_indexes: bool = False,
+    no_counters: bool = False,
+):
+    workers = workers or os.cpu_count() or 1
+    if "users" in files and not PASSWORD_HASH_ROUNDS:
+        # Forked hashing processes inherit the context, spawned ones read the environment
+        rounds = calibrate()
+        set_rounds(rounds)
+        os.environ["PASSWORD_HASH_ROUNDS"] = str(rounds)
+    dsn = make_url(settings.database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+    # Every chunk is its own COPY statement, committed on its own
+    connection = await asyncpg.connect(dsn, server_settings={"statement_timeout": "0"})
+    try:
+        if no_counters:
+            for table, trigger in COUNTER_TRIGGERS:
+                await connection.execute(f"ALTER TABLE {table} DISABLE TRIGGER {trigger}")
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for table in COLUMNS:
+                    if table not in files:
+                        continue
+                    indexes = await drop_indexes(connection, table) if defer_indexes else []
+                    try:
+                        started = time.perf_counter()
+                        total = await load_table(connection, table, files[table], chunk_size, pool, workers)
+                        elapsed = time.perf_counter() - started
+                        logger.info(
+                            "Loaded %s %s in %.1fs (%.0f rows/s)",
+                            total, table, elapsed, total / elapsed if elapsed else 0,
+                        )
+                    finally:
+                        await create_indexes(connection, indexes)
+                    await connection.execute(f"ANALYZE {table}")
+        finally:
+            if no_counters:
+                for table, trigger in COUNTER_TRIGGERS:
+                    await connection.execute(f"ALTER TABLE {table} ENABLE TRIGGER {trigger}")
+    finally:
+        await connection.close()
+
+    if no_counters:
+        repaired = await reconcile_counters()
+        logger.info("Recounted counters, %s rows updated", repaired)
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.jobs.bulkload", description="Bulk load users, blogs and posts with COPY")
+    parser.add_argument("--users", help="users file (.jsonl or .csv)")
+    parser.add_argument("--blogs", help="blogs file (.jsonl or .csv)")
+    parser.add_argument("--posts", help="posts file (.jsonl or .csv)")
+    parser.add_argument("--chunk-size", type=int, default=BULKLOAD_CHUNK_SIZE, help="rows per COPY")
+    parser.add_argument("--workers", type=int, default=None, help="password hashing processes (default: one per core)")
+    parser.add_argument("--defer-indexes", action="store_true", help="rebuild non-unique indexes after loading")
+    parser.add_argument("--no-counters", action="store_true", help="disable counter triggers and recount afterwards")
+    args = parser.parse_args(argv)
+    if not (args.users or args.blogs or args.posts):
+        parser.error("nothing to load, pass at least one of --users, --blogs, --posts")
+    return args
+
+
+async def main(argv: list[str]):
+    args = parse_args(argv)
+    files = {table: getattr(args, table) for table in COLUMNS if getattr(args, table)}
+    try:
+        await bulk_load(
+            files,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            defer_indexes=args.defer_indexes,
+            no_counters=args.no_counters,
+        )
+    finally:
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    asyncio.run(main(sys.argv[1:]))
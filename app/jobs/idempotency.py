@@ -0,0 +1,41 @@
+"""
+Delete expired Idempotency-Key records, IDEMPOTENCY_SWEEP_BATCH_SIZE rows
+per transaction. Expired keys are also taken over on reuse, so this only
+bounds the table size.
+
+Usage: python -m app.jobs.idempotency
+"""
+import asyncio
+import logging
+import sys
+from datetime import datetime
+
+from app.core.config import IDEMPOTENCY_SWEEP_BATCH_SIZE
+from app.core.database import sessionmanager
+from app.models.idempotency import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+
+async def sweep_expired(batch_size: int = IDEMPOTENCY_SWEEP_BATCH_SIZE, pause: float = 0.05) -> int:
+    now, total = datetime.utcnow(), 0
+    while True:
+        async with sessionmanager.session(statement_timeout_ms=0) as db:
+            deleted = await IdempotencyKey.delete_expired(db, now=now, batch_size=batch_size)
+        total += deleted
+        if deleted < batch_size:
+            return total
+        await asyncio.sleep(pause)
+
+
+async def main():
+    try:
+        total = await sweep_expired()
+        logger.info("Deleted %s expired idempotency keys", total)
+    finally:
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    asyncio.run(main())
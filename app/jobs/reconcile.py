@@ -0,0 +1,180 @@
+"""
+Recompute the blog/post counters on users and blogs and repair any drift
+from the trigger-maintained values, RECONCILE_BATCH_SIZE users per
+transaction, on every shard in turn. On a shard the users are the anchor
+rows of the users whose blogs and posts it holds.
+
+Anchors are repaired first. User.create commits the user on the primary and
+its anchor on the shard separately, so either can be missing: a user
+without an anchor cannot create blogs until it is re-created, and an anchor
+without a user holds on to the username on its shard.
+
+Each batch locks its blogs, then its users, in the same order the counter
+triggers do. Concurrent writes either finish before the recount sees them
+or wait and apply their increment on top of it.
+
+Usage: python -m app.jobs.reconcile
+"""
+import asyncio
+import logging
+import sys
+from uuid import UUID
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import RECONCILE_BATCH_SIZE
+from app.core.database import sessionmanager, PRIMARY_SHARD
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+
+async def repair_anchors(shard: int, batch_size: int = RECONCILE_BATCH_SIZE) -> int:
+    """Re-create the missing anchors of the users on `shard`, drop those of users that do not exist; returns the count"""
+    repaired, after = 0, None
+    while True:
+        async with sessionmanager.session(statement_timeout_ms=0) as db:
+            query = select(User).where(User.shard == shard).order_by(User.id).limit(batch_size)
+            if after is not None:
+                query = query.where(User.id > after)
+            users = (await db.execute(query)).scalars().all()
+        if not users:
+            break
+        async with sessionmanager.session(statement_timeout_ms=0, shard=shard) as db:
+            ids = [user.id for user in users]
+            result = await db.execute(text("SELECT id FROM users WHERE id = ANY(:ids)"), {"ids": ids})
+            anchored = set(result.scalars())
+            for user in users:
+                if user.id not in anchored:
+                    await User.add_anchor(db, user, shard=shard)
+                    repaired += 1
+            await db.commit()
+        if len(users) < batch_size:
+            break
+        after = users[-1].id
+
+    after = None
+    while True:
+        async with sessionmanager.session(statement_timeout_ms=0, shard=shard) as db:
+            result = await db.execute(
+                text("""
+                    SELECT id FROM users WHERE CAST(:after AS uuid) IS NULL OR id > :after
+                    ORDER BY id LIMIT :batch_size
+                """),
+                {"after": after, "batch_size": batch_size},
+            )
+            ids = result.scalars().all()
+        if not ids:
+            break
+        async with sessionmanager.session(statement_timeout_ms=0) as db:
+            result = await db.execute(select(User.id).where(User.id.in_(ids)))
+            orphans = set(ids) - set(result.scalars())
+        if orphans:
+            async with sessionmanager.session(statement_timeout_ms=0, shard=shard) as db:
+                # A user that never existed has no blogs; one with blogs is left alone
+                result = await db.execute(
+                    text("""
+                        DELETE FROM users u WHERE u.id = ANY(:ids)
+                          AND NOT EXISTS (SELECT 1 FROM blogs b WHERE b.created_by = u.id)
+                          AND NOT EXISTS (SELECT 1 FROM blogs_archive b WHERE b.created_by = u.id)
+                        RETURNING u.id
+                    """),
+                    {"ids": list(orphans)},
+                )
+                repaired += len(result.all())
+                await db.commit()
+        if len(ids) < batch_size:
+            break
+        after = ids[-1]
+    return repaired
+
+
+async def reconcile_batch(
+    db: AsyncSession, after: UUID | None, batch_size: int, shard: int = PRIMARY_SHARD
+) -> tuple[list[UUID], int]:
+    """Reconcile the next batch of users after `after`; returns their ids and the number of repaired rows"""
+    # Users of other shards have no blogs here, their counters live on their anchor rows
+    result = await db.execute(
+        text("""
+            SELECT id FROM users WHERE shard = :shard AND (CAST(:after AS uuid) IS NULL OR id > :after)
+            ORDER BY id LIMIT :batch_size
+        """),
+        {"shard": shard, "after": after, "batch_size": batch_size},
+    )
+    ids = result.scalars().all()
+    if not ids:
+        return ids, 0
+
+    await db.execute(text("SELECT id FROM blogs WHERE created_by = ANY(:ids) FOR UPDATE"), {"ids": ids})
+    blogs = await db.execute(text("""
+        UPDATE blogs b SET post_count = s.post_count, last_post_at = s.last_post_at
+        FROM (
+            SELECT b2.id, count(p.id) AS post_count, max(p.created_at) AS last_post_at
+            FROM blogs b2
+            LEFT JOIN posts p ON p.blog_id = b2.id AND p.is_deleted IS false
+            WHERE b2.created_by = ANY(:ids)
+            GROUP BY b2.id
+        ) s
+        WHERE b.id = s.id
+          AND (b.post_count, b.last_post_at) IS DISTINCT FROM (s.post_count, s.last_post_at)
+        RETURNING b.id
+    """), {"ids": ids})
+    repaired = len(blogs.all())
+
+    await db.execute(text("SELECT id FROM users WHERE id = ANY(:ids) FOR UPDATE"), {"ids": ids})
+    users = await db.execute(text("""
+        UPDATE users u
+        SET blog_count = s.blog_count, post_count = s.post_count, last_post_at = s.last_post_at
+        FROM (
+            SELECT u2.id, count(b.id) AS blog_count, coalesce(sum(b.post_count), 0) AS post_count,
+                   max(b.last_post_at) AS last_post_at
+            FROM users u2
+            LEFT JOIN blogs b ON b.created_by = u2.id AND b.is_deleted IS false
+            WHERE u2.id = ANY(:ids)
+            GROUP BY u2.id
+        ) s
+        WHERE u.id = s.id
+          AND (u.blog_count, u.post_count, u.last_post_at)
+              IS DISTINCT FROM (s.blog_count, s.post_count, s.last_post_at)
+        RETURNING u.id
+    """), {"ids": ids})
+    repaired += len(users.all())
+
+    await db.commit()
+    return ids, repaired
+
+
+async def reconcile_counters(batch_size: int = RECONCILE_BATCH_SIZE, pause: float = 0.05) -> int:
+    total = 0
+    for shard in sessionmanager.shard_ids:
+        if shard != PRIMARY_SHARD:
+            anchors = await repair_anchors(shard, batch_size=batch_size)
+            if anchors:
+                logger.info("Repaired %s anchors on shard %s", anchors, shard)
+            total += anchors
+        after = None
+        while True:
+            async with sessionmanager.session(statement_timeout_ms=0, shard=shard) as db:
+                ids, repaired = await reconcile_batch(db, after=after, batch_size=batch_size, shard=shard)
+            if repaired:
+                logger.info("Repaired %s counter rows on shard %s up to user %s", repaired, shard, ids[-1])
+            total += repaired
+            if len(ids) < batch_size:
+                break
+            after = ids[-1]
+            await asyncio.sleep(pause)
+    return total
+
+
+async def main():
+    try:
+        total = await reconcile_counters()
+        logger.info("Reconcile finished, %s rows repaired", total)
+    finally:
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    asyncio.run(main())
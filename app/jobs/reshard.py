@@ -0,0 +1,186 @@
+"""
+Move users' blogs and posts between shards.
+
+A move marks the user as moving (their requests get 503 + Retry-After),
+waits RESHARD_GRACE_SECONDS for requests already routed to the old shard,
+copies the blogs, posts and their archives to the target shard in one
+transaction, points users.shard at the target and finally deletes the old
+copies. Each step can be re-run: a move interrupted at any point is finished
+by running it again with the same target.
+
+Counters are rebuilt by the counter triggers while the rows are copied.
+
+--rebalance moves users whose shard is not the one a new user with the same
+id would get, e.g. after a shard was added to SHARD_DATABASE_URLS or after a
+bulk load, which writes everything to the primary.
+
+Usage: python -m app.jobs.reshard --user ID --to SHARD
+       python -m app.jobs.reshard --rebalance [--limit N]
+       python -m app.jobs.reshard --status
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from uuid import UUID
+
+from sqlalchemy import Table, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import RESHARD_GRACE_SECONDS
+from app.core.database import sessionmanager, PRIMARY_SHARD, MOVING
+from app.models import User, Blog, Post, BlogArchive, PostArchive
+
+logger = logging.getLogger(__name__)
+
+# Parents before children; deleted in reverse
+TABLES: list[tuple[Table, str]] = [
+    (Blog.__table__, "created_by = :id"),
+    (BlogArchive.__table__, "created_by = :id"),
+    (Post.__table__, "blog_id IN (SELECT id FROM blogs WHERE created_by = :id)"),
+    (PostArchive.__table__, "blog_id IN (SELECT id FROM blogs WHERE created_by = :id "
+                            "UNION ALL SELECT id FROM blogs_archive WHERE created_by = :id)"),
+]
+
+
+async def purge(db: AsyncSession, user_id: UUID, shard: int):
+    """Delete the user's blogs and posts from the routed shard, and the anchor unless it is the primary"""
+    for table, owned in reversed(TABLES):
+        await db.execute(text(f"DELETE FROM {table.name} WHERE {owned}"), {"id": user_id})
+    if shard != PRIMARY_SHARD:
+        await db.execute(text("DELETE FROM users WHERE id = :id"), {"id": user_id})
+
+
+async def copy_rows(source: AsyncSession, target: AsyncSession, user_id: UUID, batch_size: int) -> dict[str, int]:
+    copied = {}
+    for table, owned in TABLES:
+        total = 0
+        result = await source.stream(text(f"SELECT * FROM {table.name} WHERE {owned}"), {"id": user_id})
+        async for rows in result.mappings().partitions(batch_size):
+            rows = [dict(row) for row in rows]
+            if table is Blog.__table__:
+                # The post inserts below count them again through the triggers
+                for row in rows:
+                    row.update(post_count=0, last_post_at=None)
+            await target.execute(table.insert(), rows)
+            total += len(rows)
+        copied[table.name] = total
+    return copied
+
+
+async def find_source(user: User, target: int) -> int:
+    """Shard of a user left marked as moving: the one besides the target with an anchor row, else the primary"""
+    async def has_anchor(db: AsyncSession):
+        return (await db.execute(text("SELECT 1 FROM users WHERE id = :id"), {"id": user.id})).first() is not None
+
+    anchors = await sessionmanager.fan_out(has_anchor)
+    candidates = [shard for shard, found in anchors.items() if found and shard not in (PRIMARY_SHARD, target)]
+    return candidates[0] if candidates else PRIMARY_SHARD
+
+
+async def move_user(user_id: UUID, target: int, batch_size: int = 1000, grace: float = RESHARD_GRACE_SECONDS):
+    if target not in sessionmanager.shard_ids:
+        raise ValueError(f"Unknown shard {target}, shards are {sessionmanager.shard_ids}")
+
+    async with sessionmanager.session(statement_timeout_ms=0) as db:
+        user = (await db.execute(select(User).where(User.id == user_id))).scalars().one()
+        source, waiting = user.shard, False
+        if source == MOVING:
+            source = await find_source(user, target)
+        elif source != target:
+            await User.set_shard(db, user_id, MOVING)
+            await db.refresh(user)
+            waiting = True
+
+    if source != target:
+        if waiting:
+            # Requests that read the old shard finish; cached rows were
+            # dropped on every host by set_shard's notification
+            await asyncio.sleep(grace)
+        async with sessionmanager.session(statement_timeout_ms=0, shard=source) as source_db:
+            async with sessionmanager.session(statement_timeout_ms=0, shard=target) as target_db:
+                # Leftovers of an interrupted move, then a fresh copy
+                await purge(target_db, user_id, target)
+                if target != PRIMARY_SHARD:
+                    await User.add_anchor(target_db, user, shard=target)
+                await target_db.execute(
+                    text("UPDATE users SET blog_count = 0, post_count = 0, last_post_at = NULL WHERE id = :id"),
+                    {"id": user_id},
+                )
+                copied = await copy_rows(source_db, target_db, user_id, batch_size)
+                await target_db.commit()
+        logger.info("User %s: copied %s from shard %s to shard %s", user_id, copied, source, target)
+
+        async with sessionmanager.session() as db:
+            await User.set_shard(db, user_id, target)
+
+    # The user is served from the target now; remove every other copy
+    for shard in sessionmanager.shard_ids:
+        if shard != target:
+            async with sessionmanager.session(statement_timeout_ms=0, shard=shard) as db:
+                await purge(db, user_id, shard)
+                await db.commit()
+    logger.info("User %s is on shard %s", user_id, target)
+
+
+async def rebalance(limit: int | None = None) -> int:
+    async with sessionmanager.session(statement_timeout_ms=0) as db:
+        users = (await db.execute(select(User.id, User.shard).order_by(User.id))).all()
+    moved = 0
+    for user_id, shard in users:
+        home = sessionmanager.shard_for_new_user(user_id)
+        if shard == home:
+            continue
+        if limit is not None and moved >= limit:
+            break
+        await move_user(user_id, home)
+        moved += 1
+    return moved
+
+
+async def status() -> dict[int, dict[str, int]]:
+    async def count(db: AsyncSession):
+        counts = {}
+        for table, _ in TABLES:
+            counts[table.name] = (await db.execute(text(f"SELECT count(*) FROM {table.name}"))).scalar()
+        return counts
+
+    counts = await sessionmanager.fan_out(count)
+    async with sessionmanager.session() as db:
+        result = await db.execute(text("SELECT shard, count(*) FROM users GROUP BY shard"))
+        for shard, users in result:
+            counts.setdefault(shard, {})["users"] = users
+    return counts
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.jobs.reshard", description="Move users between shards")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--user", type=UUID, help="id of the user to move, with --to")
+    action.add_argument("--rebalance", action="store_true", help="move every user to the shard its id hashes to")
+    action.add_argument("--status", action="store_true", help="rows per shard")
+    parser.add_argument("--to", type=int, help="target shard of --user")
+    parser.add_argument("--limit", type=int, default=None, help="move at most N users with --rebalance")
+    args = parser.parse_args(argv)
+    if args.user is not None and args.to is None:
+        parser.error("--user needs --to")
+    return args
+
+
+async def main(args: argparse.Namespace):
+    try:
+        if args.user is not None:
+            await move_user(args.user, args.to)
+        elif args.rebalance:
+            moved = await rebalance(limit=args.limit)
+            logger.info("Rebalance finished, %s users moved", moved)
+        else:
+            for shard, counts in sorted((await status()).items()):
+                logger.info("shard %s: %s", shard, counts)
+    finally:
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    asyncio.run(main(parse_args(sys.argv[1:])))
@@ -1,16 +1,37 @@
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
 import logging
 import sys
 from contextlib import asynccontextmanager
 
-import uvicorn
 from app.routers.auth import router as auth_router
 from app.routers.blog import router as blog_router
 from app.routers.post import router as post_router
-from app.core.config import settings
-from app.core.database import sessionmanager
-from fastapi import FastAPI
+from app.routers.stats import router as stats_router
+from app.routers.sync import router as sync_router
+from app.routers.admin import router as admin_router
+from app.core.config import settings, MAX_IN_FLIGHT_REQUESTS, RETRY_AFTER_SECONDS
+from app.core.database import sessionmanager, UnitOfWorkRoute, no_db
+from app.core.feed import post_feed
+from app.core.bloom import availability
+from app.core.exceptions import ServiceUnavailableException
+from app.core.middleware import InFlightLimitMiddleware
+from app.core.compression import CompressionMiddleware
+from app.core.singleflight import single_flight
+from app.core.groupcommit import blacklist
+from app.core.slowquery import slow_queries, sqlstate, QUERY_CANCELED
+from app.core import warmup
+from fastapi import FastAPI, Request
+from fastapi.exception_handlers import http_exception_handler
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMPORT_MS = round((time.perf_counter() - _import_started) * 1000, 1)
 
 
 @asynccontextmanager
@@ -19,24 +40,82 @@ async def lifespan(app: FastAPI):
     Function that handles startup and shutdown events.
     To understand more, read https://fastapi.tiangolo.com/advanced/events/
     """
+    logger.info("Imports took %sms", IMPORT_MS)
+    await warmup.calibrate_hashing()
+    # Also enables the shared user cache, see app/core/feed.py
+    post_feed.start()
+    warmup_task = asyncio.create_task(warmup.warmup(app))
+    availability_task = asyncio.create_task(availability.run())
     yield
+    warmup_task.cancel()
+    availability_task.cancel()
+    await post_feed.close()
+    await blacklist.close()
+    await slow_queries.close()
     if sessionmanager._engine is not None:
         # Close the DB connection
         await sessionmanager.close()
 
 
 app = FastAPI(lifespan=lifespan, title=settings.project_name, docs_url="/api/docs")
+app.router.route_class = UnitOfWorkRoute
+app.add_middleware(
+    InFlightLimitMiddleware,
+    limit=MAX_IN_FLIGHT_REQUESTS,
+    retry_after=RETRY_AFTER_SECONDS,
+    exempt=("/readyz", "/api/post/feed/"),
+)
+app.add_middleware(CompressionMiddleware)
+
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # No pooled connection within DB_POOL_TIMEOUT: shed instead of queueing
+    return await http_exception_handler(
+        request, ServiceUnavailableException(detail="Database busy", retry_after=RETRY_AFTER_SECONDS)
+    )
+
+
+@app.exception_handler(DBAPIError)
+async def statement_timeout_handler(request: Request, exc: DBAPIError):
+    # The route's statement_timeout ran out
+    if sqlstate(exc.orig) != QUERY_CANCELED:
+        raise exc
+    return await http_exception_handler(
+        request, ServiceUnavailableException(detail="Database timeout", retry_after=RETRY_AFTER_SECONDS)
+    )
 
 
 @app.get("/")
+@no_db
 async def root():
     return {"message": "Async, FasAPI, PostgreSQL, JWT authntication, Alembic migrations Boilerplate"}
 
+
+@app.get("/readyz")
+@no_db
+async def readyz():
+    if not warmup.state.ready:
+        raise ServiceUnavailableException(detail="Warming up")
+    return {
+        "status": "ready",
+        "import_ms": IMPORT_MS,
+        "warmup_ms": warmup.state.duration_ms,
+        "warmup_steps_ms": warmup.state.steps_ms,
+        "single_flight": single_flight.snapshot(),
+    }
+
 # Routers
 app.include_router(auth_router)
 app.include_router(blog_router)
 app.include_router(post_router)
+app.include_router(stats_router)
+app.include_router(sync_router)
+app.include_router(admin_router)
 
 
 if __name__ == "__main__":
+    # Only needed when run as a script, keep it off the import path
+    import uvicorn
+
     uvicorn.run("main:app", host="0.0.0.0", reload=True, port=8000)
@@ -5,3 +5,5 @@ from .user import User
 from .jwt import BlackListToken
 from .blog import Blog
 from .post import Post
+from .archive import BlogArchive, PostArchive
+from .idempotency import IdempotencyKey
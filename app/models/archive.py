@@ -0,0 +1,163 @@
+from datetime import datetime
+from uuid import UUID as PyUUID
+
+from sqlalchemy import Column, String, Boolean, DateTime, UUID, Table, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import Base
+
+# Archived rows come back as live, undeleted rows
+_RESTORED = {"is_deleted": "false", "deleted_at": "NULL"}
+
+
+def _columns(table: Table) -> list[str]:
+    """Columns shared by a live table and its archive (everything but archived_at)"""
+    return [column.name for column in table.columns if column.name != "archived_at"]
+
+
+def _move_sql(source: str, target: str, columns: list[str], where: str, restore: bool = False) -> str:
+    column_list = ", ".join(columns)
+    select_list = ", ".join(_RESTORED.get(name, name) if restore else name for name in columns)
+    return f"""
+        WITH moved AS (
+            DELETE FROM {source} WHERE {where}
+            RETURNING {column_list}
+        )
+        INSERT INTO {target} ({column_list})
+        SELECT {select_list} FROM moved
+        RETURNING id
+    """
+
+
+async def _lock_ids(db: AsyncSession, table: str, cutoff: datetime, batch_size: int) -> list[PyUUID]:
+    # Short lock_timeout and SKIP LOCKED: the job backs off instead of queueing behind live traffic
+    await db.execute(text("SET LOCAL lock_timeout = '2s'"))
+    result = await db.execute(
+        text(f"""
+            SELECT id FROM {table}
+            WHERE is_deleted IS true AND deleted_at < :cutoff
+            ORDER BY deleted_at
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        """),
+        {"cutoff": cutoff, "batch_size": batch_size},
+    )
+    return result.scalars().all()
+
+
+class BlogArchive(Base):
+    __tablename__ = "blogs_archive"
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    title = Column(String, nullable=False)
+    created_by = Column(UUID, nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False)
+    is_deleted = Column(Boolean)
+    deleted_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    @classmethod
+    async def find_by_id(cls, db: AsyncSession, id: UUID):
+        query = select(cls).where(cls.id == id)
+        result = await db.execute(query)
+        return result.scalars().first()
+
+    @classmethod
+    async def archive_batch(cls, db: AsyncSession, cutoff: datetime, batch_size: int) -> int:
+        """
+        Move up to batch_size blogs deleted before cutoff, and their posts.
+
+        The posts go first, at most batch_size per transaction, each time of
+        the blogs locked by that transaction; the blogs follow in the
+        transaction that moves their last posts. A blog restored in between
+        gets its archived posts back, see restore_posts.
+        """
+        while True:
+            ids = await _lock_ids(db, "blogs", cutoff, batch_size)
+            if not ids:
+                await db.commit()
+                return 0
+            result = await db.execute(
+                text(_move_sql(
+                    "posts", "posts_archive", _columns(PostArchive.__table__),
+                    "id IN (SELECT id FROM posts WHERE blog_id = ANY(:ids) LIMIT :batch_size)",
+                )),
+                {"ids": ids, "batch_size": batch_size},
+            )
+            if len(result.all()) < batch_size:
+                # No post of these blogs is left
+                break
+            await db.commit()
+        await db.execute(
+            text(_move_sql("blogs", "blogs_archive", _columns(cls.__table__), "id = ANY(:ids)")),
+            {"ids": ids},
+        )
+        await db.commit()
+        return len(ids)
+
+    @classmethod
+    async def restore_posts(cls, db: AsyncSession, id: UUID):
+        """Move back the posts archived along with a blog, without committing"""
+        await db.execute(
+            text(_move_sql(
+                "posts_archive", "posts", _columns(PostArchive.__table__),
+                "blog_id = :id AND is_deleted IS false", restore=True,
+            )),
+            {"id": id},
+        )
+
+    @classmethod
+    async def restore(cls, db: AsyncSession, id: UUID) -> bool:
+        """Move a blog back to the live table together with the posts archived along with it"""
+        result = await db.execute(
+            text(_move_sql("blogs_archive", "blogs", _columns(cls.__table__), "id = :id", restore=True)),
+            {"id": id},
+        )
+        if result.first() is None:
+            await db.rollback()
+            return False
+        await cls.restore_posts(db, id)
+        await db.commit()
+        return True
+
+
+class PostArchive(Base):
+    __tablename__ = "posts_archive"
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    title = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    blog_id = Column(UUID, nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False)
+    is_deleted = Column(Boolean)
+    deleted_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    @classmethod
+    async def find_by_id(cls, db: AsyncSession, id: UUID):
+        query = select(cls).where(cls.id == id)
+        result = await db.execute(query)
+        return result.scalars().first()
+
+    @classmethod
+    async def archive_batch(cls, db: AsyncSession, cutoff: datetime, batch_size: int) -> int:
+        """Move up to batch_size posts deleted before cutoff in one transaction"""
+        ids = await _lock_ids(db, "posts", cutoff, batch_size)
+        if ids:
+            await db.execute(
+                text(_move_sql("posts", "posts_archive", _columns(cls.__table__), "id = ANY(:ids)")),
+                {"ids": ids},
+            )
+        await db.commit()
+        return len(ids)
+
+    @classmethod
+    async def restore(cls, db: AsyncSession, id: UUID) -> bool:
+        """Move a post back to the live table; its blog must be live"""
+        result = await db.execute(
+            text(_move_sql("posts_archive", "posts", _columns(cls.__table__), "id = :id", restore=True)),
+            {"id": id},
+        )
+        if result.first() is None:
+            await db.rollback()
+            return False
+        await db.commit()
+        return True
@@ -3,24 +3,49 @@ from datetime import datetime
 from uuid import uuid4
 
 from sqlalchemy import (
-    Column, String, Integer, Boolean, Float, DateTime, UUID,
-    ForeignKey, CheckConstraint,
-    func,
-    select, and_, delete, update
+    Column, String, Integer, BigInteger, Boolean, Float, DateTime, UUID,
+    ForeignKey, CheckConstraint, Index,
+    func, text,
+    select, and_, delete, update, tuple_
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import Base
+from app.core.sync import CHANGE_SEQ
+from app.core.loader import load
 from app.models.user import User
+from app.models.archive import BlogArchive
 
 class Blog(Base):
     __tablename__ = "blogs"
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, default=uuid4)
+    __table_args__ = (
+        # Serves find_all_by_username/find_all_by_email and check_availability
+        Index(
+            "ix_blogs_created_by_title_live", "created_by", "title",
+            postgresql_where=text("is_deleted IS false"),
+        ),
+        # Lets the archive job find expired soft-deleted rows
+        Index(
+            "ix_blogs_deleted_at", "deleted_at",
+            postgresql_where=text("is_deleted IS true"),
+        ),
+        # GET /api/sync: a user's blogs changed after a cursor
+        Index("ix_blogs_created_by_change_seq", "created_by", "change_seq", "id"),
+    )
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
     title = Column(String, unique=True, index=True, nullable=False)
     created_by = Column(UUID, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
     is_deleted = Column(Boolean, default=False)
+    deleted_at = Column(DateTime, nullable=True)
+
+    # Maintained by the posts_counters trigger, repaired by app/jobs/reconcile.py
+    post_count = Column(Integer, nullable=False, server_default="0")
+    last_post_at = Column(DateTime, nullable=True)
+
+    # Bumped by every write through the model, not by the counter triggers
+    change_seq = Column(BigInteger, nullable=False, server_default=CHANGE_SEQ, onupdate=CHANGE_SEQ)
     
     # Define the relationship using string names
     posts = relationship("Post", foreign_keys="Post.blog_id")
@@ -35,9 +60,7 @@ class Blog(Base):
     
     @classmethod
     async def find_by_id(cls, db: AsyncSession, id: UUID):
-        query = select(cls).where(cls.id== id)
-        result = await db.execute(query)
-        return result.scalars().first()
+        return await load(db, cls.id, id)
             
     @classmethod
     async def find_all_by_username(cls, db: AsyncSession, username: str):
@@ -67,7 +90,24 @@ class Blog(Base):
         await db.commit()
         await db.refresh(blog)
         return blog
-    
+
+    @classmethod
+    async def patch_if_version(cls, db: AsyncSession, id: UUID, created_by: UUID, version: int, **kwargs):
+        """
+        Write kwargs to the user's live blog in one conditional UPDATE, only if
+        it is still at `version` (its change_seq). Returns the updated row, or
+        None if no row matched, without committing: that would expire the
+        objects the caller loaded.
+        """
+        query = update(cls).where(
+            cls.id == id, cls.created_by == created_by, cls.change_seq == version, cls.is_deleted.is_(False)
+        ).values(**kwargs).returning(*cls.__table__.columns).execution_options(synchronize_session=False)
+        result = await db.execute(query)
+        # Read before the commit, it closes the result
+        blog = result.mappings().first()
+        if blog is not None:
+            await db.commit()
+        return blog
 
     @classmethod
     async def delete(cls, db: AsyncSession, id: UUID) -> Optional["Blog"]:
@@ -78,10 +118,37 @@ class Blog(Base):
 
         # Refresh the blog object
         blog.is_deleted = True
+        blog.deleted_at = datetime.utcnow()
         await db.commit()
         await db.refresh(blog)
         return blog
     
+    @classmethod
+    async def restore(cls, db: AsyncSession, id: UUID) -> Optional["Blog"]:
+        # Undo a soft delete that has not been archived yet
+        blog = await cls.find_by_id(db, id)
+        if blog is None:
+            return None
+
+        blog.is_deleted = False
+        blog.deleted_at = None
+        # The archive job may have moved some of its posts already
+        await BlogArchive.restore_posts(db, id)
+        await db.commit()
+        await db.refresh(blog)
+        return blog
+
+    @classmethod
+    async def find_changes(
+        cls, db: AsyncSession, created_by: UUID, after: tuple[int, UUID] | None, horizon: int, limit: int
+    ) -> List["Blog"]:
+        """The user's blogs, soft-deleted ones included, written after `after` by transactions below horizon"""
+        query = select(cls).where(cls.created_by == created_by, cls.change_seq < horizon)
+        if after is not None:
+            query = query.where(tuple_(cls.change_seq, cls.id) > tuple_(*after))
+        result = await db.execute(query.order_by(cls.change_seq, cls.id).limit(limit))
+        return result.scalars().all()
+
     @classmethod
     async def check_availability(cls, db: AsyncSession, created_by: UUID, title: str):
         query = select(cls).where(and_(cls.created_by == created_by, cls.title == title, cls.is_deleted.is_(False)))
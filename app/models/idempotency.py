@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from sqlalchemy import Column, String, Integer, DateTime, select, delete, update, func, tuple_
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import Base
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotencykeys"
+
+    scope = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    # NULL while the first request is still running
+    status_code = Column(Integer, nullable=True)
+    response = Column(JSONB, nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    @classmethod
+    async def claim(cls, db: AsyncSession, scope: str, key: str, fingerprint: str, now: datetime, expires_at: datetime):
+        """Claim the key for this request; returns the existing row if it is held and not expired"""
+        query = insert(cls).values(scope=scope, key=key, fingerprint=fingerprint, expires_at=expires_at)
+        query = query.on_conflict_do_update(
+            index_elements=[cls.scope, cls.key],
+            set_={
+                "fingerprint": fingerprint,
+                "expires_at": expires_at,
+                "status_code": None,
+                "response": None,
+                "created_at": now,
+            },
+            # Expired but not swept yet: take it over
+            where=cls.expires_at < now,
+        ).returning(cls.key)
+        claimed = (await db.execute(query)).first() is not None
+        await db.commit()
+        if claimed:
+            return None
+        return await cls.find(db, scope=scope, key=key)
+
+    @classmethod
+    async def find(cls, db: AsyncSession, scope: str, key: str):
+        query = select(cls).where(cls.scope == scope, cls.key == key)
+        result = await db.execute(query)
+        return result.scalars().first()
+
+    @classmethod
+    async def complete(cls, db: AsyncSession, scope: str, key: str, status_code: int, response: dict):
+        query = (
+            update(cls)
+            .where(cls.scope == scope, cls.key == key)
+            .values(status_code=status_code, response=response)
+        )
+        await db.execute(query)
+        await db.commit()
+
+    @classmethod
+    async def release(cls, db: AsyncSession, scope: str, key: str):
+        query = delete(cls).where(cls.scope == scope, cls.key == key, cls.status_code.is_(None))
+        await db.execute(query)
+        await db.commit()
+
+    @classmethod
+    async def delete_expired(cls, db: AsyncSession, now: datetime, batch_size: int) -> int:
+        expired = (
+            select(cls.scope, cls.key)
+            .where(cls.expires_at < now)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        query = delete(cls).where(tuple_(cls.scope, cls.key).in_(expired))
+        result = await db.execute(query)
+        await db.commit()
+        return result.rowcount
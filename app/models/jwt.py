@@ -1,14 +1,17 @@
 from sqlalchemy import Column, String, DateTime, Boolean, ForeignKey, select, func, UUID
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
 from uuid import uuid4
 from . import Base
+from app.core import sharedcache
 
 
 
 class BlackListToken(Base):
     __tablename__ = "blacklisttokens"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, default=uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
     expire = Column(DateTime, nullable=False)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
 
@@ -21,12 +24,37 @@ class BlackListToken(Base):
         await db.refresh(token)
         return token
     
+    @classmethod
+    async def create_many(cls, db: AsyncSession, tokens: list[dict]):
+        """Blacklist several tokens with one insert and one commit; already blacklisted ones are skipped"""
+        await db.execute(insert(cls).values(tokens).on_conflict_do_nothing(index_elements=[cls.id]))
+        await db.commit()
+        # Every worker of this host refuses them from now on
+        for token in tokens:
+            ttl = (token["expire"] - datetime.utcnow()).total_seconds()
+            sharedcache.revoked_tokens.put(str(token["id"]), True, max(ttl, 0))
+
     @classmethod
     async def find_by_id(cls, db: AsyncSession, id: UUID):
         query = select(cls).where(cls.id == id)
         result = await db.execute(query)
         return result.scalars().first()
 
+    @classmethod
+    async def is_revoked(cls, db: AsyncSession, id: UUID, expire: datetime) -> bool:
+        """
+        Through the host-wide shared cache, which only holds revocations:
+        a token found revoked stays so until it expires, any other is looked
+        up again, so a logout on another host counts at once.
+        """
+        if sharedcache.revoked_tokens.get(str(id)):
+            return True
+        revoked = await cls.find_by_id(db, id) is not None
+        if revoked:
+            ttl = (expire - datetime.utcnow()).total_seconds()
+            sharedcache.revoked_tokens.put(str(id), True, max(ttl, 0))
+        return revoked
+
     @classmethod
     async def patch(cls, db: AsyncSession, id: UUID, **kwargs):
         # Fetch the user from the database
@@ -3,26 +3,57 @@ from datetime import datetime
 from uuid import uuid4
 
 from sqlalchemy import (
-    Column, String, Integer, Boolean, Float, DateTime, UUID,
-    ForeignKey, CheckConstraint,
-    func,
-    select, and_, delete, update
+    Column, String, Integer, BigInteger, Boolean, Float, DateTime, UUID,
+    ForeignKey, CheckConstraint, Index,
+    func, text,
+    select, and_, delete, update, tuple_
 )
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship, deferred, undefer
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import Base
+from app.core.config import POST_EXCERPT_LENGTH
+from app.core.database import find_first
+from app.core.sync import CHANGE_SEQ
+from app.core.loader import load
+from app.core.feed import notify_new_post
 from app.models.blog import Blog
 from app.models.user import User
 
 class Post(Base):
     __tablename__ = "posts"
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, default=uuid4)
-    title = Column(String, unique=True, index=True, nullable=False)
-    body = Column(String, nullable=False)
-    blog_id = Column(UUID, ForeignKey("blogs.id"), nullable=False)
+    __table_args__ = (
+        # Per-blog lookups of find_all_by_username, find_all_titles_by_blog
+        # and check_availability; a title is taken once per blog among live posts
+        Index(
+            "ix_posts_blog_id_title_live", "blog_id", "title",
+            unique=True,
+            postgresql_where=text("is_deleted IS false"),
+        ),
+        # Lets the archive job find expired soft-deleted rows
+        Index(
+            "ix_posts_deleted_at", "deleted_at",
+            postgresql_where=text("is_deleted IS true"),
+        ),
+        # GET /api/sync: posts of a user's blogs changed after a cursor
+        Index("ix_posts_blog_id_change_seq", "blog_id", "change_seq", "id"),
+        # Hash partitions, created by the migration: queries of one blog read
+        # one partition, lookups by id probe each of them
+        {"postgresql_partition_by": "HASH (blog_id)"},
+    )
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    title = Column(String, nullable=False)
+    # Not loaded with the row: lists select an excerpt instead, see
+    # find_all_by_username. Loaded by find_with_body and after writes.
+    body = deferred(Column(String, nullable=False), raiseload=True)
+    # Partition key, so it is part of the primary key
+    blog_id = Column(UUID, ForeignKey("blogs.id"), primary_key=True)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
     is_deleted = Column(Boolean, default=False)
+    deleted_at = Column(DateTime, nullable=True)
+
+    # Bumped by every write through the model
+    change_seq = Column(BigInteger, nullable=False, server_default=CHANGE_SEQ, onupdate=CHANGE_SEQ)
     
     # Define the relationship using string names
     #blog = relationship("Blog", back_populates="posts")
@@ -31,26 +62,45 @@ class Post(Base):
     async def create(cls, db: AsyncSession, **kwargs):
         new_post = cls(**kwargs)
         db.add(new_post)
+        await db.flush()
+        blog = await Blog.find_by_id(db, new_post.blog_id)
+        await notify_new_post(db, new_post, created_by=blog.created_by)
         await db.commit()
-        await db.refresh(new_post)
+        await cls._refresh(db, new_post)
         return new_post
+
+    @classmethod
+    async def _refresh(cls, db: AsyncSession, post: "Post"):
+        # refresh() skips deferred columns unless they are named
+        await db.refresh(post, attribute_names=[column.key for column in cls.__mapper__.column_attrs])
     
     @classmethod
     async def find_by_id(cls, db: AsyncSession, id: UUID):
-        query = select(cls).where(cls.id== id)
-        result = await db.execute(query)
-        return result.scalars().first()
+        # Without body, use find_with_body to return the whole post
+        return await load(db, cls.id, id)
+
+    @classmethod
+    async def find_with_body(cls, db: AsyncSession, id: UUID):
+        query = select(cls).options(undefer(cls.body)).where(cls.id == id)
+        return await find_first(db, query)
             
     @classmethod
-    async def find_all_by_username(cls, db: AsyncSession, username: str):
+    async def find_all_by_username(cls, db: AsyncSession, username: str, excerpt_length: int = POST_EXCERPT_LENGTH):
+        """Posts of the user's live blogs, with the first excerpt_length characters of body and its length"""
         user = await User.find_by_username(db, username=username)
-        query = select(cls).join(Blog).where(and_(Blog.created_by == user.id, cls.is_deleted.is_(False)))
+        query = select(
+            cls.id, cls.title, cls.blog_id, cls.created_at, cls.is_deleted,
+            func.left(cls.body, excerpt_length).label("excerpt"),
+            func.char_length(cls.body).label("body_length"),
+        ).join(Blog).where(
+            and_(Blog.created_by == user.id, Blog.is_deleted.is_(False), cls.is_deleted.is_(False))
+        )
         result = await db.execute(query)
-        return result.scalars().all()
+        return result.all()
         
     @classmethod
     async def find_all_titles_by_blog(cls, db: AsyncSession, blog_id: UUID) -> List[str]:
-        query = select(cls.title).where(cls.blog_id == blog_id)
+        query = select(cls.title).where(and_(cls.blog_id == blog_id, cls.is_deleted.is_(False)))
         result = await db.execute(query)
         return result.scalars().all() or ["No Posts"]
             
@@ -66,9 +116,28 @@ class Post(Base):
             setattr(post, key, value)
 
         await db.commit()
-        await db.refresh(post)
+        await cls._refresh(db, post)
+        return post
+
+    @classmethod
+    async def patch_if_version(cls, db: AsyncSession, id: UUID, created_by: UUID, version: int, **kwargs):
+        """
+        Write kwargs to the live post, of a live blog of the user, in one
+        conditional UPDATE, only if it is still at `version` (its change_seq).
+        Returns the updated row with body, or None if no row matched, without
+        committing: that would expire the objects the caller loaded. A title
+        taken in the blog raises IntegrityError (ix_posts_blog_id_title_live).
+        """
+        blog_ids = select(Blog.id).where(Blog.created_by == created_by, Blog.is_deleted.is_(False))
+        query = update(cls).where(
+            cls.id == id, cls.blog_id.in_(blog_ids), cls.change_seq == version, cls.is_deleted.is_(False)
+        ).values(**kwargs).returning(*cls.__table__.columns).execution_options(synchronize_session=False)
+        result = await db.execute(query)
+        # Read before the commit, it closes the result
+        post = result.mappings().first()
+        if post is not None:
+            await db.commit()
         return post
-    
 
     @classmethod
     async def delete(cls, db: AsyncSession, id: UUID) -> Optional["Blog"]:
@@ -79,10 +148,36 @@ class Post(Base):
 
         # Refresh the post object
         post.is_deleted = True
+        post.deleted_at = datetime.utcnow()
         await db.commit()
-        await db.refresh(post)
+        await cls._refresh(db, post)
         return post
     
+    @classmethod
+    async def restore(cls, db: AsyncSession, id: UUID) -> Optional["Post"]:
+        # Undo a soft delete that has not been archived yet
+        post = await cls.find_by_id(db, id)
+        if post is None:
+            return None
+
+        post.is_deleted = False
+        post.deleted_at = None
+        await db.commit()
+        await cls._refresh(db, post)
+        return post
+
+    @classmethod
+    async def find_changes(
+        cls, db: AsyncSession, created_by: UUID, after: tuple[int, UUID] | None, horizon: int, limit: int
+    ) -> List["Post"]:
+        """Posts of the user's blogs, soft-deleted ones included, written after `after` by transactions below horizon"""
+        blog_ids = select(Blog.id).where(Blog.created_by == created_by).scalar_subquery()
+        query = select(cls).options(undefer(cls.body)).where(cls.blog_id.in_(blog_ids), cls.change_seq < horizon)
+        if after is not None:
+            query = query.where(tuple_(cls.change_seq, cls.id) > tuple_(*after))
+        result = await db.execute(query.order_by(cls.change_seq, cls.id).limit(limit))
+        return result.scalars().all()
+
     @classmethod
     async def check_availability(cls, db: AsyncSession, blog_id: UUID, title: str):
         query = select(cls).where(and_(cls.blog_id == blog_id, cls.title == title, cls.is_deleted.is_(False)))
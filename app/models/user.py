@@ -1,61 +1,145 @@
 from uuid import uuid4
-from sqlalchemy import Column, String, select, DateTime, Boolean, func, ForeignKey, UUID
+from sqlalchemy import Column, String, Integer, SmallInteger, select, update, DateTime, Boolean, func, ForeignKey, UUID
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy import inspect
 
 from . import Base
-from app.utils.hash import verify_password,hash_password
+from app.core.database import sessionmanager, PRIMARY_SHARD
+from app.core.bloom import availability
+from app.core.config import SHARED_CACHE_TTL_SECONDS
+from app.core import sharedcache
+from app.core.feed import notify_users_changed
+from app.core.loader import load
+from app.utils.hash import hash_password, verify_and_update
 
 
 class User(Base):
     __tablename__ = "users"
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, default=uuid4)
-    username = Column(String, index=True, nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    username = Column(String, unique=True, index=True, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     first_name = Column(String, nullable=True)
     last_name = Column(String, nullable=True)
 
     password = Column(String, nullable=False)
 
-    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    # Indexed for the username/email filter refresh, see app/core/bloom.py
+    created_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
     is_disabled = Column(Boolean, default=True)
     is_superuser = Column(Boolean, default=False)
+    # Embedded in issued tokens; bumping it revokes all of them at once
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # Maintained by the blogs_counters/posts_counters triggers, repaired by app/jobs/reconcile.py
+    blog_count = Column(Integer, nullable=False, server_default="0")
+    post_count = Column(Integer, nullable=False, server_default="0")
+    last_post_at = Column(DateTime, nullable=True)
+
+    # Database holding the user's blogs and posts, see app/core/database.py.
+    # On that shard the user has an anchor row for foreign keys and counters.
+    shard = Column(SmallInteger, nullable=False, default=PRIMARY_SHARD, server_default="0")
 
     blogs = relationship("Blog", foreign_keys="Blog.created_by")
     
     @classmethod
     async def create(cls, db: AsyncSession, **kwargs):
         new_user = cls(**kwargs)
+        new_user.id = new_user.id or uuid4()
+        new_user.shard = sessionmanager.shard_for_new_user(new_user.id)
         new_user.password = hash_password(new_user.password)
         db.add(new_user)
+        if new_user.shard != PRIMARY_SHARD:
+            await cls.add_anchor(db, new_user, shard=new_user.shard)
         await db.commit()
         await db.refresh(new_user)
+        availability.add(new_user.username, new_user.email)
         return new_user
         
+    @classmethod
+    async def add_anchor(cls, db: AsyncSession, user: "User", shard: int):
+        """Minimal copy of the user on a shard; it cannot log in, auth always reads the primary"""
+        query = insert(cls).values(
+            id=user.id, username=user.username, email=user.email, password="!",
+            created_at=user.created_at or func.now(), is_disabled=True, is_superuser=False, shard=shard,
+        ).on_conflict_do_nothing()
+        await db.execute(query, bind_arguments={"shard_id": shard})
+
+    @classmethod
+    async def find_counters(cls, db: AsyncSession, user: "User") -> "User":
+        """The row whose blog/post counters are maintained: the user itself or its anchor on its shard"""
+        if user.shard == PRIMARY_SHARD:
+            # The triggers keep them current in the database, not in the shared cache
+            await db.refresh(user, attribute_names=["blog_count", "post_count", "last_post_at"])
+            return user
+        query = select(cls).where(cls.id == user.id)
+        result = await db.execute(query, bind_arguments={"shard_id": user.shard})
+        return result.scalars().first() or user
+
     @classmethod
     async def find_by_id(cls, db: AsyncSession, id:UUID):
-        query = select(cls).where(cls.id == id)
-        result = await db.execute(query)
-        return result.scalars().first()
+        return await load(db, cls.id, id)
             
     @classmethod
     async def find_by_username(cls, db: AsyncSession, username: str):
-        query = select(cls).where(cls.username == username)
-        result = await db.execute(query)
-        return result.scalars().first()
+        """
+        Served from the host-wide shared cache when possible: the row is
+        attached to the session without a query and can be updated as usual.
+        Writes to users must go through methods that call _invalidate and,
+        before committing, notify_users_changed for the other hosts.
+        """
+        cached = sharedcache.users.get(username)
+        if cached is not None:
+            # Users are loaded from the primary, keyed with its shard id
+            key = identity_key(cls, cached["id"], identity_token=PRIMARY_SHARD)
+            existing = db.sync_session.identity_map.get(key)
+            if existing is not None:
+                return existing
+            user = cls(**cached)
+            make_transient_to_detached(user)
+            inspect(user).key = key
+            db.add(user)
+            return user
+
+        version = sharedcache.users.version(username)
+        user = await load(db, cls.username, username)
+        if user is not None and not inspect(user).unloaded:
+            row = {column.key: getattr(user, column.key) for column in cls.__mapper__.column_attrs}
+            sharedcache.users.put(username, row, SHARED_CACHE_TTL_SECONDS, version=version)
+        return user
+
+    @staticmethod
+    def _invalidate(*usernames: str | None):
+        """Drop cached rows after a committed write, on every worker of this host"""
+        for username in usernames:
+            if username is not None:
+                sharedcache.users.invalidate(username)
         
     @classmethod
     async def find_by_email(cls, db: AsyncSession, email: str):
-        query = select(cls).where(cls.email == email)
-        result = await db.execute(query)
-        return result.scalars().first()
+        return await load(db, cls.email, email)
 
     @classmethod
     async def authenticate(cls, db: AsyncSession, username: str, password: str):
-        user = await cls.find_by_username(db=db, username=username)
-        if not user or not verify_password(password, user.password):
+        # Not from the shared cache: a password changed on another host counts at once
+        user = await load(db, cls.username, username)
+        if not user:
+            return False
+        verified, new_hash = verify_and_update(password, user.password)
+        if not verified:
             return False
+        if new_hash:
+            # Hashed with another cost: store the current one. Skipped if the
+            # password was changed in the meantime.
+            query = update(cls).where(cls.id == user.id, cls.password == user.password).values(password=new_hash)
+            await db.execute(query)
+            await notify_users_changed(db, username)
+            await db.commit()
+            cls._invalidate(username)
+            await db.refresh(user)
         return user
         
     @classmethod
@@ -69,7 +153,9 @@ class User(Base):
         for key, value in kwargs.items():
             setattr(user, key, value)
 
+        await notify_users_changed(db, username, kwargs.get("username"))
         await db.commit()
+        cls._invalidate(username, kwargs.get("username"))
         await db.refresh(user)
         return user
     
@@ -82,7 +168,9 @@ class User(Base):
 
         # Set is_disabled to True and update the database
         user.is_disabled = True
+        await notify_users_changed(db, username)
         await db.commit()
+        cls._invalidate(username)
         await db.refresh(user)
         return user
     
@@ -95,6 +183,25 @@ class User(Base):
 
         # Set is_disabled to True and update the database
         user.is_superuser = True
+        await notify_users_changed(db, username)
         await db.commit()
+        cls._invalidate(username)
         await db.refresh(user)
         return user
+
+    @classmethod
+    async def set_shard(cls, db: AsyncSession, id: UUID, shard: int):
+        query = update(cls).where(cls.id == id).values(shard=shard).returning(cls.username)
+        username = (await db.execute(query)).scalar()
+        await notify_users_changed(db, username)
+        await db.commit()
+        cls._invalidate(username)
+
+    @classmethod
+    async def revoke_tokens(cls, db: AsyncSession, id: UUID):
+        # Single atomic update, concurrent revocations can't get lost
+        query = update(cls).where(cls.id == id).values(token_version=cls.token_version + 1).returning(cls.username)
+        username = (await db.execute(query)).scalar()
+        await notify_users_changed(db, username)
+        await db.commit()
+        cls._invalidate(username)
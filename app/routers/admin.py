@@ -0,0 +1,34 @@
+from typing import List
+
+from fastapi import APIRouter
+
+from app.models.user import User
+
+from app.schemas.admin import SlowQuery
+
+from app.core.exceptions import AuthFailedException, ForbiddenException
+from app.core.database import DBSessionDep, UnitOfWorkRoute
+from app.core.slowquery import slow_queries
+from app.core.jwt import decode_access_token, SUB
+
+router = APIRouter(
+    prefix="/api/admin",
+    tags=["admin"],
+    responses={404: {"description": "Not found"}},
+    route_class=UnitOfWorkRoute,
+)
+
+
+@router.get("/slow-queries", response_model=List[SlowQuery])
+async def slow_query_list(
+    token: str,
+    db: DBSessionDep,
+):
+    payload = await decode_access_token(token=token, db=db)
+    user = await User.find_by_username(db=db, username=payload[SUB])
+    if not user:
+        raise AuthFailedException()
+    if not user.is_superuser:
+        raise ForbiddenException()
+    # This worker's slow statements, latest first
+    return slow_queries.snapshot()
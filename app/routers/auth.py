@@ -1,15 +1,19 @@
 from typing import Annotated, Any, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Response, Depends, Cookie, BackgroundTasks, HTTPException
+from fastapi import APIRouter, Response, Depends, Cookie, BackgroundTasks, HTTPException, Header
 from fastapi.exceptions import RequestValidationError
 from fastapi.security import OAuth2PasswordRequestForm
 
 from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
 
 
-from app.core.database import DBSessionDep
+from app.core.bloom import availability
+from app.core.database import DBSessionDep, UnitOfWorkRoute, no_db
 from app.core.exceptions import BadRequestException, ForbiddenException, NotFoundException
+from app.core.groupcommit import blacklist
+from app.core.idempotency import idempotency
 from app.core.jwt import (
     mail_token,
     create_token_pair,
@@ -23,7 +27,7 @@ from app.core.jwt import (
 from app.utils.mail import user_mail_event
 from app.utils.hash import hash_password, verify_password
 
-from app.models import User, BlackListToken
+from app.models import User
 
 from app.schemas.user import (
     User as UserSchema,
@@ -33,6 +37,7 @@ from app.schemas.user import (
     PasswordResetSchema,
     PasswordUpdateSchema,
     OldPasswordErrorSchema,
+    Availability as AvailabilitySchema,
 )
 from app.schemas.jwt import JwtTokenSchema, SuccessResponseScheme
 from app.schemas.mail import MailBodySchema, EmailSchema, MailTaskSchema
@@ -43,6 +48,7 @@ router = APIRouter(
     prefix="/api/auth",
     tags=["authentication"],
     responses={404: {"description": "Not found"}},
+    route_class=UnitOfWorkRoute,
 )
 
 
@@ -51,32 +57,64 @@ async def register(
     data: UserRegister,
     bg_task: BackgroundTasks,
     db: DBSessionDep,
-):    
-    # check if email already registered
-    user = await User.find_by_email(db=db, email=data.email)
-    if user:
-        raise HTTPException(status_code=400, detail="Email already registered")    
-    # check if username taken
-    user = await User.find_by_username(db=db, username=data.username)
-    if user:
-        raise HTTPException(status_code=400, detail="Username is not available, please try a new one.")
-    
-    # save user to db
-    user_data = data.model_dump(exclude={"confirm_password"})
-    user = User(**user_data)
-    await user.create(db=db, **user_data)
-
-    # send verify email
-    user = await User.find_by_username(db=db, username=data.username)
-    user_schema = UserSchema.model_validate(user.__dict__)
-    verify_token = mail_token(user_schema)
-
-    mail_task_data = MailTaskSchema(
-        user=user_schema, body=MailBodySchema(type="verify", token=verify_token)
-    )
-    bg_task.add_task(user_mail_event, mail_task_data)
+    idempotency_key: Annotated[str | None, Header()] = None,
+):
+    async with idempotency(db, key=idempotency_key, scope="register", payload=data) as idempotent:
+        if idempotent.replay:
+            return idempotent.replay
+
+        # check if email already registered, the filter rules out most new ones without a query
+        if availability.maybe_taken_email(data.email) and await User.find_by_email(db=db, email=data.email):
+            raise HTTPException(status_code=400, detail="Email already registered")
+        # check if username taken
+        if availability.maybe_taken_username(data.username) and await User.find_by_username(db=db, username=data.username):
+            raise HTTPException(status_code=400, detail="Username is not available, please try a new one.")
+
+        # save user to db
+        user_data = data.model_dump(exclude={"confirm_password"})
+        try:
+            user = await User.create(db=db, **user_data)
+        except IntegrityError:
+            # Taken on another worker since its last filter refresh
+            await db.rollback()
+            if await User.find_by_email(db=db, email=data.email):
+                raise HTTPException(status_code=400, detail="Email already registered")
+            raise HTTPException(status_code=400, detail="Username is not available, please try a new one.")
+
+        # send verify email
+        user_schema = UserSchema.model_validate(user.__dict__)
+        verify_token = mail_token(user)
 
-    return user_schema
+        mail_task_data = MailTaskSchema(
+            user=user_schema, body=MailBodySchema(type="verify", token=verify_token)
+        )
+        bg_task.add_task(user_mail_event, mail_task_data)
+
+        idempotent.save(user_schema)
+        return user_schema
+
+@router.get("/available", response_model=AvailabilitySchema)
+async def available(
+    db: DBSessionDep,
+    username: str | None = None,
+    email: str | None = None,
+):
+    if username is None and email is None:
+        raise BadRequestException(detail="username or email required")
+
+    # Only names the filters may have seen cost a query
+    result = AvailabilitySchema()
+    if username is not None:
+        result.username = not (
+            availability.maybe_taken_username(username)
+            and await User.find_by_username(db=db, username=username)
+        )
+    if email is not None:
+        result.email = not (
+            availability.maybe_taken_email(email)
+            and await User.find_by_email(db=db, email=email)
+        )
+    return result
 
 @router.get("/verify", response_model=SuccessResponseScheme)
 async def verify(
@@ -105,7 +143,6 @@ async def login(
     if user.is_disabled:
         raise ForbiddenException()
 
-    user = UserSchema.model_validate(user.__dict__)
     token_pair = create_token_pair(user=user)
 
     add_refresh_token_cookie(response=response, token=token_pair.refresh.token)
@@ -114,6 +151,7 @@ async def login(
 
 
 @router.post("/refresh")
+@no_db
 async def refresh(refresh: Annotated[str | None, Cookie()] = None):
     print(refresh)
     if not refresh:
@@ -129,12 +167,30 @@ async def logout(
 ):
     payload = await decode_access_token(token=token, db=db)
     token_data = {"id":payload[JTI], "expire":datetime.utcfromtimestamp(payload[EXP])}
-    black_listed = BlackListToken(id=payload[JTI], expire=datetime.utcfromtimestamp(payload[EXP]))
-    await black_listed.create(db=db, **token_data)
+    # The batch is written on a connection of its own; return this one first
+    await db.close()
+    # Returns once the batch holding this token is committed
+    await blacklist.submit(token_data)
 
     return {"msg": "Succesfully logout"}
 
 
+@router.post("/logout-all", response_model=SuccessResponseScheme)
+async def logout_all(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: DBSessionDep,
+):
+    payload = await decode_access_token(token=token, db=db)
+    user = await User.find_by_username(db=db, username=payload[SUB])
+    if not user:
+        raise NotFoundException(detail="User not found")
+
+    # One update instead of a blacklist row per outstanding token
+    await User.revoke_tokens(db=db, id=user.id)
+
+    return {"msg": "Succesfully logged out of all sessions"}
+
+
 @router.post("/forgot-password", response_model=SuccessResponseScheme)
 async def forgot_password(
     data: ForgotPasswordSchema,
@@ -146,7 +202,7 @@ async def forgot_password(
         return {"msg": "Email is not regestered in our database. Please check the email or register for a new account"}
     else:
         user_schema = UserSchema.model_validate(user.__dict__)
-        reset_token = mail_token(user_schema)
+        reset_token = mail_token(user)
 
         mail_task_data = MailTaskSchema(
             user=user_schema,
@@ -170,6 +226,8 @@ async def password_reset_token(
     username = user.username
     hashed_password = hash_password(data.password)
     await user.patch(db=db, username=username, password=hashed_password)
+    # Sign out every session that used the old password, reset link included
+    await User.revoke_tokens(db=db, id=user.id)
 
     return {"msg": "Password succesfully updated"}
 
@@ -194,6 +252,7 @@ async def password_update(
 
     hashed_password = hash_password(data.password)
     await user.patch(db=db, username=payload[SUB], password=hashed_password)
+    await User.revoke_tokens(db=db, id=user.id)
 
     return {"msg": "Successfully updated"}
 
@@ -1,18 +1,26 @@
 from typing import Annotated, Any, Optional
 import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, status, Path
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Header, Response
 from sqlalchemy import UUID
+from sqlalchemy.exc import IntegrityError
 
 from app.models.user import User
 from app.models.blog import Blog
 from app.models.post import Post
+from app.models.archive import BlogArchive
 
-from app.schemas.blog import Blog as BlogSchema, BlogCreate, BlogDetails, BlogsList
+from app.schemas.blog import Blog as BlogSchema, BlogCreate, BlogDetails, BlogPatch, BlogsList
 from app.schemas.post import PostsList
 
-from app.core.exceptions import AuthFailedException, BadRequestException, ForbiddenException, NotFoundException
-from app.core.database import DBSessionDep
+from app.core.exceptions import (
+    AuthFailedException, BadRequestException, ConflictException, ForbiddenException, NotFoundException,
+)
+from app.core.database import DBSessionDep, UnitOfWorkRoute, db_budget
+from app.core.config import DB_LIST_TIMEOUT_MS, DB_POINT_READ_TIMEOUT_MS
+from app.core.idempotency import idempotency
+from app.core.singleflight import shared_read
+from app.core.sync import etag, if_match_version
 from app.core.jwt import (
     mail_token,
     create_token_pair,
@@ -27,9 +35,11 @@ router = APIRouter(
     prefix="/api/blog",
     tags=["blogs"],
     responses={404: {"description": "Not found"}},
+    route_class=UnitOfWorkRoute,
 )
 
 @router.get("/", response_model=BlogsList)
+@db_budget(DB_LIST_TIMEOUT_MS)
 async def blog_list(
     #token: Annotated[str, Depends(oauth2_scheme)],
     token: str,
@@ -44,6 +54,7 @@ async def blog_list(
     return BlogsList(blogs=blogs)
 
 @router.post("/{id}", response_model=BlogDetails)
+@db_budget(DB_POINT_READ_TIMEOUT_MS)
 async def blog_details(
     token: str,
     db: DBSessionDep,
@@ -60,40 +71,92 @@ async def blog_details(
     except ValueError:
         raise BadRequestException
     
-    blog = await Blog.find_by_id(db=db, id=id)
-    if blog is None:
+    async def read(flight_db) -> BlogDetails | None:
+        blog = await Blog.find_by_id(db=flight_db, id=uuid_obj)
+        if blog is None:
+            return None
+        titles = await Post.find_all_titles_by_blog(db=flight_db, blog_id=blog.id)
+        return BlogDetails(blog=BlogSchema.model_validate(blog.__dict__), post_titles=titles)
+
+    # Concurrent requests for the same blog share one read
+    blog_details = await shared_read(db, ("blog_details", uuid_obj), read)
+    if blog_details is None:
         raise NotFoundException()
-    if blog.created_by != user.id:
+    if blog_details.blog.created_by != user.id:
         raise AuthFailedException()
-    
-    titles = await Post.find_all_titles_by_blog(db=db, blog_id=blog.id)
-
-    blog_schema = BlogSchema.model_validate(blog.__dict__)
-    blog_details = BlogDetails(blog=blog_schema, post_titles=titles)
     return blog_details
 
 @router.post("/create/", response_model=BlogSchema)
 async def create_blog(
     token: str,
     db: DBSessionDep,
-    data: BlogCreate
+    data: BlogCreate,
+    idempotency_key: Annotated[str | None, Header()] = None,
 ):
     payload = await decode_access_token(token=token, db=db)
     user = await User.find_by_username(db=db, username=payload[SUB])
     if not user:
         raise AuthFailedException()
-    
-    # Check if the blog title is available for the user
-    if not await Blog.check_availability(db=db, created_by=user.id, title=data.title):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Blog title already exists for the user")
 
-    blog_data = data.model_dump()
-    blog_data["created_by"] = user.id
-    blog = Blog(**blog_data)
+    async with idempotency(db, key=idempotency_key, scope=f"blog:{user.id}", payload=data) as idempotent:
+        if idempotent.replay:
+            return idempotent.replay
 
-    blog = await blog.create(db=db, **blog_data)
-    blog_schema = BlogSchema.model_validate(blog.__dict__)
-    return blog_schema
+        # Check if the blog title is available for the user
+        if not await Blog.check_availability(db=db, created_by=user.id, title=data.title):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Blog title already exists for the user")
+
+        blog_data = data.model_dump()
+        blog_data["created_by"] = user.id
+        blog = Blog(**blog_data)
+
+        blog = await blog.create(db=db, **blog_data)
+        blog_schema = BlogSchema.model_validate(blog.__dict__)
+        idempotent.save(blog_schema)
+        return blog_schema
+
+@router.patch("/{id}", response_model=BlogSchema)
+async def patch_blog(
+    token: str,
+    db: DBSessionDep,
+    data: BlogPatch,
+    response: Response,
+    id: str = Path(..., title="The ID of the blog to edit"),
+    if_match: Annotated[str | None, Header()] = None,
+):
+    payload = await decode_access_token(token=token, db=db)
+    user = await User.find_by_username(db=db, username=payload[SUB])
+    if not user:
+        raise AuthFailedException()
+    # Check if the provided ID is a valid UUID
+    try:
+        uuid_obj = uuid.UUID(id)
+    except ValueError:
+        raise BadRequestException
+    version = if_match_version(if_match)
+    changes = data.model_dump(exclude_none=True)
+    if not changes:
+        raise BadRequestException(detail="Nothing to update")
+
+    # One conditional UPDATE, no lock held between reading and writing
+    user_id = user.id
+    try:
+        blog = await Blog.patch_if_version(db=db, id=uuid_obj, created_by=user_id, version=version, **changes)
+    except IntegrityError:
+        await db.rollback()
+        raise BadRequestException(detail="Blog title already exists")
+
+    if blog is None:
+        # Nothing matched: find out why
+        current = await Blog.find_by_id(db=db, id=uuid_obj)
+        if current is None or current.is_deleted:
+            raise NotFoundException(detail="Blog not found")
+        if current.created_by != user_id:
+            raise ForbiddenException(detail="User not blog author")
+        raise ConflictException(detail="Blog changed since this version, fetch it again")
+
+    response.headers["ETag"] = etag(blog["change_seq"])
+    return BlogSchema.model_validate(dict(blog))
 
 @router.delete("/delete/{id}", response_model=None)
 async def delete_blog(
@@ -112,4 +175,44 @@ async def delete_blog(
     if not deleted_blog:
         raise NotFoundException(detail="Blog not found")
 
-    return {"message": "Blog deleted successfully"}
\ No newline at end of file
+    return {"message": "Blog deleted successfully"}
+
+@router.post("/restore/{id}", response_model=BlogSchema)
+async def restore_blog(
+    token: str,
+    db: DBSessionDep,
+    id: str = Path(..., title="The ID of the blog to restore"),
+):
+    payload = await decode_access_token(token=token, db=db)
+    user = await User.find_by_username(db=db, username=payload[SUB])
+    if not user:
+        raise AuthFailedException()
+    # Check if the provided ID is a valid UUID
+    try:
+        uuid_obj = uuid.UUID(id)
+    except ValueError:
+        raise BadRequestException
+
+    # Recently deleted blogs are still in the live table, older ones are archived
+    blog = await Blog.find_by_id(db=db, id=uuid_obj)
+    owner = blog.created_by if blog else None
+    if blog is None:
+        archived = await BlogArchive.find_by_id(db=db, id=uuid_obj)
+        if archived is None:
+            raise NotFoundException(detail="Blog not found")
+        owner = archived.created_by
+    if owner != user.id:
+        raise AuthFailedException()
+
+    try:
+        if blog is None:
+            await BlogArchive.restore(db=db, id=uuid_obj)
+            blog = await Blog.find_by_id(db=db, id=uuid_obj)
+        else:
+            blog = await Blog.restore(db=db, id=uuid_obj)
+    except IntegrityError:
+        await db.rollback()
+        raise BadRequestException(detail="Blog title already exists")
+
+    blog_schema = BlogSchema.model_validate(blog.__dict__)
+    return blog_schema
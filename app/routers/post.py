@@ -1,17 +1,28 @@
-from typing import Annotated, Any, Optional
+from typing import Annotated, Any, List, Optional
+import json
 import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, status, Path
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Header, Response
 from sqlalchemy import UUID
+from sqlalchemy.exc import IntegrityError
+from sse_starlette.sse import EventSourceResponse
 
 from app.models.user import User
 from app.models.post import Post
 from app.models.blog import Blog
+from app.models.archive import PostArchive
 
-from app.schemas.post import Post as PostSchema, PostCreate
+from app.schemas.post import Post as PostSchema, PostCreate, PostPatch, PostSummary
 
-from app.core.exceptions import AuthFailedException, BadRequestException, ForbiddenException, NotFoundException
-from app.core.database import DBSessionDep
+from app.core.exceptions import (
+    AuthFailedException, BadRequestException, ConflictException, ForbiddenException, NotFoundException,
+)
+from app.core.database import DBSessionDep, UnitOfWorkRoute, db_budget
+from app.core.config import FEED_PING_SECONDS, DB_LIST_TIMEOUT_MS, DB_POINT_READ_TIMEOUT_MS
+from app.core.feed import post_feed
+from app.core.idempotency import idempotency
+from app.core.singleflight import shared_read
+from app.core.sync import etag, if_match_version
 from app.core.jwt import (
     mail_token,
     create_token_pair,
@@ -26,9 +37,11 @@ router = APIRouter(
     prefix="/api/post",
     tags=["posts"],
     responses={404: {"description": "Not found"}},
+    route_class=UnitOfWorkRoute,
 )
 
-@router.get("/") #, response_model=PostSchema)
+@router.get("/", response_model=List[PostSummary])
+@db_budget(DB_LIST_TIMEOUT_MS)
 async def post_list(
     #token: Annotated[str, Depends(oauth2_scheme)],
     token: str,
@@ -43,6 +56,7 @@ async def post_list(
     return posts
 
 @router.post("/{id}", response_model=PostSchema)
+@db_budget(DB_POINT_READ_TIMEOUT_MS)
 async def post_details(
     token: str,
     db: DBSessionDep,
@@ -57,7 +71,12 @@ async def post_details(
         uuid_obj = uuid.UUID(id)
     except ValueError:
         raise BadRequestException
-    post = await Post.find_by_id(db=db, id=id)
+    async def read(flight_db) -> PostSchema | None:
+        post = await Post.find_with_body(db=flight_db, id=uuid_obj)
+        return None if post is None else PostSchema.model_validate(post)
+
+    # Concurrent requests for the same post share one read
+    post = await shared_read(db, ("post_details", uuid_obj), read)
     if post is None:
         raise NotFoundException
     return post
@@ -66,29 +85,90 @@ async def post_details(
 async def create_post(
     token: str,
     db: DBSessionDep,
-    data: PostCreate
+    data: PostCreate,
+    idempotency_key: Annotated[str | None, Header()] = None,
 ):
     payload = await decode_access_token(token=token, db=db)
     user = await User.find_by_username(db=db, username=payload[SUB])
     if not user:
         raise AuthFailedException()
-    
-    # Check if the user is the blog creator
-    blog = await Blog.find_by_id(db=db, id=data.blog_id)
 
-    if not blog:
-        raise NotFoundException(detail="Blog not found")
-    if blog.created_by != user.id:
-        raise AuthFailedException(detail="User not blog author")
+    async with idempotency(db, key=idempotency_key, scope=f"post:{user.id}", payload=data) as idempotent:
+        if idempotent.replay:
+            return idempotent.replay
 
-    # Create the post in the database
-    post_data = data.model_dump()
-    post_data["blog_id"] = blog.id
-    post = Post(**post_data)
-    post = await post.create(db=db, **post_data)
+        # Check if the user is the blog creator
+        blog = await Blog.find_by_id(db=db, id=data.blog_id)
 
-    post_schema = PostSchema.model_validate(post.__dict__)
-    return post_schema
+        if not blog:
+            raise NotFoundException(detail="Blog not found")
+        if blog.created_by != user.id:
+            raise ForbiddenException(detail="User not blog author")
+
+        # Check if the post title is available in the blog
+        if not await Post.check_availability(db=db, blog_id=blog.id, title=data.title):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Post title already exists in the blog")
+
+        # Create the post in the database
+        post_data = data.model_dump()
+        post_data["blog_id"] = blog.id
+        post = Post(**post_data)
+        try:
+            post = await post.create(db=db, **post_data)
+        except IntegrityError:
+            # Taken by a concurrent request since check_availability
+            await db.rollback()
+            raise BadRequestException(detail="Post title already exists in the blog")
+
+        post_schema = PostSchema.model_validate(post.__dict__)
+        idempotent.save(post_schema)
+        return post_schema
+
+@router.patch("/{id}", response_model=PostSchema)
+async def patch_post(
+    token: str,
+    db: DBSessionDep,
+    data: PostPatch,
+    response: Response,
+    id: str = Path(..., title="The ID of the post to edit"),
+    if_match: Annotated[str | None, Header()] = None,
+):
+    payload = await decode_access_token(token=token, db=db)
+    user = await User.find_by_username(db=db, username=payload[SUB])
+    if not user:
+        raise AuthFailedException()
+    # Check if the provided ID is a valid UUID
+    try:
+        uuid_obj = uuid.UUID(id)
+    except ValueError:
+        raise BadRequestException
+    version = if_match_version(if_match)
+    changes = data.model_dump(exclude_none=True)
+    if not changes:
+        raise BadRequestException(detail="Nothing to update")
+
+    # One conditional UPDATE, no lock held between reading and writing
+    user_id = user.id
+    try:
+        post = await Post.patch_if_version(db=db, id=uuid_obj, created_by=user_id, version=version, **changes)
+    except IntegrityError:
+        await db.rollback()
+        raise BadRequestException(detail="Post title already exists in the blog")
+
+    if post is None:
+        # Nothing matched: find out why
+        current = await Post.find_by_id(db=db, id=uuid_obj)
+        if current is None or current.is_deleted:
+            raise NotFoundException(detail="Post not found")
+        blog = await Blog.find_by_id(db=db, id=current.blog_id)
+        if blog is None or blog.is_deleted:
+            raise NotFoundException(detail="Blog not found")
+        if blog.created_by != user_id:
+            raise ForbiddenException(detail="User not blog author")
+        raise ConflictException(detail="Post changed since this version, fetch it again")
+
+    response.headers["ETag"] = etag(post["change_seq"])
+    return PostSchema.model_validate(dict(post))
 
 @router.delete("/delete/{id}", response_model=None)
 async def delete_post(
@@ -107,4 +187,88 @@ async def delete_post(
     if not deleted_post:
         raise NotFoundException(detail="Post not found")
 
-    return {"message": "Post deleted successfully"}
\ No newline at end of file
+    return {"message": "Post deleted successfully"}
+
+@router.post("/restore/{id}", response_model=PostSchema)
+async def restore_post(
+    token: str,
+    db: DBSessionDep,
+    id: str = Path(..., title="The ID of the post to restore"),
+):
+    payload = await decode_access_token(token=token, db=db)
+    user = await User.find_by_username(db=db, username=payload[SUB])
+    if not user:
+        raise AuthFailedException()
+    # Check if the provided ID is a valid UUID
+    try:
+        uuid_obj = uuid.UUID(id)
+    except ValueError:
+        raise BadRequestException
+
+    # Recently deleted posts are still in the live table, older ones are archived
+    post = await Post.find_by_id(db=db, id=uuid_obj)
+    source = post or await PostArchive.find_by_id(db=db, id=uuid_obj)
+    if source is None:
+        raise NotFoundException(detail="Post not found")
+
+    blog = await Blog.find_by_id(db=db, id=source.blog_id)
+    if blog is None or blog.is_deleted:
+        raise BadRequestException(detail="Restore the blog first")
+    if blog.created_by != user.id:
+        raise AuthFailedException()
+
+    try:
+        if post is None:
+            await PostArchive.restore(db=db, id=uuid_obj)
+            post = await Post.find_with_body(db=db, id=uuid_obj)
+        else:
+            post = await Post.restore(db=db, id=uuid_obj)
+    except IntegrityError:
+        await db.rollback()
+        raise BadRequestException(detail="Post title already exists in this blog")
+
+    post_schema = PostSchema.model_validate(post.__dict__)
+    return post_schema
+
+
+async def _feed_events(key: str):
+    async with post_feed.subscribe(key) as queue:
+        while True:
+            event = await queue.get()
+            if event is None:
+                # Fell too far behind, the client reconnects
+                break
+            yield {"event": "post", "id": event["id"], "data": json.dumps(event)}
+
+
+@router.get("/feed/blog/{id}")
+async def blog_feed(
+    token: str,
+    db: DBSessionDep,
+    id: str = Path(..., title="The ID of the blog to follow"),
+):
+    await decode_access_token(token=token, db=db)
+    # Check if the provided ID is a valid UUID
+    try:
+        uuid_obj = uuid.UUID(id)
+    except ValueError:
+        raise BadRequestException
+    blog = await Blog.find_by_id(db=db, id=uuid_obj)
+    if blog is None or blog.is_deleted:
+        raise NotFoundException(detail="Blog not found")
+
+    return EventSourceResponse(_feed_events(f"blog:{blog.id}"), ping=FEED_PING_SECONDS)
+
+
+@router.get("/feed/author/{username}")
+async def author_feed(
+    token: str,
+    db: DBSessionDep,
+    username: str = Path(..., title="The username of the author to follow"),
+):
+    await decode_access_token(token=token, db=db)
+    author = await User.find_by_username(db=db, username=username)
+    if not author:
+        raise NotFoundException(detail="User not found")
+
+    return EventSourceResponse(_feed_events(f"author:{author.id}"), ping=FEED_PING_SECONDS)
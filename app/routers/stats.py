@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+
+from app.models.user import User
+
+from app.schemas.stats import Stats
+
+from app.core.exceptions import NotFoundException
+from app.core.database import DBSessionDep, UnitOfWorkRoute, db_budget
+from app.core.config import DB_POINT_READ_TIMEOUT_MS
+from app.core.jwt import decode_access_token, SUB
+
+router = APIRouter(
+    prefix="/api/stats",
+    tags=["stats"],
+    responses={404: {"description": "Not found"}},
+    route_class=UnitOfWorkRoute,
+)
+
+
+@router.get("/me", response_model=Stats)
+@db_budget(DB_POINT_READ_TIMEOUT_MS)
+async def my_stats(
+    token: str,
+    db: DBSessionDep,
+):
+    payload = await decode_access_token(token=token, db=db)
+    user = await User.find_by_username(db=db, username=payload[SUB])
+    if not user:
+        raise NotFoundException(detail="User not found")
+    # Counter columns on the user row (on its shard), no scan of blogs or posts
+    counters = await User.find_counters(db=db, user=user)
+    return Stats.model_validate(counters)
@@ -0,0 +1,53 @@
+from typing import Optional
+
+from fastapi import APIRouter, Query
+
+from app.models.user import User
+from app.models.blog import Blog
+from app.models.post import Post
+
+from app.schemas.sync import SyncPage
+
+from app.core.exceptions import NotFoundException
+from app.core.database import DBSessionDep, UnitOfWorkRoute, db_budget
+from app.core.config import SYNC_PAGE_SIZE, DB_LIST_TIMEOUT_MS
+from app.core.sync import SyncCursor, sync_horizon
+from app.core.jwt import decode_access_token, SUB
+
+router = APIRouter(
+    prefix="/api/sync",
+    tags=["sync"],
+    responses={404: {"description": "Not found"}},
+    route_class=UnitOfWorkRoute,
+)
+
+
+@router.get("/", response_model=SyncPage)
+@db_budget(DB_LIST_TIMEOUT_MS)
+async def sync(
+    token: str,
+    db: DBSessionDep,
+    since: Optional[str] = None,
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=SYNC_PAGE_SIZE),
+):
+    payload = await decode_access_token(token=token, db=db)
+    user = await User.find_by_username(db=db, username=payload[SUB])
+    if not user:
+        raise NotFoundException(detail="User not found")
+
+    # Without a cursor (or after the user's data moved shard) everything is sent
+    cursor = SyncCursor.decode(since, shard=user.shard) if since else SyncCursor(shard=user.shard)
+    horizon = await sync_horizon(db)
+    blogs = await Blog.find_changes(db=db, created_by=user.id, after=cursor.blogs, horizon=horizon, limit=limit)
+    posts = await Post.find_changes(db=db, created_by=user.id, after=cursor.posts, horizon=horizon, limit=limit)
+
+    if blogs:
+        cursor.blogs = (blogs[-1].change_seq, blogs[-1].id)
+    if posts:
+        cursor.posts = (posts[-1].change_seq, posts[-1].id)
+    return SyncPage(
+        blogs=blogs,
+        posts=posts,
+        cursor=cursor.encode(),
+        has_more=len(blogs) == limit or len(posts) == limit,
+    )
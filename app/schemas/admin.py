@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from typing import Any, Optional
+from datetime import datetime
+
+
+class SlowQuery(BaseModel):
+    fingerprint: str
+    statement: str
+    # Parameter types, never values
+    parameters: Any
+    route: Optional[str] = None
+    shard: int
+    duration_ms: float
+    at: datetime
+    # EXPLAIN (FORMAT JSON), null until it has run or when disabled
+    plan: Any = None
+    # "statement_timeout" when the database cancelled it
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, UUID4, validator, EmailStr
+from pydantic import AliasChoices, BaseModel, Field, UUID4, validator, EmailStr
 from typing import Any, Optional, List
 from datetime import datetime
 
@@ -10,6 +10,8 @@ class Blog(BlogBase):
     created_by: UUID4
     created_at: datetime
     is_deleted: bool
+    # change_seq, the ETag to send back in If-Match to PATCH it
+    version: int = Field(validation_alias=AliasChoices("change_seq", "version"))
 
     class Config:
         from_attributes = True
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, UUID4, validator, EmailStr
+from pydantic import AliasChoices, BaseModel, Field, UUID4, validator, EmailStr
 from typing import Any, Optional, List
 from datetime import datetime
 
@@ -11,6 +11,8 @@ class Post(PostBase):
     id: UUID4
     created_at: datetime
     is_deleted: bool
+    # change_seq, the ETag to send back in If-Match to PATCH it
+    version: int = Field(validation_alias=AliasChoices("change_seq", "version"))
 
     class Config:
         from_attributes = True
@@ -22,5 +24,18 @@ class PostPatch(BaseModel):
     title: Optional[str] = None
     body: Optional[str] = None
 
+class PostSummary(BaseModel):
+    id: UUID4
+    title: str
+    blog_id: UUID4
+    created_at: datetime
+    is_deleted: bool
+    excerpt: str
+    # Full length of body, in characters
+    body_length: int
+
+    class Config:
+        from_attributes = True
+
 class PostsList(BaseModel):
     posts: List[Post]
\ No newline at end of file
@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+
+class Stats(BaseModel):
+    blog_count: int
+    post_count: int
+    last_post_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
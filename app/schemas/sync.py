@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import List
+
+from app.schemas.blog import Blog
+from app.schemas.post import Post
+
+
+class SyncPage(BaseModel):
+    # Changed since the cursor, soft-deleted ones included (is_deleted)
+    blogs: List[Blog]
+    posts: List[Post]
+    # Pass back as `since` for the next page or the next sync
+    cursor: str
+    # More changes are waiting, fetch the next page right away
+    has_more: bool
@@ -44,6 +44,12 @@ class UserRegister(UserBase):
         return v
 
 
+class Availability(BaseModel):
+    # None when not asked for
+    username: Optional[bool] = None
+    email: Optional[bool] = None
+
+
 class UserLogin(BaseModel):
     username: str
     password: str
@@ -0,0 +1,81 @@
+"""
+Production entrypoint: python -m app.server
+
+Runs WEB_CONCURRENCY worker processes (default: one per core). uvloop and
+httptools are used when installed. On SIGTERM uvicorn stops accepting new
+connections, lets in-flight requests finish for up to
+GRACEFUL_SHUTDOWN_SECONDS, then runs the lifespan shutdown, which closes
+the sessionmanager engine.
+"""
+import importlib.util
+import logging
+import os
+
+import uvicorn
+
+from app.core.config import (
+    HOST,
+    PORT,
+    WEB_CONCURRENCY,
+    KEEP_ALIVE_SECONDS,
+    BACKLOG,
+    GRACEFUL_SHUTDOWN_SECONDS,
+    DB_MAX_CONNECTIONS,
+    DB_RESERVED_CONNECTIONS,
+    PASSWORD_HASH_ROUNDS,
+)
+from app.utils.hash import calibrate
+
+logger = logging.getLogger(__name__)
+
+
+def worker_pool_size(workers: int, max_connections: int, reserved: int) -> int:
+    """Connections each worker may hold so that all workers fit under max_connections"""
+    # Each worker also holds one LISTEN connection for the post feed
+    available = max_connections - reserved - workers
+    if available < workers:
+        raise ValueError(
+            f"DB_MAX_CONNECTIONS={max_connections} leaves {available} connections "
+            f"for {workers} workers, at least one per worker is needed"
+        )
+    return available // workers
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    workers = max(1, WEB_CONCURRENCY)
+
+    # Workers are spawned processes and read their pool settings from the
+    # environment when app.core.config is imported. No overflow, so the
+    # pool size is a hard upper bound per worker.
+    pool_size = worker_pool_size(workers, DB_MAX_CONNECTIONS, DB_RESERVED_CONNECTIONS)
+    os.environ["DB_POOL_SIZE"] = str(pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = "0"
+
+    # Calibrated once here so that every worker hashes with the same cost
+    rounds = PASSWORD_HASH_ROUNDS or calibrate()
+    os.environ["PASSWORD_HASH_ROUNDS"] = str(rounds)
+
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    logger.info(
+        "Starting %s workers (loop=%s, http=%s), %s DB connections per worker, bcrypt cost %s",
+        workers, loop, http, pool_size, rounds,
+    )
+
+    uvicorn.run(
+        "app.main:app",
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        loop=loop,
+        http=http,
+        timeout_keep_alive=KEEP_ALIVE_SECONDS,
+        backlog=BACKLOG,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compression trade-off benchmark for the response payloads.
+
+Builds BlogsList, PostsList and single-post payloads shaped like the API
+responses and compresses each with every available encoder and level,
+whole and in 4 KiB streamed chunks. Prints the compression ratio and the
+throughput, to pick COMPRESSION_* levels and COMPRESSION_MIN_SIZE.
+
+Usage: python -m app.utils.compressionbench [rounds]
+"""
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from app.core import compression
+from app.core.compression import BrotliEncoder, GzipEncoder, ZstdEncoder
+
+WORDS = (
+    "the of and to in is that for it as with was on be by this are or from at an not have "
+    "which but can all has one more their will about there when your also other new some "
+    "database query index postgres async session blog post title body user token request"
+).split()
+
+CHUNK = 4096
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def payloads(seed: int = 1) -> dict[str, bytes]:
+    rng = random.Random(seed)
+    now = datetime(2024, 4, 1)
+    blog_id, user_id = uuid4(), uuid4()
+
+    def blog(i):
+        return {
+            "id": str(uuid4()), "title": _text(rng, 6), "created_by": str(user_id),
+            "created_at": (now - timedelta(days=i)).isoformat(), "is_deleted": False,
+        }
+
+    def post(i, words):
+        return {
+            "id": str(uuid4()), "title": _text(rng, 8), "body": _text(rng, words), "blog_id": str(blog_id),
+            "created_at": (now - timedelta(hours=i)).isoformat(), "is_deleted": False,
+        }
+
+    data = {
+        "blog": blog(0),
+        "blogs_list_50": {"blogs": [blog(i) for i in range(50)]},
+        "post_detail": post(0, 1500),
+        "posts_list_50": {"posts": [post(i, 300) for i in range(50)]},
+        "posts_list_500": {"posts": [post(i, 300) for i in range(500)]},
+    }
+    return {name: json.dumps(value).encode() for name, value in data.items()}
+
+
+def encoders() -> list[tuple[str, int, type]]:
+    # Includes levels above the caps in app/core/compression.py, to show what they cost
+    levels = [("gzip", level, GzipEncoder) for level in (1, 3, 5, 6, 9)]
+    if compression.brotli is not None:
+        levels += [("br", quality, BrotliEncoder) for quality in (1, 4, 6, 11)]
+    if compression.zstandard is not None:
+        levels += [("zstd", level, ZstdEncoder) for level in (1, 3, 6, 9, 19)]
+    return levels
+
+
+def measure(encoder_class: type, level: int, body: bytes, streamed: bool, rounds: int) -> tuple[int, float]:
+    """Compressed size and seconds per compression"""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        encoder = encoder_class(level)
+        if streamed:
+            out = b"".join(encoder.compress(body[i:i + CHUNK]) for i in range(0, len(body), CHUNK))
+            out += encoder.finish()
+        else:
+            out = encoder.finish(body)
+    return len(out), (time.perf_counter() - started) / rounds
+
+
+def main(rounds: int):
+    print(f"{'payload':<16}{'bytes':>9}  {'codec':<8}{'level':>5}{'ratio':>8}{'MB/s':>9}{'ms':>9}{'streamed ratio':>16}")
+    for name, body in payloads().items():
+        for codec, level, encoder_class in encoders():
+            size, seconds = measure(encoder_class, level, body, streamed=False, rounds=rounds)
+            streamed_size, _ = measure(encoder_class, level, body, streamed=True, rounds=1)
+            print(
+                f"{name:<16}{len(body):>9}  {codec:<8}{level:>5}{len(body) / size:>8.2f}"
+                f"{len(body) / seconds / 1e6:>9.1f}{seconds * 1000:>9.2f}{len(body) / streamed_size:>16.2f}"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -1,8 +1,53 @@
+import time
 
 from passlib.context import CryptContext
 
+from app.core.config import PASSWORD_HASH_ROUNDS, PASSWORD_HASH_TARGET_MS
+
+# Bounds of calibration. The floor is passlib's bcrypt default, the cost of
+# hashes stored before calibration: a slow host never lowers it. Above 16 a
+# single login takes seconds.
+MIN_ROUNDS = 12
+MAX_ROUNDS = 16
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+
+def set_rounds(rounds: int):
+    """
+    Hash with `rounds` from now on. verify_and_update rehashes lower costs
+    only: hashes made with a higher one (another host, an earlier setting)
+    are kept, never weakened.
+    """
+    pwd_context.update(bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds)
+
+
+def hash_time_ms(rounds: int, samples: int = 3) -> float:
+    """Fastest of `samples` hashes at `rounds` on this host"""
+    handler = pwd_context.handler("bcrypt").using(rounds=rounds)
+    best = float("inf")
+    for _ in range(samples):
+        started = time.perf_counter()
+        handler.hash("calibration")
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def calibrate(target_ms: float = PASSWORD_HASH_TARGET_MS) -> int:
+    """Highest cost whose hash takes at most target_ms here, within MIN_ROUNDS..MAX_ROUNDS"""
+    rounds = MIN_ROUNDS
+    elapsed = hash_time_ms(rounds)
+    # Every extra round doubles the work
+    while rounds < MAX_ROUNDS and elapsed * 2 <= target_ms:
+        rounds += 1
+        elapsed *= 2
+    return rounds
+
+
+if PASSWORD_HASH_ROUNDS:
+    set_rounds(PASSWORD_HASH_ROUNDS)
+
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -10,3 +55,7 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+
+def verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verify, and return a new hash when the stored one uses another cost"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
@@ -0,0 +1,37 @@
+"""
+bcrypt cost benchmark.
+
+For every cost from MIN_ROUNDS up, measures hash and verify time on this
+host and the logins per second one core sustains (one verify per login),
+then prints the cost calibration would pick for PASSWORD_HASH_TARGET_MS.
+
+Usage: python -m app.utils.hashbench [max_rounds]
+"""
+import sys
+import time
+
+from app.core.config import PASSWORD_HASH_TARGET_MS
+from app.utils.hash import MIN_ROUNDS, calibrate, hash_time_ms, pwd_context
+
+
+def verify_time_ms(rounds: int, samples: int = 3) -> float:
+    handler = pwd_context.handler("bcrypt").using(rounds=rounds)
+    hashed = handler.hash("benchmark")
+    best = float("inf")
+    for _ in range(samples):
+        started = time.perf_counter()
+        handler.verify("benchmark", hashed)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main(max_rounds: int):
+    print(f"{'rounds':>6}{'hash ms':>10}{'verify ms':>11}{'logins/s/core':>15}")
+    for rounds in range(MIN_ROUNDS, max_rounds + 1):
+        verify_ms = verify_time_ms(rounds)
+        print(f"{rounds:>6}{hash_time_ms(rounds):>10.1f}{verify_ms:>11.1f}{1000 / verify_ms:>15.1f}")
+    print(f"\nCalibrated cost for a {PASSWORD_HASH_TARGET_MS:.0f}ms target: {calibrate()} rounds")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 14)
@@ -0,0 +1,173 @@
+"""
+Helpers for migrations that run against a live database.
+
+env.py runs every migration in its own transaction with lock_timeout set to
+MIGRATION_LOCK_TIMEOUT_MS, so DDL that cannot get its lock fails quickly
+instead of queueing every other query on the table behind it. Use these
+helpers from a migration's upgrade()/downgrade():
+
+    from app.utils.migrations import backfill, create_index_concurrently, with_lock_retry
+
+    def upgrade() -> None:
+        with_lock_retry(lambda: op.add_column('posts', sa.Column('excerpt', sa.String(), nullable=True)))
+        backfill('posts', set_="excerpt = left(body, 200)", where="excerpt IS NULL")
+        create_index_concurrently('ix_posts_excerpt', 'posts', ['excerpt'])
+
+create_index_concurrently and backfill commit the migration's transaction
+so far and run outside of it, so they should come after the DDL they
+depend on. Both are safe to re-run after an interruption.
+"""
+import logging
+import time
+from typing import Callable, Sequence
+
+from alembic import op
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.core.config import (
+    MIGRATION_LOCK_RETRIES,
+    MIGRATION_BACKFILL_BATCH_SIZE,
+    MIGRATION_BACKFILL_PAUSE_SECONDS,
+)
+
+logger = logging.getLogger("alembic.online")
+
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def _sqlstate(ex: DBAPIError) -> str | None:
+    return getattr(ex.orig, "sqlstate", None) or getattr(ex.orig.__cause__, "sqlstate", None)
+
+
+def with_lock_retry(operation: Callable[[], None], attempts: int = MIGRATION_LOCK_RETRIES):
+    """
+    Run `operation` in a savepoint, retrying with backoff when it hits
+    lock_timeout. Keep it to the DDL that needs the lock: locks taken
+    earlier in the same migration are held across retries.
+    """
+    bind = op.get_bind()
+    for attempt in range(1, attempts + 1):
+        try:
+            with bind.begin_nested():
+                operation()
+            return
+        except DBAPIError as ex:
+            if _sqlstate(ex) != LOCK_NOT_AVAILABLE or attempt == attempts:
+                raise
+            delay = min(0.5 * 2 ** (attempt - 1), 30)
+            logger.warning("Lock not available (attempt %s/%s), retrying in %.1fs", attempt, attempts, delay)
+            time.sleep(delay)
+
+
+def _drop_if_invalid(name: str):
+    # A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind
+    bind = op.get_bind()
+    valid = bind.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+    ).scalar()
+    if valid is False:
+        logger.info("Dropping invalid index %s", name)
+        bind.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def create_index_concurrently(
+    name: str,
+    table: str,
+    columns: Sequence[str],
+    where: str | None = None,
+    unique: bool = False,
+):
+    """
+    CREATE INDEX CONCURRENTLY, outside the migration's transaction.
+
+    Partitioned tables (posts) do not support CONCURRENTLY, so the index is
+    created on the parent only and then built concurrently and attached
+    partition by partition; the parent index becomes valid once every
+    partition has one.
+    """
+    unique_sql = "UNIQUE " if unique else ""
+    where_sql = f" WHERE {where}" if where else ""
+    columns_sql = ", ".join(columns)
+
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        partitions = bind.execute(text("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE i.inhparent = CAST(:table AS regclass) AND p.relkind = 'p'
+        """), {"table": table}).scalars().all()
+
+        if not partitions:
+            _drop_if_invalid(name)
+            started = time.perf_counter()
+            bind.execute(text(
+                f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns_sql}){where_sql}"
+            ))
+            logger.info("Built %s in %.1fs", name, time.perf_counter() - started)
+            return
+
+        bind.execute(text(f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON ONLY {table} ({columns_sql}){where_sql}"))
+        for partition in partitions:
+            child = f"{partition}_{name}"[:63]
+            _drop_if_invalid(child)
+            started = time.perf_counter()
+            bind.execute(text(
+                f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {child} ON {partition} ({columns_sql}){where_sql}"
+            ))
+            attached = bind.execute(text(
+                "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:child) AND inhparent = to_regclass(:name)"
+            ), {"child": child, "name": name}).first()
+            if attached is None:
+                bind.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {child}"))
+            logger.info("Built %s in %.1fs", child, time.perf_counter() - started)
+
+
+def drop_index_concurrently(name: str):
+    """DROP INDEX CONCURRENTLY, outside the migration's transaction (not for partitioned indexes)"""
+    with op.get_context().autocommit_block():
+        op.get_bind().execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def backfill(
+    table: str,
+    set_: str,
+    where: str,
+    key: str = "id",
+    batch_size: int = MIGRATION_BACKFILL_BATCH_SIZE,
+    pause: float = MIGRATION_BACKFILL_PAUSE_SECONDS,
+    params: dict | None = None,
+) -> int:
+    """
+    UPDATE `table` SET `set_` for the rows matching `where`, `batch_size` rows
+    per transaction with `pause` seconds in between, logging progress.
+
+    `where` must stop matching a row once it is updated (e.g. `col IS NULL`),
+    and `key` should be indexed. Returns the number of updated rows.
+    """
+    query = text(f"""
+        UPDATE {table} SET {set_}
+        WHERE {key} IN (SELECT {key} FROM {table} WHERE {where} LIMIT :batch_size FOR UPDATE)
+    """)
+    values = {**(params or {}), "batch_size": batch_size}
+
+    total, started = 0, time.perf_counter()
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        while True:
+            for attempt in range(1, MIGRATION_LOCK_RETRIES + 1):
+                try:
+                    updated = bind.execute(query, values).rowcount
+                    break
+                except DBAPIError as ex:
+                    if _sqlstate(ex) != LOCK_NOT_AVAILABLE or attempt == MIGRATION_LOCK_RETRIES:
+                        raise
+                    time.sleep(pause * 2 ** attempt)
+            total += updated
+            if updated:
+                elapsed = time.perf_counter() - started
+                logger.info("Backfilled %s %s rows (%.0f rows/s)", total, table, total / elapsed)
+            if updated < batch_size:
+                return total
+            time.sleep(pause)
@@ -0,0 +1,80 @@
+"""
+The batches are written on sessionmanager sessions; the fake writes here
+never use theirs, which does not connect until it runs a statement.
+"""
+import asyncio
+
+import pytest
+
+from app.core.groupcommit import GroupCommit
+
+pytestmark = pytest.mark.anyio
+
+
+class Write:
+    def __init__(self, error: Exception | None = None):
+        self.error = error
+        self.batches: list[list] = []
+
+    async def __call__(self, db, rows):
+        self.batches.append(rows)
+        if self.error is not None:
+            raise self.error
+
+
+async def test_rows_of_one_window_are_written_together():
+    write = Write()
+    queue = GroupCommit(write, window_ms=20, max_size=100)
+    await asyncio.gather(*(queue.submit(row) for row in range(3)))
+
+    assert write.batches == [[0, 1, 2]]
+    assert (queue.batches, queue.rows) == (1, 3)
+
+
+async def test_full_batch_is_written_before_the_window():
+    write = Write()
+    queue = GroupCommit(write, window_ms=60_000, max_size=2)
+    await asyncio.wait_for(asyncio.gather(queue.submit("a"), queue.submit("b")), timeout=5)
+
+    assert write.batches == [["a", "b"]]
+
+
+async def test_next_rows_start_a_new_batch():
+    write = Write()
+    queue = GroupCommit(write, window_ms=10, max_size=100)
+    await queue.submit("a")
+    await queue.submit("b")
+
+    assert write.batches == [["a"], ["b"]]
+
+
+async def test_every_caller_of_a_failed_batch_gets_the_error():
+    write = Write(error=RuntimeError("database down"))
+    queue = GroupCommit(write, window_ms=10, max_size=100)
+    results = await asyncio.gather(*(queue.submit(row) for row in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(write.batches) == 1
+    assert queue.batches == 0
+
+
+async def test_cancelled_caller_keeps_its_row_in_the_batch():
+    write = Write()
+    queue = GroupCommit(write, window_ms=20, max_size=100)
+    leaving = asyncio.create_task(queue.submit("leaving"))
+    await asyncio.sleep(0)
+    leaving.cancel()
+    await queue.submit("staying")
+
+    assert write.batches == [["leaving", "staying"]]
+
+
+async def test_close_writes_the_pending_batch():
+    write = Write()
+    queue = GroupCommit(write, window_ms=60_000, max_size=100)
+    pending = asyncio.create_task(queue.submit("row"))
+    await asyncio.sleep(0)
+    await queue.close()
+
+    await pending
+    assert write.batches == [["row"]]
@@ -0,0 +1,37 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_retry_replays_the_first_response(client, author):
+    headers = {"Idempotency-Key": "create-blog-1"}
+    params = {"token": author.token}
+    first = await client.post("/api/blog/create/", params=params, headers=headers, json={"title": "Idempotent"})
+    assert first.status_code == 200, first.text
+
+    retry = await client.post("/api/blog/create/", params=params, headers=headers, json={"title": "Idempotent"})
+    assert retry.status_code == 200, retry.text
+    assert retry.json()["id"] == first.json()["id"]
+
+
+async def test_key_reused_with_another_payload(client, author):
+    headers = {"Idempotency-Key": "create-blog-2"}
+    params = {"token": author.token}
+    first = await client.post("/api/blog/create/", params=params, headers=headers, json={"title": "First"})
+    assert first.status_code == 200, first.text
+
+    other = await client.post("/api/blog/create/", params=params, headers=headers, json={"title": "Second"})
+    assert other.status_code == 422, other.text
+
+
+async def test_failed_request_releases_the_key(client, author):
+    params = {"token": author.token}
+    blog = await client.post("/api/blog/create/", params=params, json={"title": "Taken"})
+    assert blog.status_code == 200, blog.text
+
+    headers = {"Idempotency-Key": "create-blog-3"}
+    taken = await client.post("/api/blog/create/", params=params, headers=headers, json={"title": "Taken"})
+    assert taken.status_code == 400, taken.text
+
+    retry = await client.post("/api/blog/create/", params=params, headers=headers, json={"title": "Taken"})
+    assert retry.status_code == 400, retry.text
@@ -0,0 +1,14 @@
+import pytest
+
+from app.core.database import sessionmanager
+from app.core.loader import load
+from app.models import Blog, Post
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("column", [Blog.id, Post.id])
+async def test_unparsable_id_is_a_miss(column):
+    # Answered without a query, the session does not connect
+    async with sessionmanager.session() as db:
+        assert await load(db, column, "not-a-uuid") is None
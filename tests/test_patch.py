@@ -0,0 +1,75 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def blog(client, author) -> dict:
+    response = await client.post("/api/blog/create/", params={"token": author.token}, json={"title": "Blog"})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def create_post(client, author, blog: dict, title: str) -> dict:
+    response = await client.post(
+        "/api/post/create/", params={"token": author.token}, json={"title": title, "body": "body", "blog_id": blog["id"]}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def patch(client, kind: str, token: str, target: dict, version, **changes):
+    headers = {} if version is None else {"If-Match": f'"{version}"'}
+    return await client.patch(f"/api/{kind}/{target['id']}", params={"token": token}, headers=headers, json=changes)
+
+
+async def test_blog_stale_version(client, author, blog):
+    renamed = await patch(client, "blog", author.token, blog, blog["version"], title="First")
+    assert renamed.status_code == 200, renamed.text
+
+    stale = await patch(client, "blog", author.token, blog, blog["version"], title="Second")
+    assert stale.status_code == 409, stale.text
+
+
+async def test_blog_of_another_user(client, other_author, blog):
+    response = await patch(client, "blog", other_author.token, blog, blog["version"], title="Mine")
+    assert response.status_code == 403, response.text
+
+
+async def test_blog_title_taken(client, author, blog):
+    other = await client.post("/api/blog/create/", params={"token": author.token}, json={"title": "Taken"})
+    assert other.status_code == 200, other.text
+
+    response = await patch(client, "blog", author.token, blog, blog["version"], title="Taken")
+    assert response.status_code == 400, response.text
+
+
+async def test_blog_without_if_match(client, author, blog):
+    response = await patch(client, "blog", author.token, blog, None, title="Renamed")
+    assert response.status_code == 428, response.text
+
+
+async def test_post_stale_version(client, author, blog):
+    post = await create_post(client, author, blog, "Post")
+    edited = await patch(client, "post", author.token, post, post["version"], body="edited")
+    assert edited.status_code == 200, edited.text
+
+    stale = await patch(client, "post", author.token, post, post["version"], body="again")
+    assert stale.status_code == 409, stale.text
+
+
+async def test_post_of_another_user(client, author, other_author, blog):
+    post = await create_post(client, author, blog, "Post")
+    response = await patch(client, "post", other_author.token, post, post["version"], body="mine")
+    assert response.status_code == 403, response.text
+
+
+async def test_post_title_taken(client, author, blog):
+    await create_post(client, author, blog, "Taken")
+    post = await create_post(client, author, blog, "Post")
+    response = await patch(client, "post", author.token, post, post["version"], title="Taken")
+    assert response.status_code == 400, response.text
+
+    # The failed UPDATE was rolled back, the next one goes through
+    renamed = await patch(client, "post", author.token, post, post["version"], title="Free")
+    assert renamed.status_code == 200, renamed.text
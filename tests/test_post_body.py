@@ -0,0 +1,77 @@
+"""
+Post.body is deferred with raiseload: a route that reads it without asking
+for it fails instead of loading it lazily. Every route that returns posts
+is called here once.
+"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+BODY = "The body of the post, long enough to be cut in the list. " * 10
+
+
+@pytest.fixture
+async def post(client, author) -> dict:
+    params = {"token": author.token}
+    blog = await client.post("/api/blog/create/", params=params, json={"title": "Blog"})
+    assert blog.status_code == 200, blog.text
+    post = await client.post(
+        "/api/post/create/", params=params, json={"title": "Post", "body": BODY, "blog_id": blog.json()["id"]}
+    )
+    assert post.status_code == 200, post.text
+    assert post.json()["body"] == BODY
+    return post.json()
+
+
+async def test_post_list(client, author, post):
+    response = await client.get("/api/post/", params={"token": author.token})
+    assert response.status_code == 200, response.text
+    [summary] = response.json()
+    assert BODY.startswith(summary["excerpt"])
+    assert summary["body_length"] == len(BODY)
+
+
+async def test_post_details(client, author, post):
+    response = await client.post(f"/api/post/{post['id']}", params={"token": author.token})
+    assert response.status_code == 200, response.text
+    assert response.json()["body"] == BODY
+
+
+async def test_patch_post(client, author, post):
+    response = await client.patch(
+        f"/api/post/{post['id']}", params={"token": author.token},
+        headers={"If-Match": f'"{post["version"]}"'}, json={"title": "Renamed"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["title"] == "Renamed"
+    assert response.json()["body"] == BODY
+    assert response.headers["ETag"] == f'"{response.json()["version"]}"'
+
+
+async def test_patch_blog(client, author, post):
+    params = {"token": author.token}
+    blog = await client.post(f"/api/blog/{post['blog_id']}", params=params)
+    assert blog.status_code == 200, blog.text
+    response = await client.patch(
+        f"/api/blog/{post['blog_id']}", params=params,
+        headers={"If-Match": f'"{blog.json()["blog"]["version"]}"'}, json={"title": "Renamed"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["title"] == "Renamed"
+
+
+async def test_restore_post(client, author, post):
+    params = {"token": author.token}
+    deleted = await client.delete(f"/api/post/delete/{post['id']}", params=params)
+    assert deleted.status_code == 200, deleted.text
+
+    response = await client.post(f"/api/post/restore/{post['id']}", params=params)
+    assert response.status_code == 200, response.text
+    assert response.json()["body"] == BODY
+    assert response.json()["is_deleted"] is False
+
+
+async def test_sync(client, author, post):
+    response = await client.get("/api/sync/", params={"token": author.token})
+    assert response.status_code == 200, response.text
+    assert [synced["body"] for synced in response.json()["posts"]] == [BODY]
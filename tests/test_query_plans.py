@@ -0,0 +1,160 @@
+"""
+Query plans of the model read paths.
+
+Seeds a dataset inside a transaction that is always rolled back, runs every
+model query through the real model methods, and runs EXPLAIN on each
+statement they issue. A plan with a Seq Scan fails the query's test.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import sessionmanager
+from app.core.sync import sync_horizon
+from app.models import User, BlackListToken, Blog, Post
+
+pytestmark = pytest.mark.anyio
+
+USERS = 2000
+BLOGS_PER_USER = 5
+POSTS_PER_BLOG = 10
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def seq_scans(plan: dict) -> list[str]:
+    return [
+        node.get("Relation Name", "?")
+        for node in plan_nodes(plan)
+        if node["Node Type"] == "Seq Scan"
+    ]
+
+
+def seed_rows(users: int):
+    user_rows, blog_rows, post_rows, token_rows = [], [], [], []
+    expire = datetime.utcnow() + timedelta(days=1)
+    for u in range(users):
+        user_id = uuid4()
+        user_rows.append({
+            "id": user_id, "username": f"plancheck_{u}", "email": f"plancheck_{u}@example.com",
+            "password": "x", "is_disabled": False, "is_superuser": False,
+        })
+        token_rows.append({"id": uuid4(), "expire": expire})
+        for b in range(BLOGS_PER_USER):
+            blog_id = uuid4()
+            blog_rows.append({
+                "id": blog_id, "title": f"plancheck_{u}_{b}", "created_by": user_id,
+                "is_deleted": b == 0,
+            })
+            for p in range(POSTS_PER_BLOG):
+                post_rows.append({
+                    "id": uuid4(), "title": f"post_{p}", "body": "body", "blog_id": blog_id,
+                    "is_deleted": p == 0,
+                })
+    return user_rows, blog_rows, post_rows, token_rows
+
+
+def model_queries(probe: dict | None) -> dict:
+    """Each model read, on the rows of `probe` (user, blog, post, token, horizon)"""
+    return {
+        "User.find_by_id": lambda db: User.find_by_id(db, id=probe["user"]["id"]),
+        "User.find_by_username": lambda db: User.find_by_username(db, username=probe["user"]["username"]),
+        "User.find_by_email": lambda db: User.find_by_email(db, email=probe["user"]["email"]),
+        "BlackListToken.is_revoked": lambda db: BlackListToken.is_revoked(
+            db, id=probe["token"]["id"], expire=probe["token"]["expire"]
+        ),
+        "Blog.find_by_id": lambda db: Blog.find_by_id(db, id=probe["blog"]["id"]),
+        "Blog.find_all_by_username": lambda db: Blog.find_all_by_username(db, username=probe["user"]["username"]),
+        "Blog.find_all_by_email": lambda db: Blog.find_all_by_email(db, email=probe["user"]["email"]),
+        "Blog.check_availability": lambda db: Blog.check_availability(db, created_by=probe["user"]["id"], title="new"),
+        "Blog.find_changes": lambda db: Blog.find_changes(
+            db, created_by=probe["user"]["id"], after=None, horizon=probe["horizon"], limit=100
+        ),
+        "Post.find_by_id": lambda db: Post.find_by_id(db, id=probe["post"]["id"]),
+        "Post.find_with_body": lambda db: Post.find_with_body(db, id=probe["post"]["id"]),
+        "Post.find_all_by_username": lambda db: Post.find_all_by_username(db, username=probe["user"]["username"]),
+        "Post.find_all_titles_by_blog": lambda db: Post.find_all_titles_by_blog(db, blog_id=probe["blog"]["id"]),
+        "Post.check_availability": lambda db: Post.check_availability(db, blog_id=probe["blog"]["id"], title="new"),
+        "Post.find_changes": lambda db: Post.find_changes(
+            db, created_by=probe["user"]["id"], after=None, horizon=probe["horizon"], limit=100
+        ),
+    }
+
+
+QUERIES = list(model_queries(None))
+
+
+@pytest.fixture(scope="module")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="module")
+async def plans() -> dict[str, list[tuple[str, dict]]]:
+    """EXPLAIN output of every statement of each model query, by query"""
+    if os.environ.get("TEST_DATABASE_URL") is None:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    user_rows, blog_rows, post_rows, token_rows = seed_rows(USERS)
+    user, blog = user_rows[USERS // 2], blog_rows[len(blog_rows) // 2]
+    post = next(row for row in post_rows if row["blog_id"] == blog["id"])
+    probe = {"user": user, "blog": blog, "post": post, "token": token_rows[0]}
+
+    captured: list[tuple[str, tuple]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    engine = sessionmanager._engine
+    plans = {}
+    try:
+        async with engine.connect() as connection:
+            transaction = await connection.begin()
+            try:
+                await connection.exec_driver_sql("SET LOCAL statement_timeout = 0")
+                await connection.execute(insert(User.__table__), user_rows)
+                await connection.execute(insert(Blog.__table__), blog_rows)
+                await connection.execute(insert(Post.__table__), post_rows)
+                await connection.execute(insert(BlackListToken.__table__), token_rows)
+                for table in ("users", "blogs", "posts", "blacklisttokens"):
+                    await connection.exec_driver_sql(f"ANALYZE {table}")
+
+                probe["horizon"] = await sync_horizon(AsyncSession(bind=connection))
+                for name, query in model_queries(probe).items():
+                    # A session per query: none is answered from another's identity map or loader
+                    db = AsyncSession(bind=connection)
+                    captured.clear()
+                    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+                    try:
+                        await query(db)
+                    finally:
+                        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+                        await db.close()
+
+                    plans[name] = []
+                    for statement, parameters in captured:
+                        result = await connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters)
+                        raw = result.scalar()
+                        plans[name].append((statement, (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]))
+            finally:
+                await transaction.rollback()
+    finally:
+        await engine.dispose()
+    return plans
+
+
+@pytest.mark.parametrize("query", QUERIES)
+async def test_no_sequential_scan(plans, query):
+    for statement, plan in plans[query]:
+        scans = seq_scans(plan)
+        assert not scans, f"{query}: Seq Scan on {', '.join(scans)} in {' '.join(statement.split())}"
@@ -0,0 +1,116 @@
+"""
+Routing between the primary (shard 0) and a second database (shard 1).
+Needs TEST_SHARD_DATABASE_URL as well as TEST_DATABASE_URL.
+"""
+import pytest
+from sqlalchemy import delete, select, update
+
+from app.core.database import PRIMARY_SHARD, MOVING
+from app.jobs.reconcile import repair_anchors
+from app.jobs.reshard import move_user
+from app.models import User, Blog
+
+pytestmark = pytest.mark.anyio
+
+# The shard of sharded_author
+SHARD = 1
+
+
+async def _anchor(sharded, user_id, shard: int = SHARD) -> User | None:
+    async with sharded.session(shard=shard) as db:
+        result = await db.execute(select(User).where(User.id == user_id), bind_arguments={"shard_id": shard})
+        return result.scalars().first()
+
+
+async def _blog_ids(sharded, user_id, shard: int) -> list:
+    async with sharded.session(shard=shard) as db:
+        result = await db.execute(select(Blog.id).where(Blog.created_by == user_id))
+        return result.scalars().all()
+
+
+async def _create_blog(client, author, title: str = "Blog") -> dict:
+    response = await client.post("/api/blog/create/", params={"token": author.token}, json={"title": title})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def test_register_creates_the_anchor(sharded, sharded_author):
+    assert sharded_author.user.shard == SHARD
+    anchor = await _anchor(sharded, sharded_author.user.id)
+    assert anchor is not None
+    assert anchor.username == sharded_author.user.username
+    assert anchor.is_disabled and anchor.password == "!"
+
+
+async def test_token_routes_writes_to_the_users_shard(sharded, client, sharded_author):
+    blog = await _create_blog(client, sharded_author)
+
+    assert [str(id) for id in await _blog_ids(sharded, sharded_author.user.id, SHARD)] == [blog["id"]]
+    assert await _blog_ids(sharded, sharded_author.user.id, PRIMARY_SHARD) == []
+    stats = await client.get("/api/stats/me", params={"token": sharded_author.token})
+    assert stats.status_code == 200, stats.text
+    assert stats.json()["blog_count"] == 1
+
+
+async def test_unrouted_writes_are_refused(sharded, sharded_author):
+    async with sharded.session() as db:
+        db.add(Blog(title="Unrouted", created_by=sharded_author.user.id))
+        with pytest.raises(RuntimeError):
+            await db.flush()
+        await db.rollback()
+        with pytest.raises(RuntimeError):
+            await db.execute(update(Blog).where(Blog.created_by == sharded_author.user.id).values(title="Unrouted"))
+
+
+async def test_reads_fall_back_to_other_shards(sharded, client, sharded_author, primary_author):
+    blog = await _create_blog(client, sharded_author)
+    post = await client.post(
+        "/api/post/create/", params={"token": sharded_author.token},
+        json={"title": "Post", "body": "Body", "blog_id": blog["id"]},
+    )
+    assert post.status_code == 200, post.text
+
+    # A user of the primary reads a post of shard 1: find_first
+    details = await client.post(f"/api/post/{post.json()['id']}", params={"token": primary_author.token})
+    assert details.status_code == 200, details.text
+    assert details.json()["body"] == "Body"
+
+    # The loader, from a session routed to the primary
+    async with sharded.session(shard=PRIMARY_SHARD) as db:
+        found = await Blog.find_by_id(db, id=blog["id"])
+        assert found is not None and found.title == "Blog"
+
+
+async def test_repair_anchors_recreates_a_missing_anchor(sharded, sharded_author):
+    # As if the primary had committed the user and the anchor's commit had failed
+    async with sharded.session(shard=SHARD) as db:
+        await db.execute(delete(User).where(User.id == sharded_author.user.id), bind_arguments={"shard_id": SHARD})
+        await db.commit()
+    assert await _anchor(sharded, sharded_author.user.id) is None
+
+    assert await repair_anchors(SHARD) >= 1
+    assert await _anchor(sharded, sharded_author.user.id) is not None
+
+
+async def test_interrupted_move_finishes_when_run_again(sharded, client, sharded_author):
+    user_id = sharded_author.user.id
+    blog = await _create_blog(client, sharded_author)
+
+    # Interrupted after the user was marked as moving and part of the copy
+    # reached the primary, before users.shard pointed at it
+    async with sharded.session() as db:
+        await db.execute(update(User).where(User.id == user_id).values(shard=MOVING))
+        await db.commit()
+    async with sharded.session(shard=PRIMARY_SHARD) as db:
+        db.add(Blog(id=blog["id"], title=blog["title"], created_by=user_id))
+        await db.commit()
+
+    await move_user(user_id, PRIMARY_SHARD, grace=0)
+
+    async with sharded.session() as db:
+        user = (await db.execute(select(User).where(User.id == user_id))).scalars().one()
+    assert user.shard == PRIMARY_SHARD
+    assert user.blog_count == 1
+    assert [str(id) for id in await _blog_ids(sharded, user_id, PRIMARY_SHARD)] == [blog["id"]]
+    assert await _blog_ids(sharded, user_id, SHARD) == []
+    assert await _anchor(sharded, user_id) is None
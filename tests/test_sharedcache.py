@@ -0,0 +1,170 @@
+import asyncio
+import multiprocessing
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import delete
+
+from app.core import sharedcache
+from app.core.feed import PostFeed, post_feed, notify_users_changed
+from app.core.sharedcache import SharedTable, SharedCache, SLOT
+from app.models import BlackListToken
+
+
+@pytest.fixture
+def table() -> SharedTable:
+    # A file of its own for each test
+    return SharedTable(f"test-{uuid4().hex}", slots=64, slot_size=128)
+
+
+def test_put_and_get(table):
+    assert table.get("key") is None
+    assert table.put("key", b"value", ttl=60)
+    assert table.get("key") == b"value"
+
+
+def test_entries_expire(table):
+    table.put("key", b"value", ttl=-1)
+    assert table.get("key") is None
+
+
+def test_colliding_key_evicts_the_slot():
+    table = SharedTable(f"test-{uuid4().hex}", slots=1, slot_size=128)
+    table.put("first", b"1", ttl=60)
+    table.put("second", b"2", ttl=60)
+    assert table.get("first") is None
+    assert table.get("second") == b"2"
+
+
+def test_read_through_is_dropped_after_an_invalidation(table):
+    version = table.version("key")
+    # A write lands between the reader's version() and its put()
+    table.invalidate("key")
+    assert not table.put("key", b"stale", ttl=60, version=version)
+    assert table.get("key") is None
+
+    assert table.put("key", b"fresh", ttl=60, version=table.version("key"))
+    assert table.get("key") == b"fresh"
+
+
+def test_write_drops_read_throughs_in_progress(table):
+    version = table.version("key")
+    table.put("key", b"written", ttl=60)
+    assert not table.put("key", b"stale", ttl=60, version=version)
+    assert table.get("key") == b"written"
+
+
+def test_value_too_big_drops_the_old_one(table):
+    table.put("key", b"old", ttl=60)
+    assert not table.put("key", b"x" * (128 - SLOT.size + 1), ttl=60)
+    assert table.get("key") is None
+
+
+def test_clear_drops_every_entry(table):
+    table.put("first", b"1", ttl=60)
+    table.put("second", b"2", ttl=60)
+    table.clear()
+    assert table.get("first") is None
+    assert table.get("second") is None
+    table.put("first", b"1", ttl=60)
+    assert table.get("first") == b"1"
+
+
+def test_reader_retries_while_a_write_is_in_progress(table):
+    table.put("key", b"value", ttl=60)
+    digest, index = table._locate("key")
+    offset = table._slots_at + index * table.slot_size
+    sequence = SLOT.unpack_from(table._map, offset)[0]
+    # An odd sequence: a writer is in the middle of the slot
+    table._map[offset:offset + 8] = (sequence + 1).to_bytes(8, "little")
+    assert table.get("key") is None
+    table._map[offset:offset + 8] = (sequence + 2).to_bytes(8, "little")
+    assert table.get("key") == b"value"
+
+
+def test_cache_pickles_values():
+    cache = SharedCache(f"test-{uuid4().hex}")
+    cache.put("user", {"id": 1, "name": "a"}, ttl=60)
+    assert cache.get("user") == {"id": 1, "name": "a"}
+    cache.invalidate("user")
+    assert cache.get("user") is None
+
+
+def test_disabled_cache_misses_and_stores_nothing():
+    cache = SharedCache(f"test-{uuid4().hex}")
+    cache.put("user", 1, ttl=60)
+    cache.enabled = False
+    assert cache.get("user") is None
+    assert not cache.put("other", 2, ttl=60)
+    cache.enabled = True
+    assert cache.get("user") == 1
+    assert cache.get("other") is None
+
+
+async def _wait_for(condition):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError("timed out")
+
+
+@pytest.mark.anyio
+async def test_user_writes_reach_other_hosts(database, author):
+    feed = PostFeed(post_feed._dsn)
+    feed.start()
+    try:
+        await _wait_for(lambda: sharedcache.users.enabled)
+        username = author.user.username
+        sharedcache.users.put(username, {"id": author.user.id}, ttl=60)
+
+        # As a write on another host: NOTIFY only, no local invalidation
+        async with database.session() as db:
+            await notify_users_changed(db, username)
+            await db.commit()
+        await _wait_for(lambda: sharedcache.users.get(username) is None)
+    finally:
+        await feed.close()
+    assert not sharedcache.users.enabled
+
+
+@pytest.mark.anyio
+async def test_logout_elsewhere_counts_at_once(database):
+    id, expire = uuid4(), datetime.utcnow() + timedelta(minutes=5)
+    async with database.session() as db:
+        assert not await BlackListToken.is_revoked(db, id=id, expire=expire)
+    # Blacklisted by another host, which this host's cache never heard of
+    async with database.session() as db:
+        await BlackListToken.create(db, id=id, expire=expire)
+    async with database.session() as db:
+        assert await BlackListToken.is_revoked(db, id=id, expire=expire)
+        await db.execute(delete(BlackListToken).where(BlackListToken.id == id))
+        await db.commit()
+    assert sharedcache.revoked_tokens.get(str(id)) is True
+
+
+def _write_values(name: str, worker: int, writes: int):
+    table = SharedTable(name, slots=1, slot_size=128)
+    for _ in range(writes):
+        table.put("key", bytes([worker]) * 64, ttl=60)
+
+
+def test_readers_never_see_a_torn_value():
+    """Workers overwrite one slot with their own byte; a read is all one byte or a miss"""
+    name = f"test-{uuid4().hex}"
+    table = SharedTable(name, slots=1, slot_size=128)
+    writers = [
+        multiprocessing.get_context("fork").Process(target=_write_values, args=(name, worker, 2000))
+        for worker in (1, 2)
+    ]
+    for writer in writers:
+        writer.start()
+    deadline = time.monotonic() + 30
+    while any(writer.is_alive() for writer in writers) and time.monotonic() < deadline:
+        value = table.get("key")
+        assert value is None or value in (b"\x01" * 64, b"\x02" * 64)
+    for writer in writers:
+        writer.join()
+        assert writer.exitcode == 0
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from app.core.database import sessionmanager
+from app.core.singleflight import SingleFlight, shared_read
+
+pytestmark = pytest.mark.anyio
+
+
+class Read:
+    """A read that blocks until released, counting how often it ran"""
+
+    def __init__(self, result=None, error: Exception | None = None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+async def test_concurrent_calls_share_one_read():
+    flights, read = SingleFlight(), Read(result="row")
+    callers = [asyncio.create_task(flights.do("key", read)) for _ in range(5)]
+    await asyncio.sleep(0)
+    read.release.set()
+
+    assert await asyncio.gather(*callers) == ["row"] * 5
+    assert read.calls == 1
+    assert flights.snapshot() == {"executed": 1, "shared": 4, "failed": 0, "abandoned": 0, "in_flight": 0}
+
+
+async def test_other_keys_are_not_shared():
+    flights, first, second = SingleFlight(), Read(result=1), Read(result=2)
+    callers = [asyncio.create_task(flights.do("first", first)), asyncio.create_task(flights.do("second", second))]
+    await asyncio.sleep(0)
+    first.release.set()
+    second.release.set()
+
+    assert await asyncio.gather(*callers) == [1, 2]
+    assert flights.stats.executed == 2
+
+
+async def test_nothing_is_cached():
+    flights, read = SingleFlight(), Read(result="row")
+    read.release.set()
+    assert await flights.do("key", read) == "row"
+    assert await flights.do("key", read) == "row"
+    assert read.calls == 2
+
+
+async def test_every_caller_gets_the_error():
+    flights, read = SingleFlight(), Read(error=LookupError("gone"))
+    callers = [asyncio.create_task(flights.do("key", read)) for _ in range(3)]
+    await asyncio.sleep(0)
+    read.release.set()
+
+    results = await asyncio.gather(*callers, return_exceptions=True)
+    assert all(isinstance(result, LookupError) for result in results)
+    assert read.calls == 1
+    assert flights.stats.failed == 1
+
+
+async def test_cancelled_caller_does_not_cancel_the_read_for_others():
+    flights, read = SingleFlight(), Read(result="row")
+    leaving = asyncio.create_task(flights.do("key", read))
+    staying = asyncio.create_task(flights.do("key", read))
+    await asyncio.sleep(0)
+    leaving.cancel()
+    await asyncio.sleep(0)
+    read.release.set()
+
+    assert await staying == "row"
+    assert leaving.cancelled()
+    assert not read.cancelled
+    assert flights.stats.abandoned == 0
+
+
+async def test_read_is_cancelled_when_every_caller_left():
+    flights, read = SingleFlight(), Read(result="row")
+    callers = [asyncio.create_task(flights.do("key", read)) for _ in range(2)]
+    await asyncio.sleep(0)
+    for caller in callers:
+        caller.cancel()
+    await asyncio.gather(*callers, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert read.cancelled
+    assert flights.snapshot()["abandoned"] == 1
+    assert flights.snapshot()["in_flight"] == 0
+
+
+async def test_shared_read_is_per_shard():
+    """The reads here never run a statement, the sessions do not connect"""
+    reads = []
+
+    async def read(flight_db):
+        reads.append(flight_db.info["shard"])
+        await asyncio.sleep(0.01)
+        return flight_db.info["shard"]
+
+    async def request(shard: int):
+        async with sessionmanager.session(shard=shard) as db:
+            result = await shared_read(db, ("post_details", "id"), read)
+            assert not db.in_transaction()
+            return result
+
+    assert await asyncio.gather(request(0), request(0), request(1)) == [0, 0, 1]
+    assert sorted(reads) == [0, 1]
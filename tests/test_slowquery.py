@@ -0,0 +1,25 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.core.slowquery import slow_queries
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_statement_timeout_is_recorded(database):
+    async with database.session(statement_timeout_ms=50) as db:
+        with pytest.raises(DBAPIError):
+            await db.execute(text("SELECT pg_sleep(1)"))
+
+    entry = next(entry for entry in slow_queries.snapshot() if "pg_sleep" in entry.statement)
+    assert entry.error == "statement_timeout"
+    assert 40 <= entry.duration_ms < 1000
+
+
+async def test_failed_statement_is_not_recorded(database):
+    async with database.session() as db:
+        with pytest.raises(DBAPIError):
+            await db.execute(text("SELECT 1 / 0 AS not_recorded"))
+
+    assert not [entry for entry in slow_queries.snapshot() if "not_recorded" in entry.statement]